@@ -2,22 +2,190 @@ import logging
 
 from django.conf import settings
 from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
 from django.core.urlresolvers import reverse
+from django.db import connection, models
+from django.db.models import Case, Count, Max, Min, Q, When
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
 
 from sjfnw import utils
 from sjfnw.fund.models import Member
 from sjfnw.grants.models import Organization
+from sjfnw.models import CronChunk, CronRun
 
 logger = logging.getLogger('sjfnw')
 
 # Shared admin classes
 # ---------------------
 
+# filtered lists, and tables without usable statistics, are counted up to this
+COUNT_LIMIT = 1000
+
+# keyset pagination query params - pk of the row to page from
+AFTER_VAR = 'after'
+BEFORE_VAR = 'before'
+
+
+def estimate_count(model):
+  """ Approximate number of rows in model's table, from database statistics.
+    Returns None if the database doesn't provide them """
+  if connection.vendor == 'mysql':
+    sql = ('SELECT table_rows FROM information_schema.tables '
+           'WHERE table_schema = DATABASE() AND table_name = %s')
+  elif connection.vendor == 'postgresql':
+    sql = 'SELECT reltuples FROM pg_class WHERE relname = %s'
+  else:
+    return None
+  cursor = connection.cursor()
+  cursor.execute(sql, [model._meta.db_table])
+  row = cursor.fetchone()
+  if row and row[0] is not None and row[0] >= 0:
+    return int(row[0])
+  return None
+
+
+def limited_count(queryset, filtered):
+  """ Returns (count, estimated). Unfiltered lists of large tables use table
+    statistics; otherwise counts up to COUNT_LIMIT rows """
+  if not filtered:
+    estimate = estimate_count(queryset.model)
+    if estimate is not None and estimate > COUNT_LIMIT:
+      return estimate, True
+  count = queryset[:COUNT_LIMIT + 1].count()
+  if count > COUNT_LIMIT:
+    return COUNT_LIMIT, True
+  return count, False
+
+
+class KeysetChangeList(ChangeList):
+  """ Changelist that pages by seeking past the previous page's last row
+    instead of using OFFSET, and estimates counts instead of counting every row
+
+    Pages are linked by pk (AFTER_VAR / BEFORE_VAR); the row's ordering values
+    are looked up to filter the next page. Only works when ordering by
+    non-null fields on the model itself - otherwise falls back to the default
+    pagination.
+  """
+  keyset = False
+  has_previous = False
+  has_next = False
+  count_estimated = False
+
+  def get_filters_params(self, params=None):
+    lookup_params = super(KeysetChangeList, self).get_filters_params(params)
+    lookup_params.pop(AFTER_VAR, None)
+    lookup_params.pop(BEFORE_VAR, None)
+    return lookup_params
+
+  def get_query_string(self, new_params=None, remove=None):
+    # links to other sorts and filters start from the first page
+    new_params = dict(new_params or {})
+    new_params.setdefault(AFTER_VAR, None)
+    new_params.setdefault(BEFORE_VAR, None)
+    return super(KeysetChangeList, self).get_query_string(new_params, remove)
+
+  def get_keys(self):
+    """ Ordering as a list of (field name, descending), ending with a unique
+      field. None if the ordering can't be used for keyset pagination """
+    keys = []
+    for order in self.queryset.query.order_by:
+      if not isinstance(order, basestring):
+        return None
+      name = order.lstrip('-')
+      if name == 'pk':
+        name = self.lookup_opts.pk.name
+      try:
+        field = self.lookup_opts.get_field(name)
+      except FieldDoesNotExist:
+        return None
+      if not field.concrete or field.is_relation or field.null:
+        return None
+      keys.append((name, order.startswith('-')))
+      if field.unique:
+        return keys
+    return None
+
+  def seek(self, queryset, keys, pk, reverse=False, inclusive=False):
+    """ Rows of queryset after the row with the given pk (before, if reverse) """
+    values = (self.model._default_manager.filter(pk=pk)
+                                         .values(*[name for name, _ in keys]).first())
+    if values is None:
+      raise IncorrectLookupParameters('Row {} not found'.format(pk))
+    condition, equal = Q(), {}
+    for name, descending in keys:
+      lookup = '{}__{}'.format(name, 'gt' if descending == reverse else 'lt')
+      condition |= Q(**dict(equal, **{lookup: values[name]}))
+      equal[name] = values[name]
+    if inclusive:
+      condition |= Q(**equal)
+    queryset = queryset.filter(condition)
+    return queryset.reverse() if reverse else queryset
+
+  def get_results(self, request):
+    keys = self.get_keys()
+    if keys is None:
+      super(KeysetChangeList, self).get_results(request)
+      return
+
+    try:
+      after = int(self.params.get(AFTER_VAR) or 0)
+      before = int(self.params.get(BEFORE_VAR) or 0)
+    except ValueError:
+      raise IncorrectLookupParameters('Invalid page')
+
+    per_page = self.list_per_page
+    page = self.queryset
+    if before:
+      # find where the previous page starts, then read forward from there
+      previous = list(self.seek(page, keys, before, reverse=True)
+                      .values_list('pk', flat=True)[:per_page + 1])
+      self.has_previous = len(previous) > per_page
+      self.has_next = True
+      if previous:
+        page = self.seek(page, keys, previous[:per_page][-1], inclusive=True)
+    elif after:
+      page = self.seek(page, keys, after)
+      self.has_previous = True
+
+    self.result_list = page[:per_page]
+    rows = list(self.result_list)
+    if not before:
+      self.has_next = len(rows) == per_page and page[per_page:per_page + 1].exists()
+
+    filtered = bool(self.get_filters_params() or self.query)
+    self.result_count, self.count_estimated = limited_count(self.queryset, filtered)
+    self.keyset = True
+    self.full_result_count = None
+    self.show_full_result_count = False
+    self.show_admin_actions = True
+    self.show_all = self.can_show_all = False
+    self.multi_page = self.has_previous or self.has_next
+    self.paginator = None
+    if rows:
+      self.previous_url = self.get_query_string({BEFORE_VAR: rows[0].pk})
+      self.next_url = self.get_query_string({AFTER_VAR: rows[-1].pk})
+    self.first_url = self.get_query_string()
+
+
 class BaseModelAdmin(admin.ModelAdmin):
-  """ Provide baseline per-page limit to reduce page load times """
+  """ Provide baseline per-page limit to reduce page load times
+
+    Set keyset_pagination on admins for large tables to avoid full counts
+    and OFFSET queries. See KeysetChangeList
+  """
   list_per_page = 30
+  keyset_pagination = False
+
+  def get_changelist(self, request, **kwargs):
+    if self.keyset_pagination:
+      return KeysetChangeList
+    return super(BaseModelAdmin, self).get_changelist(request, **kwargs)
 
 
 class BaseShowInline(admin.TabularInline):
@@ -27,12 +195,41 @@ class BaseShowInline(admin.TabularInline):
   can_delete = False
 
 
+YEARS_KEY = 'admin-years-{}-{}'
+# upper bound on staleness for changes that don't send signals, like bulk updates
+YEARS_TIMEOUT = 60 * 60 * 24
+
+
+def clear_cached_years(sender, **kwargs):
+  """ Clear cached years for each date field on the model """
+  cache.delete_many([YEARS_KEY.format(sender._meta.db_table, field.name)
+                     for field in sender._meta.concrete_fields
+                     if isinstance(field, models.DateField)])
+
+
+class YearFilterType(type):
+  """ Connects signals to clear a year filter's cached years when it is defined """
+
+  def __init__(cls, name, bases, attrs):
+    super(YearFilterType, cls).__init__(name, bases, attrs)
+    # filters that override lookups don't use the cache
+    if cls.filter_model and cls.lookups.__func__ is YearFilter.lookups.__func__:
+      uid = 'year-filter-{}'.format(cls.filter_model._meta.db_table)
+      post_save.connect(clear_cached_years, sender=cls.filter_model, dispatch_uid=uid)
+      post_delete.connect(clear_cached_years, sender=cls.filter_model, dispatch_uid=uid)
+
+
 class YearFilter(admin.SimpleListFilter):
   """ Filter results by the year on the given date field.
 
     Date field does not have to be on the model being filtered
     To use, create a child class and override the class variables below.
+
+    Years are looked up in the database and cached until a filter_model
+    row is saved or deleted.
   """
+  __metaclass__ = YearFilterType
+
   filter_model = None   # model being filtered
   field = ''            # name of date field used to filter
   intermediate = ''     # string path to the model that 'field' is on - if not filter_model
@@ -40,17 +237,36 @@ class YearFilter(admin.SimpleListFilter):
   title = 'year'
   parameter_name = 'year'
 
+  def get_years(self):
+    """ Distinct years of field, newest first
+
+      For datetimes, counts rows in each year between the first and last
+      rather than using datetimes(), which needs time zone tables on mysql.
+      Year bounds are computed in python, as they are for __year filters.
+    """
+    objects = self.filter_model.objects
+    if not isinstance(self.filter_model._meta.get_field(self.field), models.DateTimeField):
+      return [date.year for date in objects.dates(self.field, 'year', order='DESC')]
+
+    bounds = objects.aggregate(first=Min(self.field), last=Max(self.field))
+    if bounds['first'] is None:
+      return []
+    years = range(timezone.localtime(bounds['last']).year,
+                  timezone.localtime(bounds['first']).year - 1, -1)
+    counts = objects.aggregate(**{
+      'y{}'.format(year): Count(Case(When(then=1, **{self.field + '__year': year})))
+      for year in years
+    })
+    return [year for year in years if counts['y{}'.format(year)]]
+
   def lookups(self, request, model_admin):
     """ Returns an array of year values found in existing data """
-    dates = (self.filter_model.objects.values_list(self.field, flat=True)
-                                       .order_by('-%s' % self.field))
-    prev = None
-    years = []
-    for date in dates:
-      if date.year != prev:
-        years.append((date.year, date.year))
-        prev = date.year
-    return years
+    key = YEARS_KEY.format(self.filter_model._meta.db_table, self.field)
+    years = cache.get(key)
+    if years is None:
+      years = self.get_years()
+      cache.set(key, years, YEARS_TIMEOUT)
+    return [(year, year) for year in years]
 
   def queryset(self, request, queryset):
     val = self.value()
@@ -129,3 +345,22 @@ class UserA(UserAdmin):
   change_password.short_description = 'Password'
 
 admin.site.register(User, UserA)
+
+
+class CronChunkI(BaseShowInline):
+  model = CronChunk
+  fields = ('first_pk', 'last_pk', 'cursor', 'rows', 'sent', 'attempts', 'completed')
+  readonly_fields = fields
+
+
+class CronRunA(BaseModelAdmin):
+  list_display = ('job', 'started', 'finished', 'chunk_count', 'rows', 'sent')
+  list_filter = ('job',)
+  fields = (('job', 'started', 'finished'), ('chunk_count', 'rows', 'sent'))
+  readonly_fields = ('job', 'started', 'finished', 'chunk_count', 'rows', 'sent')
+  inlines = [CronChunkI]
+
+  def has_add_permission(self, request):
+    return False
+
+admin.site.register(CronRun, CronRunA)
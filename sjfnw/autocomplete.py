@@ -0,0 +1,150 @@
+""" Autocomplete for foreign keys with too many rows to list in a dropdown
+
+  A Search defines which rows can be picked, how they are matched and how they
+  are labeled. Registered searches are served as JSON by the autocomplete view
+  (see sjfnw.views.autocomplete) and used by AutocompleteWidget, which renders
+  a hidden input for the pk and a text box that fetches matches as you type.
+
+  Matching is by case-insensitive prefix on indexed fields. Results are
+  ordered newest first and paged by pk, so later pages don't use offsets.
+
+  Rendering a widget looks up its selected row's label. Model forms that
+  extend AutocompleteModelForm label it from the form's instance instead, so
+  inline rows don't each run a query.
+"""
+import logging
+import urllib
+
+from django import forms
+from django.db.models import Q
+from django.forms.utils import flatatt
+from django.utils.encoding import force_text
+from django.utils.html import format_html
+
+logger = logging.getLogger('sjfnw')
+
+LIMIT = 20
+
+_searches = {}
+
+
+class Search(object):
+  """ Base class for an autocomplete search
+
+    Subclasses set name, model and search_fields, and may override
+    get_queryset and label.
+  """
+  name = None
+  model = None
+  search_fields = () # matched by prefix; each word must match one of them
+
+  def get_queryset(self, request):
+    """ Rows that can be picked. request is None when labeling a saved value """
+    return self.model.objects.all()
+
+  def label(self, obj):
+    return unicode(obj)
+
+  def search(self, request, term, before=None, limit=None):
+    """ Returns (results, more) where results is a list of (pk, label) """
+    limit = limit or LIMIT
+    queryset = self.get_queryset(request)
+    for word in term.split():
+      match = Q()
+      for field in self.search_fields:
+        match |= Q(**{field + '__istartswith': word})
+      queryset = queryset.filter(match)
+    if before is not None:
+      queryset = queryset.filter(pk__lt=before)
+
+    objs = list(queryset.order_by('-pk')[:limit + 1])
+    return [(obj.pk, self.label(obj)) for obj in objs[:limit]], len(objs) > limit
+
+  def get_label(self, pk):
+    obj = self.get_queryset(None).filter(pk=pk).first()
+    return self.label(obj) if obj else ''
+
+
+def register(search_class):
+  """ Class decorator that makes a search available to widgets and the view """
+  _searches[search_class.name] = search_class()
+  return search_class
+
+
+def get_search(name):
+  """ Registered search with the given name, or None """
+  return _searches.get(name)
+
+
+class AutocompleteWidget(forms.Widget):
+  """ Text box that searches as you type and stores the selected row's pk
+
+    Args:
+      search_name: name of a registered Search
+      params: dict of extra query params sent with each search, for searches
+        that narrow their queryset based on the request
+  """
+
+  class Media(object):
+    js = ('js/autocomplete.js',)
+    css = {'all': ('css/autocomplete.css',)}
+
+  def __init__(self, search_name, params=None, attrs=None):
+    super(AutocompleteWidget, self).__init__(attrs)
+    self.search_name = search_name
+    self.params = params or {}
+    self.choices = () # set by ModelChoiceField; not used when rendering
+    self.labels = {} # pk (as text) -> label, for values labeled without a lookup
+
+  def __deepcopy__(self, memo):
+    obj = super(AutocompleteWidget, self).__deepcopy__(memo)
+    obj.labels = self.labels.copy()
+    return obj
+
+  def get_url(self):
+    url = '/admin/autocomplete/{}'.format(self.search_name)
+    if self.params:
+      url += '?' + urllib.urlencode(sorted(self.params.items()))
+    return url
+
+  def render(self, name, value, attrs=None):
+    attrs = self.build_attrs(attrs)
+    label = ''
+    if value not in (None, ''):
+      label = self.labels.get(force_text(value))
+      if label is None:
+        search = get_search(self.search_name)
+        if search:
+          label = search.get_label(value)
+        else:
+          label = ''
+          logger.error('AutocompleteWidget has unregistered search %s', self.search_name)
+    hidden_attrs = {'type': 'hidden', 'name': name,
+                    'value': '' if value is None else force_text(value)}
+    if attrs.get('id'):
+      hidden_attrs['id'] = attrs['id']
+    return format_html(
+        '<span class="autocomplete" data-url="{}">'
+        '<input{}><input type="text" class="autocomplete-text" value="{}" '
+        'placeholder="Type to search" autocomplete="off">'
+        '<ul class="autocomplete-results"></ul></span>',
+        self.get_url(), flatatt(hidden_attrs), label)
+
+
+class AutocompleteModelForm(forms.ModelForm):
+  """ Labels autocomplete fields from the instance's related objects. Load
+    those with select_related so labeling doesn't query """
+
+  def __init__(self, *args, **kwargs):
+    super(AutocompleteModelForm, self).__init__(*args, **kwargs)
+    if self.instance.pk is None:
+      return
+    for name, field in self.fields.iteritems():
+      # admin wraps widgets to add the related object buttons
+      widget = getattr(field.widget, 'widget', field.widget)
+      if not isinstance(widget, AutocompleteWidget):
+        continue
+      search = get_search(widget.search_name)
+      related_id = getattr(self.instance, name + '_id', None)
+      if search and related_id is not None:
+        widget.labels[force_text(related_id)] = search.label(getattr(self.instance, name))
@@ -0,0 +1,20 @@
+import logging
+
+from django.core.cache.backends.memcached import BaseMemcachedCache
+
+from google.appengine.api import memcache
+
+logger = logging.getLogger('sjfnw')
+
+
+class MemcacheBackend(BaseMemcachedCache):
+  """ Cache backend using App Engine's memcache service, which provides the same
+    client interface as python-memcached """
+
+  def __init__(self, server, params):
+    super(MemcacheBackend, self).__init__(server, params, library=memcache,
+                                          value_not_found_exception=ValueError)
+
+  def close(self, **kwargs):
+    # memcache service calls don't hold a connection open
+    pass
@@ -0,0 +1,133 @@
+""" Chunked, resumable cron jobs
+
+  A job's queryset is split into ranges of primary keys (keyset pagination, so
+  no large offsets) and each range is processed by its own task. Progress
+  through a chunk is checkpointed so that a retried task skips rows it has
+  already handled, rather than repeating work like sending emails.
+
+  Usage: subclass ChunkedJob, then call start_job from the cron view.
+"""
+import logging
+
+from django.db.models import F
+from django.utils import timezone
+
+from sjfnw import utils
+from sjfnw.models import CronChunk, CronRun
+
+logger = logging.getLogger('sjfnw')
+
+
+class ChunkedJob(object):
+  """ Base class for a job that is run in chunks
+
+    Subclasses set name and implement get_queryset and process_row, or
+    override process to handle a whole chunk at once.
+  """
+  name = None
+  chunk_size = 100
+
+  def get_queryset(self):
+    """ Rows to process. Re-evaluated by each chunk, so rows that have already
+      been handled (e.g. marked as emailed) will drop out on retry """
+    raise NotImplementedError
+
+  def process_row(self, row):
+    """ Handle a single row. Returns the number of emails sent """
+    raise NotImplementedError
+
+  def process(self, chunk, rows):
+    """ Handle rows in the chunk, checkpointing after each one """
+    for row in rows:
+      sent = self.process_row(row)
+      chunk.checkpoint(row.pk, rows=1, sent=sent or 0)
+
+
+class LocalExecutor(object):
+  """ Runs chunks immediately, in the current request. Used locally & in tests """
+
+  def submit(self, job_class, chunk_id):
+    run_chunk(job_class, chunk_id)
+
+
+class DeferredExecutor(object):
+  """ Runs each chunk in its own task on the task queue when deployed """
+
+  def __init__(self, queue='default'):
+    self.queue = queue
+
+  def submit(self, job_class, chunk_id):
+    utils.defer(run_chunk, job_class, chunk_id, _queue=self.queue)
+
+
+def get_executor():
+  """ utils.defer runs chunks immediately when not deployed """
+  return DeferredExecutor()
+
+
+def _get_ranges(queryset, size):
+  """ Split queryset into (first_pk, last_pk) ranges of up to size rows """
+  pks = queryset.order_by('pk').values_list('pk', flat=True).distinct()
+  ranges = []
+  last = None
+  while True:
+    page = pks.filter(pk__gt=last) if last is not None else pks
+    page = list(page[:size])
+    if not page:
+      return ranges
+    ranges.append((page[0], page[-1]))
+    last = page[-1]
+
+
+def start_job(job_class, executor=None):
+  """ Create a run for the job, split it into chunks and submit each one
+
+    Returns the CronRun
+  """
+  executor = executor or get_executor()
+  job = job_class()
+
+  ranges = _get_ranges(job.get_queryset(), job.chunk_size)
+  run = CronRun.objects.create(job=job.name, chunk_count=len(ranges))
+  if ranges:
+    CronChunk.objects.bulk_create([CronChunk(run=run, first_pk=first, last_pk=last)
+                                   for first, last in ranges])
+    chunk_ids = list(run.chunks.values_list('pk', flat=True))
+    logger.info('%s starting with %d chunks', job.name, len(chunk_ids))
+    for chunk_id in chunk_ids:
+      executor.submit(job_class, chunk_id)
+  else:
+    logger.info('%s has nothing to do', job.name)
+    run.finish_if_done()
+
+  # chunks may have finished the run already (always, if run locally)
+  run.refresh_from_db()
+  return run
+
+
+def run_summary(run):
+  """ Short description of a run, for cron view responses """
+  if run.finished:
+    return '{}: {} chunk(s), {} row(s), {} sent'.format(
+        run.job, run.chunk_count, run.rows, run.sent)
+  return '{}: {} chunk(s) queued'.format(run.job, run.chunk_count)
+
+
+def run_chunk(job_class, chunk_id):
+  """ Process a single chunk, resuming after its cursor if it was attempted before """
+  chunk = CronChunk.objects.select_related('run').get(pk=chunk_id)
+  if chunk.completed:
+    logger.info('%s chunk %d already completed', chunk.run.job, chunk.pk)
+    return
+
+  CronChunk.objects.filter(pk=chunk.pk).update(attempts=F('attempts') + 1)
+
+  job = job_class()
+  rows = job.get_queryset().filter(pk__range=(chunk.first_pk, chunk.last_pk))
+  if chunk.cursor is not None:
+    logger.info('%s chunk %d resuming after %d', chunk.run.job, chunk.pk, chunk.cursor)
+    rows = rows.filter(pk__gt=chunk.cursor)
+  job.process(chunk, rows.order_by('pk'))
+
+  CronChunk.objects.filter(pk=chunk.pk).update(completed=timezone.now())
+  chunk.run.finish_if_done()
@@ -8,12 +8,12 @@ from django.utils.safestring import mark_safe
 
 import unicodecsv
 
-from sjfnw import utils
+from sjfnw import autocomplete, utils
 from sjfnw.admin import BaseModelAdmin, YearFilter
 from sjfnw.fund.models import (GivingProject, Member, Membership, Survey,
     GPSurvey, Resource, ProjectResource, Donor, NewsItem, SurveyResponse)
-from sjfnw.fund import forms, modelforms, utils as fund_utils
-from sjfnw.grants.models import ProjectApp, GrantApplication
+from sjfnw.fund import cache as fund_cache, forms, modelforms, utils as fund_utils
+from sjfnw.grants.models import ProjectApp
 
 logger = logging.getLogger('sjfnw')
 
@@ -84,41 +84,45 @@ class DonorLikelyToJoinFilter(SimpleListFilter):
     elif val:
       return queryset.filter(likely_to_join=val)
 
+# -----------------------------------------------------------------------------
+# Autocomplete searches
+# -----------------------------------------------------------------------------
+
+@autocomplete.register
+class MemberSearch(autocomplete.Search):
+  name = 'members'
+  model = Member
+  search_fields = ('first_name', 'last_name', 'user__username')
+
+
+@autocomplete.register
+class MembershipSearch(autocomplete.Search):
+  name = 'memberships'
+  model = Membership
+  search_fields = ('member__first_name', 'member__last_name', 'giving_project__title')
+
+  def get_queryset(self, request):
+    return Membership.objects.select_related('member', 'giving_project')
+
 # -----------------------------------------------------------------------------
 # Inlines
 # -----------------------------------------------------------------------------
 
 class MembershipInline(admin.TabularInline):
   model = Membership
+  form = autocomplete.AutocompleteModelForm
   formset = forms.MembershipInlineFormset
   extra = 0
   fields = ['member', 'giving_project', 'approved', 'leader']
   show_change_link = True
 
-  def formfield_for_foreignkey(self, db_field, request, **kwargs):
+  def get_queryset(self, request):
+    return super(MembershipInline, self).get_queryset(request).select_related('member')
 
-    # cache member choices to reduce queries
+  def formfield_for_foreignkey(self, db_field, request, **kwargs):
     if db_field.name == 'member':
-
-      cached_choices = getattr(request, 'cached_members', None)
-      if cached_choices:
-        logger.debug('Using cached choices for membership inline')
-        formfield = super(MembershipInline, self).formfield_for_foreignkey(
-            db_field, request, **kwargs)
-        formfield.choices = cached_choices
-
-      else:
-        members = Member.objects.all()
-        formfield = super(MembershipInline, self).formfield_for_foreignkey(
-            db_field, request, **kwargs)
-        formfield.choices = [(member.pk, unicode(member)) for member in members]
-        request.cached_members = formfield.choices
-
-      return formfield
-
-    else: # different field
-      return super(MembershipInline, self).formfield_for_foreignkey(
-          db_field, request, **kwargs)
+      kwargs['widget'] = autocomplete.AutocompleteWidget('members')
+    return super(MembershipInline, self).formfield_for_foreignkey(db_field, request, **kwargs)
 
 
 class ProjectResourcesInline(admin.TabularInline):
@@ -141,6 +145,7 @@ class DonorInline(admin.TabularInline):
 
 class ProjectAppInline(admin.TabularInline):
   model = ProjectApp
+  form = autocomplete.AutocompleteModelForm
   extra = 1
   verbose_name = 'Grant application'
   verbose_name_plural = 'Grant applications'
@@ -150,32 +155,29 @@ class ProjectAppInline(admin.TabularInline):
 
   def get_queryset(self, request):
     return super(ProjectAppInline, self).get_queryset(request).select_related(
-        'application', 'givingprojectgrant')
+        'application__organization', 'application__grant_cycle', 'givingprojectgrant')
 
   def formfield_for_foreignkey(self, db_field, request, **kwargs):
-    """ Limit application choices to those submitted no more than 1 year before
-        giving project's fundrasing deadline
-
-        For performance and to avoid a 'response too large' error
-    """
-    formfield = super(ProjectAppInline, self).formfield_for_foreignkey(
-        db_field, request, **kwargs)
-
-    if db_field.name == 'application' and request.resolver_match.args:
-      apps = GrantApplication.objects.select_related('grant_cycle', 'organization')
-      try:
-        gp_id = int(request.resolver_match.args[0])
-      except ValueError:
-        # shoudn't be possible, but catch it in case
-        logger.error('Could not parse GP id. URL: %s, ResolverMatch args: %s',
-                     request.path, request.resolver_match.args)
-      else:
-        gp = GivingProject.objects.get(pk=gp_id)
-        year = gp.fundraising_deadline - datetime.timedelta(weeks=52)
-        apps = apps.filter(submission_time__gte=year)
-        formfield.choices = [('', '---------')] + [(app.pk, unicode(app)) for app in apps]
-
-    return formfield
+    """ Search applications submitted no more than 1 year before giving
+        project's fundraising deadline, rather than listing them all """
+    if db_field.name == 'application':
+      params = {}
+      if request.resolver_match.args:
+        try:
+          gp_id = int(request.resolver_match.args[0])
+        except ValueError:
+          # shoudn't be possible, but catch it in case
+          logger.error('Could not parse GP id. URL: %s, ResolverMatch args: %s',
+                       request.path, request.resolver_match.args)
+        else:
+          deadline = (GivingProject.objects.filter(pk=gp_id)
+                                           .values_list('fundraising_deadline', flat=True)
+                                           .first())
+          if deadline:
+            year = deadline - datetime.timedelta(weeks=52)
+            params['submitted_after'] = year.isoformat()
+      kwargs['widget'] = autocomplete.AutocompleteWidget('applications', params=params)
+    return super(ProjectAppInline, self).formfield_for_foreignkey(db_field, request, **kwargs)
 
   def app_link(self, obj):
     if obj and hasattr(obj, 'application'):
@@ -233,6 +235,13 @@ class GivingProjectA(BaseModelAdmin):
     self.inlines = [MembershipInline, GPSurveyI, ProjectResourcesInline, ProjectAppInline]
     return super(GivingProjectA, self).change_view(request, object_id, form_url=form_url, extra_context=extra_context)
 
+  def get_queryset(self, request):
+    return super(GivingProjectA, self).get_queryset(request).with_progress()
+
+  def estimated(self, obj):
+    return getattr(obj, 'progress_estimated', 0) # not set when adding a project
+  estimated.admin_order_field = 'progress_estimated'
+
   def gp_year(self, obj):
     year = obj.fundraising_deadline.year
     if year == timezone.now().year:
@@ -264,7 +273,7 @@ class MembershipA(BaseModelAdmin):
                   'last_activity', 'approved', 'leader']
   list_filter = ['approved', 'leader', 'giving_project']
   readonly_list = ['list_progress', 'overdue_steps']
-  list_select_related = ['member', 'giving_project']
+  list_select_related = ['member', 'giving_project', 'progress_rollup']
 
   fields = [('member', 'giving_project', 'approved'),
             ('leader',),
@@ -275,14 +284,12 @@ class MembershipA(BaseModelAdmin):
   inlines = [DonorInline]
   ordering = ['-last_activity']
 
-  def get_queryset(self, request):
-    return super(MembershipA, self).get_queryset(request).prefetch_related('donor_set')
-
   def approve(self, _, queryset):
     for memship in queryset:
       if memship.approved is False:
         fund_utils.notify_approval(memship)
     queryset.update(approved=True)
+    fund_cache.bump_memberships(*[memship.pk for memship in queryset])
 
   def list_progress(self, obj): # for membership list - mimics columns
     membership_progress = obj.get_progress()
@@ -307,6 +314,7 @@ class MembershipA(BaseModelAdmin):
 
 
 class DonorA(BaseModelAdmin):
+  keyset_pagination = True
   actions = ['export_donors']
   search_fields = ['firstname', 'lastname', 'membership__member__first_name',
                    'membership__member__last_name']
@@ -335,48 +343,64 @@ class DonorA(BaseModelAdmin):
   readonly_fields = ['promise_reason_display', 'likely_to_join']
 
   def formfield_for_foreignkey(self, db_field, request, **kwargs):
-    field = super(DonorA, self).formfield_for_foreignkey(db_field, request, **kwargs)
     if db_field.name == 'membership':
-      ships = Membership.objects.select_related('giving_project', 'member')
-      field.choices = [(ship.pk, unicode(ship)) for ship in ships]
-    return field
+      kwargs['widget'] = autocomplete.AutocompleteWidget('memberships')
+    return super(DonorA, self).formfield_for_foreignkey(db_field, request, **kwargs)
 
   def export_donors(self, request, queryset):
+    """ Stream donors as csv. Loads values rather than models so memory use
+      doesn't grow with the number of donors """
     logger.info('Export donors called by %s', request.user.username)
 
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename=prospects.csv'
-    writer = unicodecsv.writer(response)
-
-    writer.writerow(['First name', 'Last name', 'Phone', 'Email', 'Member',
-                     'Giving Project', 'Amount to ask', 'Asked', 'Promised',
-                     'Received - TOTAL', 'Received - Year', 'Received - Amount',
-                     'Received - Year', 'Received - Amount',
-                     'Received - Year', 'Received - Amount', 'Notes',
-                     'Likelihood of joining a GP', 'Reasons for donating'])
-    count = 0
-    for donor in queryset:
-      year = donor.membership.giving_project.fundraising_deadline.year
-      fields = [donor.firstname, donor.lastname, donor.phone, donor.email,
-                donor.membership.member, donor.membership.giving_project,
-                donor.amount, donor.asked, donor.promised, donor.received(),
-                year, donor.received_this, year + 1, donor.received_next, year + 2,
-                donor.received_afternext, donor.notes,
-                donor.get_likely_to_join_display(),
-                donor.promise_reason_display(), donor.total_promised(),
-                donor.match_expected, donor.match_received, donor.match_company]
-      writer.writerow(fields)
-      count += 1
-    logger.info(str(count) + ' donors exported')
-    return response
+    header = ['First name', 'Last name', 'Phone', 'Email', 'Member',
+              'Giving Project', 'Amount to ask', 'Asked', 'Promised',
+              'Received - TOTAL', 'Received - Year', 'Received - Amount',
+              'Received - Year', 'Received - Amount',
+              'Received - Year', 'Received - Amount', 'Notes',
+              'Likelihood of joining a GP', 'Reasons for donating']
+    values = queryset.values_list(
+        'firstname', 'lastname', 'phone', 'email',
+        'membership__member__first_name', 'membership__member__last_name',
+        'membership__giving_project__title', 'membership__giving_project__fundraising_deadline',
+        'amount', 'asked', 'promised', 'received_this', 'received_next', 'received_afternext',
+        'notes', 'likely_to_join', 'promise_reason', 'match_expected', 'match_received',
+        'match_company')
+    likely_to_join_display = dict(Donor.LIKELY_TO_JOIN_CHOICES)
+    reasons_display = {} # promise_reason json -> display, since most donors share a few
+
+    def rows():
+      count = 0
+      for (firstname, lastname, phone, email, member_first, member_last, gp_title, deadline,
+           amount, asked, promised, received_this, received_next, received_afternext,
+           notes, likely_to_join, promise_reason, match_expected, match_received,
+           match_company) in values.iterator():
+        if promise_reason not in reasons_display:
+          reasons_display[promise_reason] = ', '.join(json.loads(promise_reason))
+        year = deadline.year
+        # mirrors Donor.received and Donor.total_promised
+        received = received_this + received_next + received_afternext + (match_received or 0)
+        yield [firstname, lastname, phone, email,
+               u'{} {}'.format(member_first, member_last), u'{} {}'.format(gp_title, year),
+               amount, asked, promised, received,
+               year, received_this, year + 1, received_next, year + 2,
+               received_afternext, notes,
+               likely_to_join_display.get(likely_to_join, likely_to_join),
+               reasons_display[promise_reason], match_expected + (promised or 0),
+               match_expected, match_received, match_company]
+        count += 1
+      logger.info('%d donors exported', count)
+
+    return utils.csv_response('prospects', header, rows())
 
 
 class NewsA(BaseModelAdmin):
+  keyset_pagination = True
   list_display = ['summary', 'date', 'membership']
-  list_filter = ['membership__giving_project']
+  list_filter = ['giving_project']
 
 
 class StepAdv(BaseModelAdmin):
+  keyset_pagination = True
   list_display = ['description', 'donor', 'step_membership', 'date',
                   'completed', 'promised']
   list_filter = ['donor__membership', PromisedFilter,
@@ -0,0 +1,93 @@
+""" Caching for project-level content on Project Central pages
+
+  Content here is shared by all members of a giving project. Models that it's
+  built from clear the relevant keys when they change.
+
+  Also holds change versions for memberships and projects, used for page
+  ETags and to check that a cached current membership is up to date. A version is the time of the last change; one that's missing (never
+  set, or evicted) is reset to now, so pages are never wrongly unchanged.
+"""
+import logging
+import time
+
+from django.core.cache import cache
+
+logger = logging.getLogger('sjfnw')
+
+# upper bound on staleness for changes that don't clear the cache
+TIMEOUT = 60 * 60
+
+NEWS_KEY = 'fund-news-{}'
+GRANTS_KEY = 'fund-grants-{}'
+MEMBERSHIP_VERSION_KEY = 'fund-ship-version-{}'
+PROJECT_VERSION_KEY = 'fund-gp-version-{}'
+CURRENT_MEMBERSHIP_KEY = 'fund-current-ship-{}'
+
+
+def get_or_set(key, load):
+  """ Get value from cache, or call load and cache its return value """
+  value = cache.get(key)
+  if value is None:
+    value = load()
+    cache.set(key, value, TIMEOUT)
+  return value
+
+
+def clear_news(giving_project_id):
+  cache.delete(NEWS_KEY.format(giving_project_id))
+  bump_projects(giving_project_id)
+
+
+def clear_grants(*giving_project_ids):
+  if giving_project_ids:
+    logger.debug('Clearing cached grants for projects %s', giving_project_ids)
+    cache.delete_many([GRANTS_KEY.format(gp_id) for gp_id in giving_project_ids])
+    bump_projects(*giving_project_ids)
+
+
+def _bump(key_format, ids):
+  now = time.time()
+  cache.set_many({key_format.format(pk): now for pk in set(ids)}, None)
+
+
+def bump_memberships(*membership_ids):
+  _bump(MEMBERSHIP_VERSION_KEY, membership_ids)
+
+
+def bump_projects(*giving_project_ids):
+  _bump(PROJECT_VERSION_KEY, giving_project_ids)
+
+
+def get_versions(membership_ids=(), giving_project_ids=()):
+  """ Current versions of the given memberships and projects, as a sorted
+    list of (key, version) """
+  keys = ([MEMBERSHIP_VERSION_KEY.format(pk) for pk in membership_ids] +
+          [PROJECT_VERSION_KEY.format(pk) for pk in giving_project_ids])
+  versions = cache.get_many(keys)
+  missing = {key: time.time() for key in keys if key not in versions}
+  if missing:
+    cache.set_many(missing, None)
+    versions.update(missing)
+  return sorted(versions.iteritems())
+
+
+def get_current_membership(user_id, load):
+  """ Get a user's current membership from cache if neither it nor its
+    project has changed since it was cached. Otherwise call load, which
+    returns the membership or None, and cache the result if there is one """
+  key = CURRENT_MEMBERSHIP_KEY.format(user_id)
+  cached = cache.get(key)
+  if cached is not None:
+    versions, membership = cached
+    if versions == get_versions([membership.pk], [membership.giving_project_id]):
+      return membership
+  membership = load()
+  if membership is not None:
+    versions = get_versions([membership.pk], [membership.giving_project_id])
+    cache.set(key, (versions, membership), TIMEOUT)
+  return membership
+
+
+def clear_current_membership(user_id):
+  """ For changes to the member, such as switching their current membership """
+  cache.delete(CURRENT_MEMBERSHIP_KEY.format(user_id))
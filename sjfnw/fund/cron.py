@@ -1,41 +1,80 @@
 import datetime
 import logging
+import time
 
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Max, Q, Sum, TextField, Value, When
 from django.http import HttpResponse
 from django.utils import timezone
 
 from sjfnw import constants as c, utils
-from sjfnw.fund import models
+from sjfnw.cron import ChunkedJob, run_summary, start_job
+from sjfnw.fund import cache as fund_cache, models
 
 logger = logging.getLogger('sjfnw')
 
+class OverdueStepsJob(ChunkedJob):
+  """ Email members about overdue steps, at most once a week per membership
+
+    Uses a fixed number of queries per chunk regardless of its size.
+    Memberships are marked as emailed, so a retried chunk won't email them again.
+  """
+  name = 'email_overdue'
+
+  def __init__(self):
+    self.today = datetime.date.today()
+    # same definition of overdue as Membership.overdue_steps
+    self.cutoff = timezone.now().date() - datetime.timedelta(days=1)
+
+  def get_queryset(self):
+    limit = self.today - datetime.timedelta(days=7)
+    return (models.Membership.objects
+        .filter(giving_project__fundraising_deadline__gte=self.today)
+        .filter(Q(emailed__isnull=True) | Q(emailed__lte=limit))
+        .filter(donor__step__completed__isnull=True, donor__step__date__lt=self.cutoff))
+
+  def process(self, chunk, rows):
+    ships = list(rows
+        .annotate(overdue_count=Count('donor__step'), last_overdue=Max('donor__step__date'))
+        .select_related('member__user', 'giving_project'))
+    if not ships:
+      return
+
+    # most recent overdue step for each membership
+    latest_steps = {}
+    steps = (models.Step.objects
+        .filter(donor__membership__in=[ship.pk for ship in ships],
+                completed__isnull=True,
+                date__in=set(ship.last_overdue for ship in ships))
+        .select_related('donor'))
+    for step in steps:
+      latest_steps.setdefault((step.donor.membership_id, step.date), step)
+
+    messages = []
+    for ship in ships:
+      to_email = ship.member.user.username
+      logger.info('%s has overdue step(s), emailing.', to_email)
+      messages.append(utils.build_email(
+        subject='Fundraising Steps',
+        to=[to_email],
+        sender=c.FUND_EMAIL,
+        template='fund/emails/overdue_steps.html',
+        context={
+          'login_url': c.APP_BASE_URL + '/fund/login', 'ship': ship,
+          'num': ship.overdue_count,
+          'step': latest_steps[(ship.pk, ship.last_overdue)],
+          'base_url': c.APP_BASE_URL
+        }
+      ))
+    utils.send_emails(messages)
+
+    models.Membership.objects.filter(pk__in=[ship.pk for ship in ships]).update(emailed=self.today)
+    chunk.checkpoint(ships[-1].pk, rows=len(ships), sent=len(messages))
+
+
 def email_overdue(request):
-  today = datetime.date.today()
-  ships = models.Membership.objects.filter(giving_project__fundraising_deadline__gte=today)
-  limit = today - datetime.timedelta(days=7)
-  subject = 'Fundraising Steps'
-  from_email = c.FUND_EMAIL
-
-  for ship in ships:
-    member = ship.member
-    if not ship.emailed or (ship.emailed <= limit):
-      count, step = ship.overdue_steps(get_next=True)
-      if count > 0 and step:
-        to_email = ship.member.user.username
-        logger.info('%s has overdue step(s), emailing.', to_email)
-        utils.send_email(
-          subject=subject,
-          to=[to_email],
-          sender=from_email,
-          template='fund/emails/overdue_steps.html',
-          context={
-            'login_url': c.APP_BASE_URL + '/fund/login', 'ship': ship, 'num': count,
-            'step': step, 'base_url': c.APP_BASE_URL
-          }
-        )
-        ship.emailed = today
-        ship.save(skip=True)
-  return HttpResponse('')
+  run = start_job(OverdueStepsJob)
+  return HttpResponse(run_summary(run))
 
 
 def new_accounts(request):
@@ -44,69 +83,99 @@ def new_accounts(request):
     Will continue emailing about the same membership until it's approved/deleted.
   """
 
-  subject = 'Accounts pending approval'
-  from_email = c.FUND_EMAIL
-
-  active_gps = models.GivingProject.objects.filter(fundraising_deadline__gte=timezone.now().date())
-
-  for gp in active_gps:
-    memberships = models.Membership.objects.filter(giving_project=gp)
-    need_approval = memberships.filter(approved=False).count()
-    if need_approval > 0:
-      leaders = memberships.filter(leader=True)
-      to_emails = [leader.member.user.username for leader in leaders]
-      if to_emails:
-        utils.send_email(
-          subject=subject,
-          to=to_emails,
-          sender=from_email,
-          template='fund/emails/accounts_need_approval.html',
-          context={
-            'admin_url': c.APP_BASE_URL + '/admin/fund/membership/',
-            'count': need_approval,
-            'giving_project': unicode(gp),
-            'support_email': c.SUPPORT_EMAIL
-          }
-        )
-        logger.info('%d unapproved memberships in %s. Email sent to %s',
-            need_approval, unicode(gp), ', '.join(to_emails))
+  gps = list(models.GivingProject.objects
+      .filter(fundraising_deadline__gte=timezone.now().date())
+      .annotate(need_approval=Sum(Case(When(membership__approved=False, then=1),
+                                       default=0, output_field=IntegerField())))
+      .filter(need_approval__gt=0))
+
+  leader_emails = {}
+  leaders = (models.Membership.objects.filter(giving_project__in=gps, leader=True)
+                                      .values_list('giving_project_id', 'member__user__username'))
+  for gp_id, email in leaders:
+    leader_emails.setdefault(gp_id, []).append(email)
+
+  messages = []
+  for gp in gps:
+    to_emails = leader_emails.get(gp.pk)
+    if to_emails:
+      messages.append(utils.build_email(
+        subject='Accounts pending approval',
+        to=to_emails,
+        sender=c.FUND_EMAIL,
+        template='fund/emails/accounts_need_approval.html',
+        context={
+          'admin_url': c.APP_BASE_URL + '/admin/fund/membership/',
+          'count': gp.need_approval,
+          'giving_project': unicode(gp),
+          'support_email': c.SUPPORT_EMAIL
+        }
+      ))
+      logger.info('%d unapproved memberships in %s. Emailing %s',
+          gp.need_approval, unicode(gp), ', '.join(to_emails))
+  utils.send_emails(messages)
 
   return HttpResponse('')
 
-def gift_notify(request):
-  """ Set gift received notifications on membership object and send an email
-      Marks donors as notified """
-
-  donors = (models.Donor.objects
-      .select_related('membership__member')
+def _unnotified_donors():
+  return (models.Donor.objects
       .filter(gift_notified=False)
       .exclude(received_this=0, received_next=0, received_afternext=0))
 
-  memberships = {}
-  for donor in donors:
-    if donor.membership not in memberships:
-      memberships[donor.membership] = []
-    memberships[donor.membership].append(donor)
-
-  login_url = c.APP_BASE_URL + '/fund/'
-  subject = 'Gift or pledge received'
-  from_email = c.FUND_EMAIL
-
-  for ship, donor_list in memberships.iteritems():
-    gift_str = ''
-    for donor in donor_list:
-      gift_str += u'${}  gift or pledge received from {}! '.format(donor.received(), donor)
-    ship.notifications = gift_str
-    ship.save(skip=True)
-
-    utils.send_email(
-      subject=subject,
-      to=[ship.member.user.username],
-      sender=from_email,
-      template='fund/emails/gift_received.html',
-      context={'login_url': login_url, 'gift_str': ship.notifications}
-    )
-    logger.info('Set gift notification and sent email to %s', ship.member.user.username)
-
-  donors.update(gift_notified=True)
-  return HttpResponse('')
+
+class GiftNotifyJob(ChunkedJob):
+  """ Set gift received notifications on membership object and send an email
+      Marks donors as notified
+
+    Uses a fixed number of queries per chunk regardless of its size, and
+    queues the chunk's emails in a single task.
+  """
+  name = 'gift_notify'
+
+  def get_queryset(self):
+    return models.Membership.objects.filter(
+        pk__in=_unnotified_donors().values('membership_id'))
+
+  def process(self, chunk, rows):
+    start = time.time()
+    ships = list(rows.select_related('member__user'))
+    if not ships:
+      return
+
+    # gift strings by membership
+    gifts, donor_ids = {}, []
+    donors = (_unnotified_donors()
+        .filter(membership__in=ships)
+        .only('membership', 'firstname', 'lastname', 'received_this', 'received_next',
+              'received_afternext', 'match_received'))
+    for donor in donors:
+      donor_ids.append(donor.pk)
+      gifts[donor.membership_id] = gifts.get(donor.membership_id, u'') + (
+          u'${}  gift or pledge received from {}! '.format(donor.received(), donor))
+
+    login_url = c.APP_BASE_URL + '/fund/'
+    messages = [utils.build_email(
+        subject='Gift or pledge received',
+        to=[ship.member.user.username],
+        sender=c.FUND_EMAIL,
+        template='fund/emails/gift_received.html',
+        context={'login_url': login_url, 'gift_str': gifts[ship.pk]}
+      ) for ship in ships if ship.pk in gifts]
+
+    if gifts:
+      with transaction.atomic():
+        models.Membership.objects.filter(pk__in=gifts.keys()).update(notifications=Case(
+            *[When(pk=pk, then=Value(gift_str)) for pk, gift_str in gifts.iteritems()],
+            output_field=TextField()))
+        models.Donor.objects.filter(pk__in=donor_ids).update(gift_notified=True)
+      fund_cache.bump_memberships(*gifts.keys())
+    utils.send_emails(messages)
+
+    chunk.checkpoint(ships[-1].pk, rows=len(ships), sent=len(messages))
+    logger.info('%s chunk %d: %d donors scanned, %d memberships notified in %.2fs',
+                self.name, chunk.pk, len(donor_ids), len(gifts), time.time() - start)
+
+
+def gift_notify(request):
+  run = start_job(GiftNotifyJob)
+  return HttpResponse(run_summary(run))
@@ -3,10 +3,14 @@ import logging
 
 from django.contrib.auth.views import redirect_to_login
 from django.core.urlresolvers import reverse
+from django.db.models import F
 from django.http import HttpResponse
 from django.shortcuts import redirect
 from django.utils.decorators import available_attrs
 
+from sjfnw.fund import cache as fund_cache
+from sjfnw.fund.models import Membership
+
 logger = logging.getLogger('sjfnw')
 
 
@@ -14,6 +18,7 @@ def require_member(require_membership=False):
   """ Require request.user that is authenticed, active and has associated member
 
       If require_membership is True, require that the member is on an approved membership
+      and set it as request.membership (with member and giving_project loaded)
   """
   def decorator(view_func):
 
@@ -28,16 +33,17 @@ def require_member(require_membership=False):
         # TODO error page
         return HttpResponse('Something is wrong')
 
+      membership = None
+      if require_membership:
+        membership = _get_current_membership(request.user)
+
+      if membership: # implies member exists; cache it to save a query
+        request.user.member = membership.member
       elif not hasattr(request.user, 'member'):
         logger.debug('Not a member: %s', request.user.username)
         return redirect(reverse('sjfnw.fund.views.not_member'))
 
       if require_membership:
-        membership = None
-        if request.user.member.current:
-          membership = (request.user.member.membership_set
-                                           .filter(pk=request.user.member.current)
-                                           .first())
         if not membership:
           return redirect(reverse('sjfnw.fund.views.manage_account'))
 
@@ -49,3 +55,16 @@ def require_member(require_membership=False):
       return view_func(request, *args, **kwargs)
     return _wrapped_view
   return decorator
+
+
+def _get_current_membership(user):
+  """ Get user's current membership along with its member and giving project.
+    Cached until the membership, its project or the member changes. Returns
+    None if user has no member or current membership """
+  def load():
+    try:
+      return (Membership.objects.select_related('member', 'giving_project')
+                                .get(member__user_id=user.pk, pk=F('member__current')))
+    except Membership.DoesNotExist:
+      return None
+  return fund_cache.get_current_membership(user.pk, load)
@@ -71,8 +71,7 @@ class MassDonor(MassDonorPre):
 
 
 class DonorEstimates(forms.Form):
-  donor = forms.ModelChoiceField(queryset=models.Donor.objects.all(),
-                                 widget=forms.HiddenInput())
+  donor = forms.IntegerField(widget=forms.HiddenInput()) # donor pk
   amount = IntegerCommaField(label='*Estimated donation ($)',
                              min_value=0,
                              widget=forms.TextInput())
@@ -89,8 +88,7 @@ class MassStep(forms.Form):
   description = forms.CharField(
       max_length=255, required=False,
       widget=forms.TextInput(attrs={'onfocus': 'showSuggestions(this.id)', 'size': '34'}))
-  donor = forms.ModelChoiceField(queryset=models.Donor.objects.all(),
-                                 widget=forms.HiddenInput())
+  donor = forms.IntegerField(widget=forms.HiddenInput()) # donor pk
 
   def clean(self): # date/desc pair validation
     cleaned_data = super(MassStep, self).clean()
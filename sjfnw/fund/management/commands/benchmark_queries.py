@@ -0,0 +1,146 @@
+import datetime
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from sjfnw.fund.models import Donor, GivingProject, Member, Membership, NewsItem, Step
+
+TITLE = 'Benchmark'
+USER_PREFIX = 'benchmark-'
+
+
+class Command(BaseCommand):
+
+  help = ('Prints query plans and timings for the fund app\'s most frequent queries. '
+          'Use --seed to first create a large benchmark giving project, and '
+          '--cleanup to delete it. Seeding and cleanup need the current schema. To '
+          'compare indexes, seed, run, then migrate fund back to 0012 and run again. '
+          'Queries using NewsItem.giving_project are skipped when it doesn\'t exist.')
+
+  def add_arguments(self, parser):
+    parser.add_argument('--seed', type=int, default=0, metavar='MEMBERS',
+                        help='Create a benchmark project with this many members')
+    parser.add_argument('--donors', type=int, default=100,
+                        help='Donors per member when seeding (default 100)')
+    parser.add_argument('--steps', type=int, default=4,
+                        help='Steps per donor when seeding (default 4)')
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Times to run each query (default 10)')
+    parser.add_argument('--cleanup', action='store_true', default=False,
+                        help='Delete benchmark data and exit')
+
+  def handle(self, *args, **options):
+    if options['cleanup']:
+      self.cleanup()
+      return
+
+    has_news_project = self.has_news_project()
+    if options['seed']:
+      if not has_news_project:
+        raise CommandError('Seeding needs the current schema. Migrate first')
+      gp = self.seed(options['seed'], options['donors'], options['steps'])
+    else:
+      gp = get_projects().order_by('-pk').first()
+      if not gp:
+        raise CommandError('No benchmark data. Run with --seed first')
+
+    ship = Membership.objects.filter(giving_project=gp).order_by('pk').first()
+    queries = [
+      ('Upcoming steps', Step.objects.filter(donor__membership=ship, completed__isnull=True)
+                                     .order_by('date')[:2]),
+      ('Donors without estimates', Donor.objects.filter(membership=ship, amount__isnull=True)[:1]),
+      ('Unapproved memberships', Membership.objects.filter(giving_project=gp, approved=False)),
+      ('Project leaders', Membership.objects.filter(giving_project=gp, leader=True)),
+      # values, so the query doesn't select giving_project before it exists
+      ('Project news (joined)', NewsItem.objects.filter(membership__giving_project=gp)
+                                                .order_by('-date')
+                                                .values_list('pk', 'summary', 'date')[:25]),
+    ]
+    if has_news_project:
+      queries.append(('Project news', NewsItem.objects.filter(giving_project=gp)
+                                                      .order_by('-date')
+                                                      .values_list('pk', 'summary', 'date')[:25]))
+    else:
+      self.stdout.write('NewsItem.giving_project doesn\'t exist yet; skipping project news\n')
+    for name, queryset in queries:
+      self.benchmark(name, queryset, options['repeat'])
+
+  def benchmark(self, name, queryset, repeat):
+    sql, params = queryset.query.sql_with_params()
+    explain = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    cursor = connection.cursor()
+    cursor.execute(explain + sql, params)
+    plan = cursor.fetchall()
+
+    timings = []
+    for _ in range(repeat):
+      start = time.time()
+      list(queryset.all()) # .all() so results aren't cached between runs
+      timings.append((time.time() - start) * 1000)
+
+    self.stdout.write('\n{}\n{}\n'.format(name, '-' * len(name)))
+    for row in plan:
+      self.stdout.write('  {}\n'.format(' | '.join(unicode(col) for col in row)))
+    self.stdout.write('  min {:.2f}ms, avg {:.2f}ms over {} runs\n'.format(
+        min(timings), sum(timings) / len(timings), repeat))
+
+  def seed(self, members, donors, steps):
+    """ Create a project with members * donors * steps rows of steps, using
+      bulk inserts. Skips progress rollups and other per-save bookkeeping """
+    self.stdout.write('Seeding {} members...\n'.format(members))
+    now = timezone.now()
+    gp = GivingProject.objects.create(title=TITLE, public=False, fundraising_training=now,
+                                      fundraising_deadline=now.date() + datetime.timedelta(days=90))
+
+    prefix = '{}{}-'.format(USER_PREFIX, gp.pk)
+    User.objects.bulk_create([User(username='{}{}@example.com'.format(prefix, i))
+                              for i in range(members)])
+    users = User.objects.filter(username__startswith=prefix)
+    Member.objects.bulk_create([Member(user=user, first_name='Bench', last_name=str(i))
+                                for i, user in enumerate(users)])
+    Membership.objects.bulk_create([
+      Membership(giving_project=gp, member=member, approved=i % 20 != 0, leader=i % 10 == 1)
+      for i, member in enumerate(Member.objects.filter(user__username__startswith=prefix))
+    ])
+    ship_ids = list(Membership.objects.filter(giving_project=gp).values_list('pk', flat=True))
+
+    Donor.objects.bulk_create([
+      Donor(membership_id=ship_id, firstname='Donor', lastname=str(i),
+            amount=None if i % 5 == 0 else 100, likelihood=50)
+      for ship_id in ship_ids for i in range(donors)
+    ], batch_size=1000)
+    donor_ids = Donor.objects.filter(membership__giving_project=gp).values_list('pk', flat=True)
+    Step.objects.bulk_create([
+      Step(donor_id=donor_id, date=now.date() + datetime.timedelta(days=i - steps),
+           description='Step', completed=now if i < steps - 1 else None)
+      for donor_id in donor_ids.iterator() for i in range(steps)
+    ], batch_size=1000)
+    NewsItem.objects.bulk_create([
+      NewsItem(membership_id=ship_id, giving_project=gp, summary='News',
+               date=now - datetime.timedelta(days=i))
+      for ship_id in ship_ids for i in range(10)
+    ], batch_size=1000)
+    self.stdout.write('Created project {} with {} donors.\n'.format(gp.pk, len(donor_ids)))
+    return gp
+
+  def has_news_project(self):
+    columns = connection.introspection.get_table_description(
+        connection.cursor(), NewsItem._meta.db_table)
+    return NewsItem._meta.get_field('giving_project').column in [col.name for col in columns]
+
+  def cleanup(self):
+    gp_ids = list(get_projects().values_list('pk', flat=True))
+    # members' deletion cascades to memberships, donors, steps & news
+    User.objects.filter(username__startswith=USER_PREFIX).delete()
+    GivingProject.objects.filter(pk__in=gp_ids).delete()
+    self.stdout.write('Deleted {} benchmark project(s).\n'.format(len(gp_ids)))
+
+
+def get_projects():
+  """ Projects created by seed, found by their members' usernames """
+  return GivingProject.objects.filter(
+      title=TITLE,
+      membership__member__user__username__startswith=USER_PREFIX).distinct()
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from sjfnw.fund.models import Donor, Membership, MembershipProgress
+
+
+class Command(BaseCommand):
+
+  help = ('Rebuilds membership progress rollups from donors, reporting any that '
+          'had drifted. Use --check to report without fixing.')
+
+  def add_arguments(self, parser):
+    parser.add_argument('--check', action='store_true', default=False,
+                        help='Only report drift; do not write anything')
+
+  def handle(self, *args, **options):
+    self.stdout.write('Beginning.\n')
+
+    expected = {}
+    for ship_id in Membership.objects.values_list('pk', flat=True):
+      expected[ship_id] = dict.fromkeys(MembershipProgress.TOTALS, 0)
+
+    for donor in Donor.objects.all().iterator():
+      totals = expected[donor.membership_id]
+      for field, value in donor.get_progress_totals().iteritems():
+        totals[field] += value
+
+    existing = {progress.membership_id: progress
+                for progress in MembershipProgress.objects.all()}
+
+    drifted = 0
+    for ship_id, totals in expected.iteritems():
+      progress = existing.get(ship_id)
+      if progress is None:
+        diffs = ['missing']
+      else:
+        diffs = ['{}: {} should be {}'.format(field, getattr(progress, field), value)
+                 for field, value in sorted(totals.iteritems())
+                 if getattr(progress, field) != value]
+      if not diffs:
+        continue
+
+      drifted += 1
+      self.stdout.write('Membership {} - {}\n'.format(ship_id, ', '.join(diffs)))
+      if not options['check']:
+        MembershipProgress.objects.rebuild(ship_id)
+
+    self.stdout.write('{} of {} rollups {}.\n'.format(
+        drifted, len(expected), 'drifted' if options['check'] else 'rebuilt'))
@@ -1,34 +1,50 @@
 import datetime
 
-from django.core.management.base import BaseCommand
-from django.utils import timezone
+from django.core.management.base import BaseCommand, CommandError
+
+from sjfnw.fund import stories
+from sjfnw.fund.models import Step
+
+
+def parse_date(value):
+  try:
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+  except ValueError:
+    raise CommandError('Invalid date {}, expected YYYY-MM-DD'.format(value))
 
-from sjfnw.fund.models import Step, Membership
 
 class Command(BaseCommand):
 
-  help = 'Runs update story for missed days 6-13 to 6-14 (edit file to change the dates)'
+  help = ('Builds pending news stories. With --start (and optionally --end), '
+          'regenerates stories for every membership with steps completed in '
+          'that date range instead.')
+
+  def add_arguments(self, parser):
+    parser.add_argument('--start', help='First day to regenerate, YYYY-MM-DD')
+    parser.add_argument('--end', help='Last day to regenerate, YYYY-MM-DD. Defaults to start')
 
   def handle(self, *args, **options):
-    self.stdout.write('Beginning.\n')
-    start = datetime.datetime.strptime('2013-06-13 03:04:01',
-                                       '%Y-%m-%d %H:%M:%S')
-    start = timezone.make_aware(start, timezone.get_current_timezone())
-    end = datetime.datetime.strptime('2013-06-14 05:06:01',
-                                     '%Y-%m-%d %H:%M:%S')
-    end = timezone.make_aware(end, timezone.get_current_timezone())
-    # Get all memberships who completed a step within this range
-    ships = (Step.objects.filter(completed__range=(start, end))
-                        .values_list('donor__membership', flat=True)
-                        .distinct())
-
-    for ship_id in ships:
-      try:
-        ship = Membership.objects.get(id=ship_id)
-      except Membership.DoesNotExist:
-        self.stderr.write('Trying to update story for non-existent member ' + unicode(ship_id))
-      self.stdout.write('creating stories for ' + unicode(ship_id) + '\n')
-      for i in range(0, 6):
-        ship.update_story(start + datetime.timedelta(days=i))
-
-    self.stdout.write('Script complete.\n')
+    if not options['start']:
+      if options['end']:
+        raise CommandError('--end requires --start')
+      built = stories.build_pending_stories()
+      self.stdout.write('Built {} pending stories.\n'.format(built))
+      return
+
+    first_day = parse_date(options['start'])
+    last_day = parse_date(options['end']) if options['end'] else first_day
+    if last_day < first_day:
+      raise CommandError('--end is before --start')
+
+    # memberships & days with completed steps
+    keys = set()
+    completed = (Step.objects.filter(completed__range=stories.day_range(first_day, last_day))
+                             .values_list('donor__membership_id', 'completed'))
+    for membership_id, timestamp in completed.iterator():
+      keys.add((membership_id, stories.get_day(timestamp)))
+
+    keys = sorted(keys)
+    for i in range(0, len(keys), stories.BATCH_SIZE):
+      stories.build_stories(keys[i:i + stories.BATCH_SIZE])
+    self.stdout.write('Regenerated {} stories from {} to {}.\n'.format(
+        len(keys), first_day, last_day))
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fund', '0007_member_alter_user_field'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MembershipProgress',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('updated', models.DateTimeField(default=django.utils.timezone.now)),
+                ('contacts', models.IntegerField(default=0)),
+                ('talked', models.IntegerField(default=0)),
+                ('asked', models.IntegerField(default=0)),
+                ('estimated', models.IntegerField(default=0)),
+                ('promised', models.IntegerField(default=0)),
+                ('promised_outstanding', models.IntegerField(default=0)),
+                ('promised_pending', models.IntegerField(default=0)),
+                ('received_this', models.IntegerField(default=0)),
+                ('received_next', models.IntegerField(default=0)),
+                ('received_afternext', models.IntegerField(default=0)),
+                ('match_received', models.IntegerField(default=0)),
+                ('membership', models.OneToOneField(related_name='progress_rollup', to='fund.Membership')),
+            ],
+        ),
+    ]
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.utils import timezone
+
+TOTALS = ('contacts', 'talked', 'asked', 'estimated', 'promised',
+          'promised_outstanding', 'promised_pending', 'received_this',
+          'received_next', 'received_afternext', 'match_received')
+
+
+def build_progress(apps, schema_editor):
+    """ Create a progress rollup for each membership from its donors.
+      Mirrors Donor.get_progress_totals """
+    Membership = apps.get_model('fund', 'Membership')
+    MembershipProgress = apps.get_model('fund', 'MembershipProgress')
+    Donor = apps.get_model('fund', 'Donor')
+
+    progress = {}
+    for ship_id in Membership.objects.values_list('pk', flat=True):
+        progress[ship_id] = dict.fromkeys(TOTALS, 0)
+
+    for donor in Donor.objects.all().iterator():
+        totals = progress[donor.membership_id]
+        received = (donor.received_this + donor.received_next +
+                    donor.received_afternext + (donor.match_received or 0))
+        total_promised = donor.match_expected + (donor.promised or 0)
+
+        totals['contacts'] += 1
+        if donor.asked:
+            totals['asked'] += 1
+        elif donor.talked:
+            totals['talked'] += 1
+        if donor.amount and donor.likelihood:
+            totals['estimated'] += int(donor.amount * donor.likelihood * .01)
+        if donor.promised:
+            totals['promised'] += total_promised
+        if received > 0:
+            totals['promised_outstanding'] += max(total_promised - received, 0)
+        elif donor.promised:
+            totals['promised_outstanding'] += total_promised
+            totals['promised_pending'] += total_promised
+        totals['received_this'] += donor.received_this
+        totals['received_next'] += donor.received_next
+        totals['received_afternext'] += donor.received_afternext
+        totals['match_received'] += donor.match_received or 0
+
+    now = timezone.now()
+    MembershipProgress.objects.bulk_create([
+        MembershipProgress(membership_id=ship_id, updated=now, **totals)
+        for ship_id, totals in progress.iteritems()
+    ], batch_size=500)
+
+
+def remove_progress(apps, schema_editor):
+    MembershipProgress = apps.get_model('fund', 'MembershipProgress')
+    MembershipProgress.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fund', '0008_membership_progress'),
+    ]
+
+    operations = [
+        migrations.RunPython(build_progress, reverse_code=remove_progress)
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fund', '0009_data_membership_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='donor',
+            name='contact_key',
+            field=models.CharField(max_length=255, editable=False, db_index=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def contact_key_for(firstname, lastname, email, phone):
+    """ Mirrors Donor.contact_key_for """
+    key = ' '.join('{} {}'.format(firstname, lastname).lower().split())
+    if not lastname.strip():
+        fingerprint = email.strip().lower() or ''.join(d for d in phone if d.isdigit())
+        if fingerprint:
+            key = '{}|{}'.format(key, fingerprint)
+    return key[:255]
+
+
+def set_contact_keys(apps, schema_editor):
+    Donor = apps.get_model('fund', 'Donor')
+    donors = Donor.objects.values_list('pk', 'firstname', 'lastname', 'email', 'phone')
+    for pk, firstname, lastname, email, phone in donors.iterator():
+        Donor.objects.filter(pk=pk).update(
+            contact_key=contact_key_for(firstname, lastname, email, phone))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fund', '0010_donor_contact_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_contact_keys, reverse_code=migrations.RunPython.noop)
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fund', '0011_data_donor_contact_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingStory',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('day', models.DateField()),
+                ('marked', models.DateTimeField(default=django.utils.timezone.now)),
+                ('membership', models.ForeignKey(to='fund.Membership')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='pendingstory',
+            unique_together=set([('membership', 'day')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fund', '0012_pendingstory'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='membership',
+            index_together=set([('giving_project', 'approved'), ('giving_project', 'leader')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='donor',
+            index_together=set([('membership', 'amount')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='step',
+            index_together=set([('donor', 'completed', 'date')]),
+        ),
+        migrations.AddField(
+            model_name='newsitem',
+            name='giving_project',
+            field=models.ForeignKey(editable=False, to='fund.GivingProject', null=True),
+        ),
+    ]
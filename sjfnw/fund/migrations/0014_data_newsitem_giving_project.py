@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def set_giving_project(apps, schema_editor):
+    GivingProject = apps.get_model('fund', 'GivingProject')
+    NewsItem = apps.get_model('fund', 'NewsItem')
+    for gp_id in GivingProject.objects.values_list('pk', flat=True):
+        (NewsItem.objects.filter(membership__giving_project_id=gp_id)
+                         .update(giving_project_id=gp_id))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fund', '0013_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_giving_project, reverse_code=migrations.RunPython.noop)
+    ]
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fund', '0014_data_newsitem_giving_project'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='newsitem',
+            name='giving_project',
+            field=models.ForeignKey(editable=False, to='fund.GivingProject'),
+        ),
+        migrations.AlterIndexTogether(
+            name='newsitem',
+            index_together=set([('giving_project', 'date')]),
+        ),
+    ]
@@ -1,16 +1,49 @@
-import datetime, json, logging
+import datetime, json, logging, threading
 
 from django.contrib.auth.models import User
-from django.contrib.humanize.templatetags.humanize import intcomma
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Aggregate, Case, CharField, Count, F, Max, Sum, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
 from django.utils import timezone
 
+from sjfnw.fund import cache as fund_cache
+from sjfnw.models import DirtyFieldsMixin
 from sjfnw.fund.utils import notify_approval
 
 logger = logging.getLogger('sjfnw')
 
+class GivingProjectQuerySet(models.QuerySet):
+
+  def with_progress(self):
+    """ Annotate projects with progress totals, summed in the database from
+      their memberships' MembershipProgress rollups
+
+      Adds progress_contacts, progress_talked, progress_asked,
+      progress_estimated, progress_promised (by donors who haven't given yet)
+      and progress_received (including match)
+    """
+    def total(*fields):
+      expression = F('membership__progress_rollup__' + fields[0])
+      for field in fields[1:]:
+        expression += F('membership__progress_rollup__' + field)
+      return Coalesce(Sum(expression), 0, output_field=models.IntegerField())
+
+    return self.annotate(
+      progress_contacts=total('contacts'),
+      progress_talked=total('talked'),
+      progress_asked=total('asked'),
+      progress_estimated=total('estimated'),
+      progress_promised=total('promised_pending'),
+      progress_received=total('received_this', 'received_next',
+                              'received_afternext', 'match_received')
+    )
+
+
 class GivingProject(models.Model):
+  objects = GivingProjectQuerySet.as_manager()
+
   title = models.CharField(max_length=255)
 
   public = models.BooleanField(default=True,
@@ -64,6 +97,8 @@ class GivingProject(models.Model):
     # prune CR (from Windows) that would result in extra line breaks
     self.suggested_steps = self.suggested_steps.replace('\r', '')
     super(GivingProject, self).save(*args, **kwargs)
+    # site_visits affects which grants are shown
+    fund_cache.clear_grants(self.pk)
 
   def get_suggested_steps(self):
     """ Return suggested steps as a list """
@@ -85,11 +120,11 @@ class GivingProject(models.Model):
     return self.fundraising_training <= timezone.now()
 
   def estimated(self):
-    donors = Donor.objects.filter(membership__giving_project=self)
-    estimated = 0
-    for donor in donors:
-      estimated += donor.estimated()
-    return estimated
+    if hasattr(self, 'progress_estimated'): # from with_progress
+      return self.progress_estimated
+    return (GivingProject.objects.with_progress()
+                                 .values_list('progress_estimated', flat=True)
+                                 .get(pk=self.pk))
 
 
 class MemberManager(models.Manager):
@@ -110,8 +145,8 @@ class Member(models.Model):
   objects = MemberManager()
 
   user = models.OneToOneField(User)
-  first_name = models.CharField(max_length=100)
-  last_name = models.CharField(max_length=100)
+  first_name = models.CharField(max_length=100, db_index=True)
+  last_name = models.CharField(max_length=100, db_index=True)
 
   giving_project = models.ManyToManyField(GivingProject, through='Membership')
   current = models.IntegerField(default=0) # pk of current membership
@@ -123,7 +158,14 @@ class Member(models.Model):
     ordering = ['first_name', 'last_name']
 
 
-class Membership(models.Model):
+def clear_member_current_membership(sender, instance, **kwargs):
+  fund_cache.clear_current_membership(instance.user_id)
+
+post_save.connect(clear_member_current_membership, sender=Member)
+post_delete.connect(clear_member_current_membership, sender=Member)
+
+
+class Membership(DirtyFieldsMixin, models.Model):
   """ Represents a relationship between a member and a giving project """
 
   giving_project = models.ForeignKey(GivingProject)
@@ -146,46 +188,38 @@ class Membership(models.Model):
   class Meta:
     ordering = ['member']
     unique_together = ('giving_project', 'member')
+    index_together = [('giving_project', 'approved'), ('giving_project', 'leader')]
 
   def __unicode__(self):
     return u'{}, {}'.format(self.member, self.giving_project)
 
   def save(self, skip=False, *args, **kwargs):
     """ Checks whether to send an approval email unless skip is True """
-    if not skip:
-      try:
-        previous = Membership.objects.get(pk=self.pk)
-        logger.debug('Previously: %s, now %s ', previous.approved, self.approved)
-        if self.approved and not previous.approved:
-          logger.debug('Detected approval on save for ' + unicode(self))
-          notify_approval(self)
-      except Membership.DoesNotExist: # this is the first save for this membership
-        pass
+    if not skip and self.approved and not self._state.adding:
+      if not self.get_saved_value('approved'):
+        logger.debug('Detected approval on save for ' + unicode(self))
+        notify_approval(self)
     super(Membership, self).save(*args, **kwargs)
 
+  def get_progress_rollup(self):
+    """ Get this membership's MembershipProgress, building it if needed """
+    try:
+      return self.progress_rollup
+    except MembershipProgress.DoesNotExist:
+      return MembershipProgress.objects.rebuild(self.pk)
+
   def get_progress(self):
     """ Compiles progress metrics (estimated, promised, received by year) """
-    progress = {
-      'estimated': 0,
-      'promised': 0,
-      'received_this': 0,
-      'received_next': 0,
-      'received_afternext': 0
+    rollup = self.get_progress_rollup()
+    return {
+      'estimated': rollup.estimated,
+      'promised': rollup.promised,
+      'received_this': rollup.received_this,
+      'received_next': rollup.received_next,
+      'received_afternext': rollup.received_afternext,
+      'received_total': (rollup.received_this + rollup.received_next +
+                         rollup.received_afternext)
     }
-    donors = self.donor_set.all()
-
-    for donor in donors:
-      progress['estimated'] += donor.estimated()
-      if donor.promised:
-        progress['promised'] += donor.total_promised()
-      progress['received_this'] += donor.received_this
-      progress['received_next'] += donor.received_next
-      progress['received_afternext'] += donor.received_afternext
-
-    progress['received_total'] = (progress['received_this'] +
-                                 progress['received_next'] +
-                                 progress['received_afternext'])
-    return progress
 
   def overdue_steps(self, get_next=False):
     cutoff = timezone.now().date() - datetime.timedelta(days=1)
@@ -201,65 +235,245 @@ class Membership(models.Model):
       return count, steps[0]
 
   def update_story(self, timestamp):
-    logger.info('update_story running for membership %d from %s', self.pk, timestamp)
+    """ Rebuild this membership's news story for the day of timestamp now.
+      Views should use stories.mark_pending instead """
+    from sjfnw.fund import stories
+    stories.build_stories([(self.pk, stories.get_day(timestamp))])
 
-    day_min = timestamp.replace(hour=0, minute=0, second=0)
-    day_max = timestamp.replace(hour=23, minute=59, second=59)
 
-    steps = Step.objects.filter(
-        donor__membership_id=self.pk, completed__range=(day_min, day_max)
-      ).select_related('donor')
+def bump_membership(sender, instance, **kwargs):
+  fund_cache.bump_memberships(instance.pk)
+
+post_save.connect(bump_membership, sender=Membership)
+post_delete.connect(bump_membership, sender=Membership)
+
 
-    if not steps:
-      logger.warning('update_story called on %d but no steps were completed', self.pk)
+class MembershipProgressManager(models.Manager):
+
+  def rebuild(self, membership_id):
+    """ Recalculate a membership's rollup from its donors """
+    totals = sum_progress_totals(Donor.objects.filter(membership_id=membership_id))
+    totals['updated'] = timezone.now()
+    progress, _ = self.update_or_create(membership_id=membership_id, defaults=totals)
+    return progress
+
+  def record_change(self, previous, current, rebuild_missing=True):
+    """ Apply the difference between two donor snapshots to the affected rollups
+
+      Snapshots are (membership_id, totals) tuples as returned by
+      Donor.get_progress_snapshot, or None for a donor that didn't exist before
+      or doesn't exist anymore. Rollups that don't exist yet are rebuilt from
+      scratch unless rebuild_missing is False.
+    """
+    if previous and current and previous[0] == current[0]:
+      delta = {field: current[1][field] - previous[1][field] for field in current[1]}
+      self._add(current[0], delta, rebuild_missing)
       return
+    if previous:
+      delta = {field: -value for field, value in previous[1].iteritems()}
+      self._add(previous[0], delta, rebuild_missing)
+    if current:
+      self._add(current[0], current[1], rebuild_missing)
+
+  def _add(self, membership_id, delta, rebuild_missing):
+    changes = {field: F(field) + value for field, value in delta.iteritems() if value}
+    if not changes:
+      return
+    changes['updated'] = timezone.now()
+    updated = self.filter(membership_id=membership_id).update(**changes)
+    if not updated and rebuild_missing:
+      logger.info('No progress rollup for membership %s, building it', membership_id)
+      self.rebuild(membership_id)
 
-    # get or create NewsItem instance
-    logger.debug('Checking for story with date between %s and %s', day_min, day_max)
-    search = self.newsitem_set.filter(date__range=(day_min, day_max))
-    story = search[0] if search else NewsItem(date=timestamp, membership=self)
-
-    # tally news-worthy milestones from steps
-    talked, asked, promised = 0, 0, 0
-    talkedlist = [] # used to make sure each individual donor only counts once
-    askedlist = []
-    for step in steps:
-      if step.asked:
-        asked += 1
-        askedlist.append(step.donor_id)
-        if step.donor_id in talkedlist: # don't count talked + asked for same donor
-          talked -= 1
-          talkedlist.remove(step.donor)
-      elif step.donor not in talkedlist and step.donor not in askedlist:
-        talked += 1
-        talkedlist.append(step.donor)
-      if step.promised and step.promised > 0:
-        promised += step.promised
-
-    # create summary blurb
-    summary = self.member.first_name
-    if talked > 0:
-      summary += u' talked to {} {}'.format(talked, 'people' if talked > 1 else 'person')
-      if asked > 0:
-        if promised > 0:
-          summary += u', asked {}'.format(asked)
-        else:
-          summary += u' and asked {}'.format(asked)
-    elif asked > 0:
-      summary += u' asked {} {}'.format(asked, 'people' if asked > 1 else 'person')
-    else:
-      logger.error('News update with 0 talked, 0 asked. Story pk: %d', story.pk)
-    if promised > 0:
-      summary += u' and got ${} in promises'.format(intcomma(promised))
-    summary += u'.'
-    logger.info(summary)
-    story.summary = summary
-    story.updated = timezone.now()
-    story.save()
-    logger.info('Story saved')
-
-
-class Donor(models.Model):
+
+class MembershipProgress(models.Model):
+  """ Running totals of a membership's donors, so progress can be displayed
+    without loading every donor
+
+    Kept in sync by Donor.save, donor deletion and DonorQuerySet.update. Raw
+    SQL and migrations bypass these, so use the rebuild_progress management
+    command to check for or fix drift after them.
+  """
+  TOTALS = ('contacts', 'talked', 'asked', 'estimated', 'promised',
+            'promised_outstanding', 'promised_pending', 'received_this',
+            'received_next', 'received_afternext', 'match_received')
+
+  objects = MembershipProgressManager()
+
+  membership = models.OneToOneField(Membership, related_name='progress_rollup')
+  updated = models.DateTimeField(default=timezone.now)
+
+  contacts = models.IntegerField(default=0)
+  talked = models.IntegerField(default=0) # talked to but not asked
+  asked = models.IntegerField(default=0)
+  estimated = models.IntegerField(default=0)
+  # total promised (incl. match) by donors who promised
+  promised = models.IntegerField(default=0)
+  # promised but not yet received
+  promised_outstanding = models.IntegerField(default=0)
+  # promised by donors with nothing received yet
+  promised_pending = models.IntegerField(default=0)
+  received_this = models.IntegerField(default=0)
+  received_next = models.IntegerField(default=0)
+  received_afternext = models.IntegerField(default=0)
+  match_received = models.IntegerField(default=0)
+
+  def __unicode__(self):
+    return u'Progress for membership {}'.format(self.membership_id)
+
+  def contacts_remaining(self):
+    return self.contacts - self.talked - self.asked
+
+  def received(self):
+    """ Total received, including match """
+    return (self.received_this + self.received_next + self.received_afternext +
+            self.match_received)
+
+
+def sum_progress_totals(donors):
+  """ Add up MembershipProgress totals for the given donors """
+  totals = dict.fromkeys(MembershipProgress.TOTALS, 0)
+  for donor in donors:
+    for field, value in donor.get_progress_totals().iteritems():
+      totals[field] += value
+  return totals
+
+
+class GroupConcat(Aggregate):
+  """ Comma separated non-empty values. Supported by MySQL and sqlite """
+  function = 'GROUP_CONCAT'
+  template = "%(function)s(NULLIF(%(expressions)s, ''))"
+
+  def __init__(self, expression, **extra):
+    super(GroupConcat, self).__init__(expression, output_field=CharField(), **extra)
+
+
+class DonorQuerySet(models.QuerySet):
+
+  def update(self, **kwargs):
+    """ Update donors, rebuilding the progress rollups of affected memberships
+      if any progress field is changed """
+    fields = set(name[:-3] if name.endswith('_id') else name for name in kwargs)
+    if not fields.intersection(Donor.PROGRESS_UPDATE_FIELDS):
+      return super(DonorQuerySet, self).update(**kwargs)
+    with transaction.atomic():
+      membership_ids = set(self.values_list('membership_id', flat=True).distinct())
+      updated = super(DonorQuerySet, self).update(**kwargs)
+      new_membership = kwargs.get('membership_id', kwargs.get('membership'))
+      if new_membership is not None:
+        membership_ids.add(getattr(new_membership, 'pk', new_membership))
+      for membership_id in membership_ids:
+        MembershipProgress.objects.rebuild(membership_id)
+    fund_cache.bump_memberships(*membership_ids)
+    return updated
+
+  def bulk_add(self, donors):
+    """ Insert new donors with a single query and add them to their memberships'
+      progress rollups. Donors will not have pks set """
+    if not donors:
+      return
+    for donor in donors: # bulk_create doesn't send pre_save
+      set_contact_key(Donor, donor)
+    with transaction.atomic():
+      self.bulk_create(donors)
+      by_membership = {}
+      for donor in donors:
+        by_membership.setdefault(donor.membership_id, []).append(donor)
+      for membership_id, added in by_membership.iteritems():
+        MembershipProgress.objects.record_change(
+            None, (membership_id, sum_progress_totals(added)))
+    fund_cache.bump_memberships(*by_membership.keys())
+
+  def merged_contacts(self):
+    """ One row per distinct contact (see Donor.contact_key), merging the
+      contact info and notes of donors that share a key. Phone and email are
+      the most recently added donor's non-blank values
+
+      Returns a list of dicts with contact_key, contact_firstname,
+      contact_lastname, contact_phone, contact_email and contact_notes
+    """
+    contacts = list(self.values('contact_key')
+                        .annotate(contact_firstname=Max('firstname'),
+                                  contact_lastname=Max('lastname'),
+                                  contact_notes=GroupConcat('notes'))
+                        .order_by('contact_firstname', 'contact_lastname'))
+
+    latest = {} # contact key -> {'contact_phone': ..., 'contact_email': ...}
+    rows = (self.exclude(phone='', email='')
+                .order_by('-added')
+                .values_list('contact_key', 'phone', 'email'))
+    for key, phone, email in rows:
+      info = latest.setdefault(key, {'contact_phone': '', 'contact_email': ''})
+      info['contact_phone'] = info['contact_phone'] or phone
+      info['contact_email'] = info['contact_email'] or email
+
+    for contact in contacts:
+      contact.update(latest.get(contact['contact_key'], {'contact_phone': '', 'contact_email': ''}))
+    return contacts
+
+  def set_estimates(self, estimates):
+    """ Update amount & likelihood of many donors with a single query
+
+      Args:
+        estimates: dict of donor id to (amount, likelihood). Donors not in
+          this queryset are ignored
+    """
+    if not estimates:
+      return
+    with transaction.atomic():
+      current = self.filter(pk__in=estimates.keys()).values_list(
+          'pk', 'membership_id', 'amount', 'likelihood')
+      before, after = {}, {}
+      for pk, membership_id, amount, likelihood in current:
+        new_amount, new_likelihood = estimates[pk]
+        before[membership_id] = before.get(membership_id, 0) + Donor(
+            amount=amount, likelihood=likelihood).estimated()
+        after[membership_id] = after.get(membership_id, 0) + Donor(
+            amount=new_amount, likelihood=new_likelihood).estimated()
+      if not before:
+        return
+
+      field = models.PositiveIntegerField()
+      # rollups are adjusted below rather than rebuilt by DonorQuerySet.update
+      super(DonorQuerySet, self.filter(pk__in=estimates.keys())).update(
+          amount=Case(*[When(pk=pk, then=amount)
+                        for pk, (amount, _) in estimates.iteritems()], output_field=field),
+          likelihood=Case(*[When(pk=pk, then=likelihood)
+                            for pk, (_, likelihood) in estimates.iteritems()],
+                          output_field=field))
+      for membership_id, estimated in after.iteritems():
+        MembershipProgress.objects.record_change(
+            (membership_id, {'estimated': before[membership_id]}),
+            (membership_id, {'estimated': estimated}))
+    fund_cache.bump_memberships(*after.keys())
+
+  def needing_next_step(self):
+    """ Donors that haven't given or promised and have no incomplete step """
+    return (self.filter(promised__isnull=True, received_this=0, received_next=0,
+                        received_afternext=0, match_received=0)
+                .annotate(open_steps=Count(Case(When(step__completed__isnull=True,
+                                                     then='step__id'))))
+                .filter(open_steps=0))
+
+  def bulk_add_steps(self, steps):
+    """ Insert steps with a single query
+
+      Args:
+        steps: list of (donor id, date, description). Steps for donors not
+          in this queryset are ignored
+
+      Returns list of the Steps created (without pks)
+    """
+    memberships = dict(self.filter(pk__in=[step[0] for step in steps])
+                           .values_list('pk', 'membership_id'))
+    new_steps = [Step(donor_id=donor_id, date=date, description=description)
+                 for donor_id, date, description in steps if donor_id in memberships]
+    Step.objects.bulk_create(new_steps)
+    fund_cache.bump_memberships(*set(memberships[step.donor_id] for step in new_steps))
+    return new_steps
+
+
+class Donor(DirtyFieldsMixin, models.Model):
   LIKELY_TO_JOIN_CHOICES = choices = (
       ('', '---------'),
       (3, '3 - Definitely'),
@@ -302,9 +516,23 @@ class Donor(models.Model):
   phone = models.CharField(max_length=15, blank=True)
   email = models.EmailField(max_length=100, blank=True)
   notes = models.TextField(blank=True)
+  # normalized name/contact info identifying the same person across
+  # memberships. set on pre_save - see contact_key_for
+  contact_key = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
+
+  # fields used by get_progress_totals
+  PROGRESS_FIELDS = ('membership_id', 'amount', 'likelihood', 'talked', 'asked',
+                     'promised', 'match_expected', 'received_this',
+                     'received_next', 'received_afternext', 'match_received')
+  # field names as given to DonorQuerySet.update
+  PROGRESS_UPDATE_FIELDS = frozenset(field[:-3] if field.endswith('_id') else field
+                                     for field in PROGRESS_FIELDS)
+
+  objects = DonorQuerySet.as_manager()
 
   class Meta:
     ordering = ['firstname', 'lastname']
+    index_together = [('membership', 'amount')]
 
   def __unicode__(self):
     if self.lastname:
@@ -312,6 +540,68 @@ class Donor(models.Model):
     else:
       return self.firstname
 
+  @staticmethod
+  def name_key(firstname, lastname):
+    """ Normalized full name, for finding duplicate contacts """
+    return u' '.join(u'{} {}'.format(firstname, lastname).lower().split())
+
+  @staticmethod
+  def contact_key_for(firstname, lastname, email, phone):
+    """ Normalized full name. Without a last name, first name plus email or
+      phone digits so that unrelated people with the same first name differ """
+    key = Donor.name_key(firstname, lastname)
+    if not lastname.strip():
+      fingerprint = email.strip().lower() or u''.join(d for d in phone if d.isdigit())
+      if fingerprint:
+        key = u'{}|{}'.format(key, fingerprint)
+    return key[:255]
+
+  def save(self, *args, **kwargs):
+    """ Saves donor and applies any change in progress to MembershipProgress """
+    previous = None if self._state.adding else self.get_saved_progress_snapshot()
+    # without a snapshot we can't know what this donor counted for before
+    known = previous is not None or self._state.adding
+    super(Donor, self).save(*args, **kwargs)
+    if known:
+      MembershipProgress.objects.record_change(previous, self.get_progress_snapshot())
+    else:
+      MembershipProgress.objects.rebuild(self.membership_id)
+
+  def get_progress_snapshot(self):
+    return self.membership_id, self.get_progress_totals()
+
+  def get_saved_progress_snapshot(self):
+    """ Progress snapshot as of load or the last save, from DirtyFieldsMixin's
+      saved values. None if any progress field wasn't loaded """
+    saved = self._loaded_values
+    if saved is None or not all(field in saved for field in self.PROGRESS_FIELDS):
+      return None
+    return Donor(**{field: saved[field] for field in self.PROGRESS_FIELDS}).get_progress_snapshot()
+
+  def get_progress_totals(self):
+    """ This donor's contribution to each of the MembershipProgress totals """
+    received = self.received()
+    total_promised = self.total_promised()
+    if received > 0:
+      outstanding, pending = max(total_promised - received, 0), 0
+    elif self.promised:
+      outstanding = pending = total_promised
+    else:
+      outstanding = pending = 0
+    return {
+      'contacts': 1,
+      'talked': 1 if self.talked and not self.asked else 0,
+      'asked': 1 if self.asked else 0,
+      'estimated': self.estimated(),
+      'promised': total_promised if self.promised else 0,
+      'promised_outstanding': outstanding,
+      'promised_pending': pending,
+      'received_this': self.received_this,
+      'received_next': self.received_next,
+      'received_afternext': self.received_afternext,
+      'match_received': self.match_received or 0
+    }
+
   def estimated(self):
     if self.amount and self.likelihood:
       return int(self.amount * self.likelihood * .01)
@@ -346,6 +636,67 @@ class Donor(models.Model):
     return self.match_expected + (self.promised or 0)
 
 
+_deleting = threading.local()
+
+
+def _get_deleting(model):
+  """ Ids of model's objects whose deletion is in progress in this thread, so
+    that signal handlers for objects deleted along with them can skip work """
+  if not hasattr(_deleting, 'ids'):
+    _deleting.ids = {}
+  return _deleting.ids.setdefault(model, set())
+
+
+def start_delete(sender, instance, **kwargs):
+  _get_deleting(sender).add(instance.pk)
+
+
+def finish_delete(sender, instance, **kwargs):
+  _get_deleting(sender).discard(instance.pk)
+
+pre_delete.connect(start_delete, sender=Membership)
+post_delete.connect(finish_delete, sender=Membership)
+pre_delete.connect(start_delete, sender=Donor)
+post_delete.connect(finish_delete, sender=Donor)
+
+
+def remove_donor_progress(sender, instance, **kwargs):
+  """ Subtract deleted donors from MembershipProgress
+
+    Handled by signal rather than Donor.delete so bulk deletes (e.g. from the
+    admin) are included. Skipped when the donor's membership is being deleted,
+    since its rollup is deleted along with it.
+  """
+  if instance.membership_id in _get_deleting(Membership):
+    return
+  snapshot = instance.get_saved_progress_snapshot() or instance.get_progress_snapshot()
+  # if the rollup is gone its membership is being deleted too
+  MembershipProgress.objects.record_change(snapshot, None, rebuild_missing=False)
+
+post_delete.connect(remove_donor_progress, sender=Donor)
+
+
+def set_contact_key(sender, instance, **kwargs):
+  """ Keep contact_key in sync with name & contact info. Signal rather than
+    Donor.save so fixtures (raw saves) get keys too """
+  instance.contact_key = Donor.contact_key_for(instance.firstname, instance.lastname,
+                                               instance.email, instance.phone)
+
+pre_save.connect(set_contact_key, sender=Donor)
+
+
+def bump_donor_membership(sender, instance, **kwargs):
+  fund_cache.bump_memberships(instance.membership_id)
+
+
+def bump_deleted_donor_membership(sender, instance, **kwargs):
+  if instance.membership_id not in _get_deleting(Membership): # that deletion bumps it
+    fund_cache.bump_memberships(instance.membership_id)
+
+post_save.connect(bump_donor_membership, sender=Donor)
+post_delete.connect(bump_deleted_donor_membership, sender=Donor)
+
+
 class Step(models.Model):
   created = models.DateTimeField(default=timezone.now)
   date = models.DateField(verbose_name='Date')
@@ -355,19 +706,71 @@ class Step(models.Model):
   asked = models.BooleanField(default=False)
   promised = models.PositiveIntegerField(blank=True, null=True)
 
+  class Meta:
+    index_together = [('donor', 'completed', 'date')]
+
   def __unicode__(self):
     return u'{:%m/%d/%y} - {}'.format(self.date, self.description)
 
 
+def bump_step_membership(sender, instance, **kwargs):
+  donor = getattr(instance, '_donor_cache', None)
+  if donor is not None:
+    membership_id = donor.membership_id
+  else:
+    membership_id = (Donor.objects.filter(pk=instance.donor_id)
+                                  .values_list('membership_id', flat=True).first())
+  if membership_id is not None: # otherwise the donor was deleted, which bumps it
+    fund_cache.bump_memberships(membership_id)
+
+
+def bump_deleted_step_membership(sender, instance, **kwargs):
+  if instance.donor_id not in _get_deleting(Donor): # that deletion bumps it
+    bump_step_membership(sender, instance, **kwargs)
+
+post_save.connect(bump_step_membership, sender=Step)
+post_delete.connect(bump_deleted_step_membership, sender=Step)
+
+
 class NewsItem(models.Model):
   date = models.DateTimeField(default=timezone.now)
   updated = models.DateTimeField(default=timezone.now)
   membership = models.ForeignKey(Membership)
+  # copy of membership.giving_project, so project news can use an index
+  giving_project = models.ForeignKey(GivingProject, editable=False)
   summary = models.TextField()
 
+  class Meta:
+    index_together = [('giving_project', 'date')]
+
   def __unicode__(self):
     return unicode(self.summary)
 
+  def save(self, *args, **kwargs):
+    if not self.giving_project_id:
+      self.giving_project_id = self.membership.giving_project_id
+    super(NewsItem, self).save(*args, **kwargs)
+
+
+class PendingStory(models.Model):
+  """ A membership's day whose news story needs to be rebuilt. See fund.stories """
+  membership = models.ForeignKey(Membership)
+  day = models.DateField()
+  marked = models.DateTimeField(default=timezone.now)
+
+  class Meta:
+    unique_together = ('membership', 'day')
+
+  def __unicode__(self):
+    return u'{} {}'.format(self.membership, self.day)
+
+
+def clear_cached_news(sender, instance, **kwargs):
+  fund_cache.clear_news(instance.giving_project_id)
+
+post_save.connect(clear_cached_news, sender=NewsItem)
+post_delete.connect(clear_cached_news, sender=NewsItem)
+
 
 class Resource(models.Model):
   created = models.DateTimeField(null=True, blank=True, default=timezone.now)
@@ -391,6 +794,13 @@ class ProjectResource(models.Model): # ties resource to project
     return u'{} - {} - {}'.format(self.giving_project, self.session, self.resource)
 
 
+def bump_project(sender, instance, **kwargs):
+  fund_cache.bump_projects(instance.giving_project_id)
+
+post_save.connect(bump_project, sender=ProjectResource)
+post_delete.connect(bump_project, sender=ProjectResource)
+
+
 class Survey(models.Model):
   created = models.DateTimeField(default=timezone.now)
   updated = models.DateTimeField(default=timezone.now)
@@ -428,6 +838,9 @@ class GPSurvey(models.Model):
   def __unicode__(self):
     return u'{} - {}'.format(self.giving_project.title, self.survey.title)
 
+post_save.connect(bump_project, sender=GPSurvey)
+post_delete.connect(bump_project, sender=GPSurvey)
+
 
 class SurveyResponse(models.Model):
   date = models.DateTimeField(default=timezone.now)
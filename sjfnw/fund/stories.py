@@ -0,0 +1,158 @@
+""" Building members' daily news stories from their completed steps
+
+  Completing a step marks that membership's day as pending rather than
+  rebuilding its story right away. A single task then rebuilds every pending
+  story in batches, so a member completing several steps in a row only costs
+  one rebuild.
+"""
+import datetime
+import logging
+import time
+
+from django.contrib.humanize.templatetags.humanize import intcomma
+from django.db.models import Case, TextField, Value, When
+from django.utils import timezone
+
+from sjfnw import utils
+from sjfnw.fund import cache as fund_cache
+from sjfnw.fund.models import Membership, NewsItem, PendingStory, Step
+
+logger = logging.getLogger('sjfnw')
+
+# seconds to wait for more steps before building stories
+BUILD_DELAY = 60
+BATCH_SIZE = 100
+
+
+def get_day(timestamp):
+  return timezone.localtime(timestamp).date()
+
+
+def day_range(first_day, last_day):
+  """ Aware datetimes spanning first_day through the end of last_day """
+  tz = timezone.get_current_timezone()
+  start = timezone.make_aware(datetime.datetime.combine(first_day, datetime.time.min), tz)
+  end = timezone.make_aware(datetime.datetime.combine(last_day, datetime.time.max), tz)
+  return start, end
+
+
+def mark_pending(membership_id, timestamp):
+  """ Flag a membership's story for the day of timestamp to be rebuilt, and
+    schedule a build if one isn't already scheduled """
+  PendingStory.objects.update_or_create(membership_id=membership_id, day=get_day(timestamp),
+                                        defaults={'marked': timezone.now()})
+  schedule_build()
+
+
+def schedule_build():
+  """ Build pending stories in a task after BUILD_DELAY. Tasks are named by
+    time window so marks within the same window share one task. Locally,
+    build immediately """
+  name = 'build-stories-{}'.format(int(time.time()) // BUILD_DELAY)
+  utils.defer(build_pending_stories, _name=name, _countdown=BUILD_DELAY)
+
+
+def build_pending_stories():
+  """ Rebuild all pending stories, BATCH_SIZE at a time """
+  built = 0
+  while True:
+    started = timezone.now()
+    pending = list(PendingStory.objects.order_by('marked')
+                                       .values_list('pk', 'membership_id', 'day')[:BATCH_SIZE])
+    if not pending:
+      break
+    build_stories([(membership_id, day) for _, membership_id, day in pending])
+    # keep any that were marked again while building
+    PendingStory.objects.filter(pk__in=[row[0] for row in pending], marked__lt=started).delete()
+    built += len(pending)
+  logger.info('Built %d pending stories', built)
+  return built
+
+
+def build_stories(keys):
+  """ Create or update the news story for each (membership_id, day) in keys
+
+    Uses a fixed number of queries regardless of the number of keys. Days with
+    no completed steps are left alone.
+  """
+  keys = set(keys)
+  if not keys:
+    return
+  membership_ids = set(key[0] for key in keys)
+  start, end = day_range(min(key[1] for key in keys), max(key[1] for key in keys))
+
+  # tally per (membership, day): donors asked, donors talked to, promised total, latest step
+  tallies = {}
+  steps = (Step.objects.filter(donor__membership_id__in=membership_ids,
+                               completed__range=(start, end))
+                       .values_list('donor__membership_id', 'donor_id', 'completed',
+                                    'asked', 'promised'))
+  for membership_id, donor_id, completed, asked, promised in steps:
+    key = (membership_id, get_day(completed))
+    if key not in keys:
+      continue
+    tally = tallies.setdefault(key, {'asked': set(), 'donors': set(), 'promised': 0,
+                                     'latest': completed})
+    tally['donors'].add(donor_id)
+    if asked:
+      tally['asked'].add(donor_id)
+    tally['promised'] += promised or 0
+    tally['latest'] = max(tally['latest'], completed)
+
+  if len(tallies) < len(keys):
+    logger.warning('No completed steps for %d of %d stories', len(keys) - len(tallies), len(keys))
+  if not tallies:
+    return
+
+  ships = {pk: (first_name, gp_id) for pk, first_name, gp_id in
+           Membership.objects.filter(pk__in=membership_ids)
+                             .values_list('pk', 'member__first_name', 'giving_project_id')}
+  existing = {}
+  for story in (NewsItem.objects.filter(membership_id__in=membership_ids, date__range=(start, end))
+                                .order_by('date')
+                                .only('pk', 'membership', 'date')):
+    existing.setdefault((story.membership_id, get_day(story.date)), story.pk)
+
+  now = timezone.now()
+  new_stories, summaries = [], {}
+  for key, tally in tallies.iteritems():
+    summary = get_summary(ships[key[0]][0], tally)
+    if key in existing:
+      summaries[existing[key]] = summary
+    else:
+      new_stories.append(NewsItem(membership_id=key[0], giving_project_id=ships[key[0]][1],
+                                  date=tally['latest'], updated=now, summary=summary))
+
+  if summaries:
+    NewsItem.objects.filter(pk__in=summaries.keys()).update(
+        summary=Case(*[When(pk=pk, then=Value(summary)) for pk, summary in summaries.iteritems()],
+                     output_field=TextField()),
+        updated=now)
+  NewsItem.objects.bulk_create(new_stories)
+  logger.info('Stories: %d updated, %d created', len(summaries), len(new_stories))
+
+  # bulk writes don't send signals, so clear cached news here
+  for gp_id in set(ships[key[0]][1] for key in tallies):
+    fund_cache.clear_news(gp_id)
+
+
+def get_summary(first_name, tally):
+  """ Summary blurb for a day's tally. Each donor counts once, as asked if
+    they were asked in any step or as talked to otherwise """
+  asked = len(tally['asked'])
+  talked = len(tally['donors']) - asked
+  promised = tally['promised']
+
+  summary = first_name
+  if talked > 0:
+    summary += u' talked to {} {}'.format(talked, 'people' if talked > 1 else 'person')
+    if asked > 0:
+      if promised > 0:
+        summary += u', asked {}'.format(asked)
+      else:
+        summary += u' and asked {}'.format(asked)
+  elif asked > 0:
+    summary += u' asked {} {}'.format(asked, 'people' if asked > 1 else 'person')
+  if promised > 0:
+    summary += u' and got ${} in promises'.format(intcomma(promised))
+  return summary + u'.'
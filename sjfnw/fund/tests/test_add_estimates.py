@@ -22,6 +22,7 @@ class AddEstimates(BaseFundTestCase):
     member = models.Member.objects.get(pk=self.member_id)
     member.current = membership.pk
     member.save()
+    self.donor_membership_id = membership.pk
 
     # create donors without estimates
     donor = models.Donor(firstname='Al', lastname='Bautista', membership=membership)
@@ -122,3 +123,33 @@ class AddEstimates(BaseFundTestCase):
     self.assertRegexpMatches(errors[0]['likelihood'][0], 'Enter a whole number')
     self.assertRegexpMatches(errors[1]['amount'][0], 'Must be greater than')
     self.assertRegexpMatches(errors[1]['likelihood'][0], 'Ensure this value is less than')
+
+  def test_success_updates_progress(self):
+    form_data = self.base_form_data.copy()
+    form_data['form-0-amount'] = u'200'
+    form_data['form-0-likelihood'] = u'30'
+    form_data['form-1-amount'] = u'500'
+    form_data['form-1-likelihood'] = u'10'
+
+    response = self.client.post(self.post_url, form_data, follow=True)
+
+    self.assertEqual(response.content, 'success')
+    donors = models.Donor.objects.filter(membership_id=self.donor_membership_id)
+    progress = models.MembershipProgress.objects.get(membership_id=self.donor_membership_id)
+    self.assertEqual(progress.estimated, sum(donor.estimated() for donor in donors))
+
+  def test_other_membership_ignored(self):
+    other = models.Donor(firstname='Not', lastname='Mine', membership_id=self.ship_id)
+    other.save()
+    form_data = self.base_form_data.copy()
+    form_data['form-0-donor'] = unicode(other.pk)
+    form_data['form-0-amount'] = u'200'
+    form_data['form-0-likelihood'] = u'30'
+    form_data['form-1-amount'] = u'500'
+    form_data['form-1-likelihood'] = u'10'
+
+    response = self.client.post(self.post_url, form_data, follow=True)
+
+    self.assertEqual(response.content, 'success')
+    self.assertIsNone(models.Donor.objects.get(pk=other.pk).amount)
+    self.assertEqual(models.Donor.objects.get(pk=self.donor_id2).amount, 500)
@@ -196,3 +196,49 @@ class AddMultipleDonorsPost(BaseFundTestCase):
 
     donors = models.Donor.objects.filter(membership_id=self.post_id)
     self.assertEqual(len(donors), 0)
+
+  def test_post_duplicates(self):
+    """ Existing names are matched ignoring case & spacing; others are saved
+      and added to the progress rollup """
+    models.Donor(membership_id=self.post_id, firstname='Seattle', lastname='Washington').save()
+
+    self.form_data['form-0-firstname'] = u'Fürst'
+    self.form_data['form-0-amount'] = u'40'
+    self.form_data['form-0-likelihood'] = u'90'
+    self.form_data['form-1-firstname'] = u' seattle'
+    self.form_data['form-1-lastname'] = u'WASHINGTON '
+    self.form_data['form-1-amount'] = u'500'
+    self.form_data['form-1-likelihood'] = u'50'
+
+    response = self.client.post(self.url, self.form_data, follow=True)
+
+    self.assertTemplateUsed(response, 'fund/forms/add_contacts.html')
+    self.assertRegexpMatches(response.context['empty_error'], 'same name')
+    duplicates = [form.initial for form in response.context['formset'].forms
+                  if form.initial.get('confirm') == u'1']
+    self.assertEqual(len(duplicates), 1)
+    self.assertEqual(duplicates[0]['amount'], 500)
+
+    self.assert_count(models.Donor.objects.filter(membership_id=self.post_id), 2)
+    progress = models.Membership.objects.get(pk=self.post_id).get_progress_rollup()
+    self.assertEqual(progress.contacts, 2)
+    self.assertEqual(progress.estimated, 36)
+
+    # confirm the duplicate
+    confirm_data = {
+      'form-TOTAL_FORMS': u'1',
+      'form-INITIAL_FORMS': u'1',
+      'form-MAX_NUM_FORMS': u'1000',
+      'form-0-firstname': u'Seattle',
+      'form-0-lastname': u'Washington',
+      'form-0-amount': u'500',
+      'form-0-likelihood': u'50',
+      'form-0-confirm': u'1'
+    }
+    response = self.client.post(self.url, confirm_data, follow=True)
+
+    self.assertEqual(response.content, 'success')
+    self.assert_count(models.Donor.objects.filter(membership_id=self.post_id), 3)
+    progress = models.Membership.objects.get(pk=self.post_id).get_progress_rollup()
+    self.assertEqual(progress.contacts, 3)
+    self.assertEqual(progress.estimated, 286)
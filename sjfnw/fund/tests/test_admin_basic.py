@@ -1,5 +1,15 @@
+import datetime
+import json
 import logging
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.html import escape
+import unicodecsv
+
+from sjfnw.fund.admin import GPYearFilter
+from sjfnw.fund.models import Donor, GivingProject
 from sjfnw.fund.tests.base import BaseFundTestCase
 
 logger = logging.getLogger('sjfnw')
@@ -14,7 +24,7 @@ class AdminHome(BaseFundTestCase):
     response = self.client.get('/admin', follow=True)
     self.assertEqual(response.status_code, 200)
     self.assertEqual(response.context['title'], None)
-    self.assertEqual(len(response.context['app_list']), 4)
+    self.assertEqual(len(response.context['app_list']), 5)
 
   def test_fund_home(self):
     response = self.client.get('/admin/fund/', follow=True)
@@ -70,6 +80,124 @@ class AdminMembershipRelated(BaseFundTestCase):
     self.assertEqual(response.context['module_name'], u'donors')
     self.assertIn('choices', response.context)
 
+  def test_donor_membership_autocomplete(self):
+    donor = Donor.objects.select_related('membership').first()
+
+    response = self.client.get('/admin/fund/donor/{}/'.format(donor.pk))
+
+    self.assertEqual(response.status_code, 200)
+    self.assertContains(response, 'data-url="/admin/autocomplete/memberships"')
+    self.assertContains(response, 'value="{}"'.format(escape(unicode(donor.membership))))
+    self.assertNotContains(response, '<select name="membership"')
+
+
+class AdminDonorExport(BaseFundTestCase):
+
+  def setUp(self):
+    super(AdminDonorExport, self).setUp()
+    self.login_as_admin()
+
+  def test_export(self):
+    donor = Donor.objects.first()
+    donor.promised = 200
+    donor.received_this = 50
+    donor.promise_reason = json.dumps(['Social justice', 'Relationship'])
+    donor.save()
+    donors = Donor.objects.all()
+
+    response = self.client.post('/admin/fund/donor/', {
+      'action': 'export_donors',
+      '_selected_action': [d.pk for d in donors]
+    })
+
+    self.assertEqual(response.status_code, 200)
+    self.assertTrue(response.streaming)
+    rows = list(unicodecsv.reader(response.streaming_content))
+    self.assertEqual(len(rows), donors.count() + 1)
+    row = [r for r in rows if r[0] == donor.firstname and r[1] == donor.lastname][0]
+    self.assertEqual(row[4], unicode(donor.membership.member))
+    self.assertEqual(row[5], unicode(donor.membership.giving_project))
+    self.assertEqual(row[9], '50')
+    self.assertEqual(row[18], 'Social justice, Relationship')
+
+
+class AdminYearFilter(BaseFundTestCase):
+
+  def setUp(self):
+    super(AdminYearFilter, self).setUp()
+    self.login_as_admin()
+
+  def get_years(self):
+    response = self.client.get('/admin/fund/givingproject/')
+    spec = [spec for spec in response.context['cl'].filter_specs
+            if isinstance(spec, GPYearFilter)][0]
+    return [year for year, _ in spec.lookup_choices]
+
+  def test_years(self):
+    deadlines = GivingProject.objects.values_list('fundraising_deadline', flat=True)
+    years = sorted(set(date.year for date in deadlines), reverse=True)
+    self.assertEqual(self.get_years(), years)
+
+    GivingProject.objects.create(title='Old', fundraising_training=timezone.now(),
+                                 fundraising_deadline=datetime.date(2011, 5, 1))
+
+    self.assertEqual(self.get_years(), years + [2011])
+
+  def test_cached(self):
+    self.get_years()
+
+    with CaptureQueriesContext(connection) as queries:
+      self.get_years()
+
+    self.assertFalse([q for q in queries if 'DISTINCT' in q['sql']])
+
+
+class AdminKeysetPagination(BaseFundTestCase):
+
+  def setUp(self):
+    super(AdminKeysetPagination, self).setUp()
+    self.login_as_member('current')
+    self.login_as_admin()
+    Donor.objects.bulk_create([Donor(membership_id=self.ship_id, firstname='Pat',
+                                     lastname='Page{:02d}'.format(i)) for i in range(70)])
+    self.expected = list(Donor.objects.order_by('firstname', 'lastname', '-pk')
+                                      .values_list('pk', flat=True))
+
+  def get_page(self, query=''):
+    response = self.client.get('/admin/fund/donor/' + query)
+    self.assertEqual(response.status_code, 200)
+    return response.context['cl']
+
+  def test_pages(self):
+    first = self.get_page()
+    second = self.get_page(first.next_url)
+    third = self.get_page(second.next_url)
+
+    pks = [donor.pk for cl in (first, second, third) for donor in cl.result_list]
+    self.assertEqual(pks, self.expected)
+    self.assertFalse(first.has_previous)
+    self.assertTrue(second.has_previous and second.has_next)
+    self.assertFalse(third.has_next)
+    self.assertEqual(first.result_count, len(self.expected))
+
+    previous = self.get_page(third.previous_url)
+    self.assertEqual([d.pk for d in previous.result_list], [d.pk for d in second.result_list])
+    self.assertTrue(previous.has_previous)
+
+  def test_no_offset(self):
+    first = self.get_page()
+    second = self.get_page(first.next_url)
+
+    with CaptureQueriesContext(connection) as queries:
+      self.get_page(second.next_url)
+
+    # the third page seeks past the second's last row rather than skipping 60 rows
+    self.assertFalse([q for q in queries if 'OFFSET 60' in q['sql']])
+
+  def test_invalid_cursor(self):
+    response = self.client.get('/admin/fund/donor/?after=notapk')
+    self.assertRedirects(response, '/admin/fund/donor/?e=1')
+
 
 class AdminResources(BaseFundTestCase):
 
@@ -0,0 +1,33 @@
+from StringIO import StringIO
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from sjfnw.fund import models
+from sjfnw.fund.tests.base import BaseFundTestCase
+
+
+class BenchmarkQueries(BaseFundTestCase):
+
+  def test_seed_and_cleanup(self):
+    out = StringIO()
+    call_command('benchmark_queries', seed=3, donors=2, steps=2, repeat=1, stdout=out)
+
+    gp = models.GivingProject.objects.get(title='Benchmark')
+    self.assert_count(models.Membership.objects.filter(giving_project=gp), 3)
+    self.assert_count(models.Step.objects.filter(donor__membership__giving_project=gp), 12)
+    self.assertIn('Project news (joined)', out.getvalue())
+
+    call_command('benchmark_queries', cleanup=True, stdout=StringIO())
+    self.assert_count(models.GivingProject.objects.filter(title='Benchmark'), 0)
+    self.assert_count(models.Member.objects.filter(user__username__startswith='benchmark-'), 0)
+
+  def test_cleanup_only_seeded(self):
+    """ Projects that happen to be titled Benchmark aren't deleted """
+    other = models.GivingProject.objects.create(title='Benchmark', public=False,
+        fundraising_training=timezone.now(), fundraising_deadline=timezone.now().date())
+    call_command('benchmark_queries', seed=1, donors=1, steps=1, repeat=1, stdout=StringIO())
+
+    call_command('benchmark_queries', cleanup=True, stdout=StringIO())
+
+    self.assertEqual(list(models.GivingProject.objects.filter(title='Benchmark')), [other])
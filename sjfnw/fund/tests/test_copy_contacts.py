@@ -1,6 +1,8 @@
+from datetime import timedelta
 import logging
 
 from django.core.urlresolvers import reverse
+from django.utils import timezone
 
 from sjfnw.fund import models
 from sjfnw.fund.tests.base import BaseFundTestCase
@@ -135,3 +137,59 @@ class CopyContacts(BaseFundTestCase):
     self.assertTrue(membership.copied_contacts)
     res = self.client.get(self.get_url, follow=True)
     self.assertTemplateNotUsed(self.template)
+
+  def test_merged_contacts_queries(self):
+    donors = models.Donor.objects.filter(membership__member_id=self.member_id)
+    copy = models.Donor(membership_id=self.ship_id, firstname='ABCCD ',
+                        lastname='werklsf', notes='Beep.')
+    copy.save()
+
+    with self.assertNumQueries(2):
+      contacts = donors.merged_contacts()
+
+    self.assertEqual(len(contacts), 8)
+    merged = [c for c in contacts if c['contact_key'] == 'abccd werklsf']
+    self.assertEqual(len(merged), 1)
+    self.assertEqual(merged[0]['contact_email'], 'ae@fakeemail.com')
+    self.assertEqual(merged[0]['contact_notes'], 'Beep.')
+
+  def test_merged_contacts_newest_info(self):
+    """ Newest donor's phone and email are used, even if an older one's sort later """
+    donors = models.Donor.objects.filter(membership__member_id=self.member_id)
+    old = models.Donor(membership_id=self.ship_id, firstname='Newest', lastname='Info',
+                       email='zed@example.com', phone='206-555-9999',
+                       added=timezone.now() - timedelta(days=30))
+    old.save()
+    new = models.Donor(membership_id=self.ship_id, firstname='Newest', lastname='Info',
+                       email='amy@example.com')
+    new.save()
+
+    merged = [c for c in donors.merged_contacts() if c['contact_key'] == 'newest info']
+
+    self.assertEqual(len(merged), 1)
+    self.assertEqual(merged[0]['contact_email'], 'amy@example.com')
+    self.assertEqual(merged[0]['contact_phone'], '206-555-9999')
+
+
+class ContactKey(BaseFundTestCase):
+
+  def test_name(self):
+    key = models.Donor.contact_key_for(' Jo  Ann', 'Smith ', 'jo@gmail.com', '')
+    self.assertEqual(key, 'jo ann smith')
+
+  def test_no_lastname(self):
+    self.assertEqual(models.Donor.contact_key_for('Jo', '', 'JO@gmail.com', '206-555-1111'),
+                     'jo|jo@gmail.com')
+    self.assertEqual(models.Donor.contact_key_for('Jo', '', '', '(206) 555-1111'),
+                     'jo|2065551111')
+    self.assertEqual(models.Donor.contact_key_for('Jo', '', '', ''), 'jo')
+
+  def test_set_on_save(self):
+    self.login_as_member('first')
+    donor = models.Donor(membership_id=self.ship_id, firstname='Jo', lastname='Smith')
+    donor.save()
+    donor.lastname = ''
+    donor.phone = '206-555-1111'
+    donor.save()
+
+    self.assertEqual(models.Donor.objects.get(pk=donor.pk).contact_key, 'jo|2065551111')
@@ -3,9 +3,11 @@ import logging
 
 from django.core import mail
 from django.core.urlresolvers import reverse
+from django.test import RequestFactory
 from django.utils import timezone
 
 from sjfnw.fund import models
+from sjfnw.fund.cron import email_overdue, gift_notify, new_accounts
 from sjfnw.fund.tests.base import BaseFundTestCase
 
 logger = logging.getLogger('sjfnw')
@@ -95,6 +97,28 @@ class GiftNotifications(BaseFundTestCase):
     self.assertTemplateUsed(response, 'fund/home.html')
     self.assertContains(response, 'gift or pledge received')
 
+  def test_constant_queries(self):
+    def add_gifts(count, start):
+      for i in range(start, start + count):
+        member = models.Member.objects.create_with_user(
+            email='gift{}@gmail.com'.format(i), first_name='Gi', last_name='Ft')
+        membership = models.Membership(member=member, giving_project_id=1)
+        membership.save()
+        for name in ('Greta', 'Hans'):
+          donor = models.Donor(membership=membership, firstname=name, received_this=25)
+          donor.save()
+
+    request = RequestFactory().get(self.cron_url)
+
+    # both runs fit in a single chunk
+    self.assert_constant_queries(add_gifts, lambda: gift_notify(request), 1, 5)
+    self.assertEqual(len(mail.outbox), 6)
+
+    membership = models.Membership.objects.get(member__user__username='gift3@gmail.com')
+    self.assertEqual(membership.notifications,
+        u'$25  gift or pledge received from Greta! $25  gift or pledge received from Hans! ')
+    self.assert_count(models.Donor.objects.filter(firstname='Hans', gift_notified=False), 0)
+
 
 class PendingApproval(BaseFundTestCase):
 
@@ -215,6 +239,23 @@ class PendingApproval(BaseFundTestCase):
     self.assertEqual(response.status_code, 200)
     self.assertEqual(len(mail.outbox), 1)
 
+  def test_constant_queries(self):
+    titles = ('Pre training', 'Post training')
+
+    def add_unapproved(count, start):
+      for i in range(start, start + count):
+        gp = models.GivingProject.objects.get(title=titles[i % 2])
+        member = models.Member.objects.create_with_user(
+            email='unapproved{}@gmail.com'.format(i), first_name='Un', last_name='Approved')
+        membership = models.Membership(giving_project=gp, member=member)
+        membership.save(skip=True)
+
+    request = RequestFactory().get(self.url)
+
+    # first run emails about one project, second run about both
+    self.assert_constant_queries(add_unapproved, lambda: new_accounts(request), 1, 1)
+    self.assertEqual(len(mail.outbox), 3)
+
 
 class OverdueEmails(BaseFundTestCase):
 
@@ -309,3 +350,26 @@ class OverdueEmails(BaseFundTestCase):
     response = self.client.get(self.url, follow=True)
     self.assertEqual(response.status_code, 200)
     self.assertEqual(len(mail.outbox), 0)
+
+  def test_constant_queries(self):
+    """ Query count doesn't depend on the number of memberships emailed """
+
+    def add_overdue(count, start):
+      gp = models.GivingProject.objects.get(title='Post training')
+      for i in range(start, start + count):
+        member = models.Member.objects.create_with_user(
+            email='overdue{}@gmail.com'.format(i), first_name='Over', last_name='Due')
+        membership = models.Membership(giving_project=gp, member=member, approved=True)
+        membership.save()
+        donor = models.Donor(firstname='Donor', membership=membership)
+        donor.save()
+        step = models.Step(donor=donor, date=timezone.now() - timedelta(days=i + 2))
+        step.save()
+
+    request = RequestFactory().get(self.url)
+
+    # both runs fit in a single chunk
+    self.assert_constant_queries(add_overdue, lambda: email_overdue(request), 2, 10)
+    self.assertEqual(len(mail.outbox), 12)
+    for email in mail.outbox:
+      self.assertIn('Donor', email.body)
@@ -1,4 +1,8 @@
+from datetime import timedelta
+
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from sjfnw.fund import models
@@ -145,7 +149,8 @@ class CompileMembershipProgress(BaseFundTestCase):
   """ Test _compile_membership_progress method used by home view """
 
   def test_empty(self):
-    progress, incomplete_steps = _compile_membership_progress([])
+    progress, incomplete_steps = _compile_membership_progress(
+        [], models.MembershipProgress())
 
     self.assertEqual(incomplete_steps, [])
     for _, value in progress.iteritems():
@@ -183,7 +188,8 @@ class CompileMembershipProgress(BaseFundTestCase):
 
     donors = models.Donor.objects.filter(membership_id=ship_id).prefetch_related('step_set')
 
-    progress, incomplete_steps = _compile_membership_progress(donors)
+    rollup = models.Membership.objects.get(pk=ship_id).get_progress_rollup()
+    progress, incomplete_steps = _compile_membership_progress(donors, rollup)
 
     self.assertIsInstance(progress, dict)
     self.assertEqual(progress['estimated'], 330)
@@ -245,3 +251,102 @@ class FormQueryParams(BaseFundTestCase):
         kwargs={'donor_id': self.donor_id, 'step_id': self.step_id})
     self.assertEqual(res.context['load'], expected_load_url)
     self.assertEqual(res.context['loadto'], '{}-nextstep'.format(self.donor_id))
+
+
+class ConditionalGet(BaseFundTestCase):
+
+  def setUp(self):
+    super(ConditionalGet, self).setUp()
+    self.login_as_member('current')
+
+  def get_twice(self, url):
+    """ Get url, then get it again with its etag. Returns the etag and the second response """
+    response = self.client.get(url)
+    self.assertEqual(response.status_code, 200)
+    etag = response['ETag']
+    return etag, self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+  def test_unchanged(self):
+    for view in ('home', 'project_page', 'grant_list'):
+      url = reverse('sjfnw.fund.views.' + view)
+      _, response = self.get_twice(url)
+      self.assertEqual(response.status_code, 304, view)
+
+  def test_donor_changed(self):
+    url = reverse('sjfnw.fund.views.home')
+    etag, _ = self.get_twice(url)
+
+    donor = models.Donor.objects.get(pk=self.donor_id)
+    donor.talked = True
+    donor.save()
+
+    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 200)
+    self.assertNotEqual(response['ETag'], etag)
+
+  def test_step_completed(self):
+    url = reverse('sjfnw.fund.views.home')
+    etag, _ = self.get_twice(url)
+
+    step = models.Step.objects.filter(donor_id=self.donor_id)[0]
+    step.completed = timezone.now()
+    step.save()
+
+    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+    self.assertEqual(response.status_code, 200)
+
+  def test_step_signals_without_donor_queries(self):
+    """ Step writes bump the membership without loading the donor """
+    def donor_selects(queries):
+      return [query['sql'] for query in queries.captured_queries
+              if query['sql'].startswith('SELECT') and 'FROM "fund_donor"' in query['sql']]
+
+    donor = models.Donor.objects.get(pk=self.donor_id)
+    with CaptureQueriesContext(connection) as queries:
+      models.Step(donor=donor, description='Call', date='2013-04-07').save()
+    self.assertEqual(donor_selects(queries), [])
+
+    with CaptureQueriesContext(connection) as queries:
+      donor.delete()
+    self.assertEqual(donor_selects(queries), [])
+
+  def test_other_member_changes_project_page(self):
+    """ Project progress includes every member's donors """
+    home_url = reverse('sjfnw.fund.views.home')
+    project_url = reverse('sjfnw.fund.views.project_page')
+    home_etag, _ = self.get_twice(home_url)
+    project_etag, _ = self.get_twice(project_url)
+
+    membership = models.Membership.objects.get(pk=self.ship_id)
+    member = models.Member.objects.create_with_user(
+        email='other@gmail.com', first_name='Oth', last_name='Er')
+    other = models.Membership(member=member, giving_project_id=membership.giving_project_id,
+                              approved=True)
+    other.save(skip=True)
+    project_etag = self.client.get(project_url)['ETag']
+
+    models.Donor(membership=other, firstname='Other', asked=True).save()
+
+    response = self.client.get(home_url, HTTP_IF_NONE_MATCH=home_etag)
+    self.assertEqual(response.status_code, 304)
+    response = self.client.get(project_url, HTTP_IF_NONE_MATCH=project_etag)
+    self.assertEqual(response.status_code, 200)
+
+  def test_survey_becomes_due(self):
+    """ A survey date passing isn't saved anywhere, but still changes home """
+    url = reverse('sjfnw.fund.views.home')
+    membership = models.Membership.objects.get(pk=self.ship_id)
+    survey = models.Survey(title='Later Meeting')
+    survey.save()
+    gp_survey = models.GPSurvey(survey=survey, giving_project_id=membership.giving_project_id,
+                                date=timezone.now() + timedelta(days=1))
+    gp_survey.save()
+    etag, _ = self.get_twice(url)
+
+    models.GPSurvey.objects.filter(pk=gp_survey.pk).update(
+        date=timezone.now() - timedelta(minutes=1))
+
+    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+    self.assertRedirects(response, reverse('sjfnw.fund.views.project_survey',
+                                           kwargs={'gp_survey_id': gp_survey.pk}),
+                         fetch_redirect_response=False)
@@ -1,4 +1,4 @@
-from sjfnw.fund.models import GivingProject
+from sjfnw.fund.models import GivingProject, Donor
 from sjfnw.fund.tests.base import BaseFundTestCase
 
 class GetSuggestedSteps(BaseFundTestCase):
@@ -39,3 +39,34 @@ class GetSuggestedSteps(BaseFundTestCase):
     self.assertEqual(suggested[0], 'Talk')
     self.assertEqual(suggested[1], 'Invite them')
     self.assertEqual(suggested[2], 'Thanks!!')
+
+
+class WithProgress(BaseFundTestCase):
+
+  def setUp(self):
+    super(WithProgress, self).setUp()
+    self.login_as_member('current')
+
+  def test_totals(self):
+    # 'current' membership already has a talked-to donor estimated at 250
+    Donor(membership_id=self.ship_id, firstname='Bo', amount=100, likelihood=10,
+          asked=True, promised=300).save()
+    Donor(membership_id=self.ship_id, firstname='Cy', asked=True, promised=50,
+          received_this=20, match_received=10).save()
+
+    gp = GivingProject.objects.with_progress().get(title='Post training')
+
+    self.assertEqual(gp.progress_contacts, 3)
+    self.assertEqual(gp.progress_talked, 1)
+    self.assertEqual(gp.progress_asked, 2)
+    self.assertEqual(gp.progress_estimated, 260)
+    self.assertEqual(gp.progress_promised, 300)
+    self.assertEqual(gp.progress_received, 30)
+    self.assertEqual(gp.estimated(), 260)
+
+  def test_empty(self):
+    gp = GivingProject.objects.with_progress().get(title='Pre training')
+
+    self.assertEqual(gp.progress_contacts, 0)
+    self.assertEqual(gp.progress_estimated, 0)
+    self.assertEqual(gp.progress_received, 0)
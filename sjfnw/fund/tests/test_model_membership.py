@@ -1,8 +1,15 @@
+from datetime import timedelta
 import logging
+from StringIO import StringIO
 
+from django.core import mail
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
-from sjfnw.fund.models import Membership, Donor, Step
+from sjfnw.fund import stories
+from sjfnw.fund.models import Membership, MembershipProgress, Donor, PendingStory, Step
 from sjfnw.fund.tests.base import BaseFundTestCase
 
 logger = logging.getLogger('sjfnw')
@@ -42,6 +49,114 @@ class GetProgress(BaseFundTestCase):
     self.assertEqual(progress['received_total'], 240)
 
 
+class ProgressRollup(BaseFundTestCase):
+  """ MembershipProgress is kept in sync as donors change """
+
+  def setUp(self):
+    super(ProgressRollup, self).setUp()
+    self.login_as_member('new')
+
+  def get_rollup(self, ship_id):
+    return MembershipProgress.objects.get(membership_id=ship_id)
+
+  def test_add_and_edit(self):
+    donor = Donor(membership_id=self.pre_id, firstname='Sally', amount=400,
+                  likelihood=50, talked=True)
+    donor.save()
+
+    rollup = self.get_rollup(self.pre_id)
+    self.assertEqual(rollup.contacts, 1)
+    self.assertEqual(rollup.talked, 1)
+    self.assertEqual(rollup.asked, 0)
+    self.assertEqual(rollup.estimated, 200)
+
+    donor = Donor.objects.get(pk=donor.pk)
+    donor.asked = True
+    donor.promised = 300
+    donor.received_this = 100
+    donor.save()
+
+    rollup = self.get_rollup(self.pre_id)
+    self.assertEqual(rollup.contacts, 1)
+    self.assertEqual(rollup.talked, 0)
+    self.assertEqual(rollup.asked, 1)
+    self.assertEqual(rollup.promised, 300)
+    self.assertEqual(rollup.promised_outstanding, 200)
+    self.assertEqual(rollup.promised_pending, 0)
+    self.assertEqual(rollup.received(), 100)
+
+  def test_move_and_delete(self):
+    donor = Donor(membership_id=self.pre_id, firstname='Diego', amount=200,
+                  likelihood=50, asked=True, promised=100)
+    donor.save()
+    Donor(membership_id=self.pre_id, firstname='Ana').save()
+
+    donor = Donor.objects.get(pk=donor.pk)
+    donor.membership_id = self.post_id
+    donor.save()
+
+    rollup = self.get_rollup(self.pre_id)
+    self.assertEqual(rollup.contacts, 1)
+    self.assertEqual(rollup.estimated, 0)
+    self.assertEqual(rollup.promised_pending, 0)
+    rollup = self.get_rollup(self.post_id)
+    self.assertEqual(rollup.contacts, 1)
+    self.assertEqual(rollup.estimated, 100)
+    self.assertEqual(rollup.promised_pending, 100)
+
+    Donor.objects.filter(membership_id=self.pre_id).delete()
+    self.assertEqual(self.get_rollup(self.pre_id).contacts, 0)
+
+    Donor.objects.get(pk=donor.pk).delete()
+    rollup = self.get_rollup(self.post_id)
+    self.assertEqual(rollup.contacts, 0)
+    self.assertEqual(rollup.estimated, 0)
+    self.assertEqual(rollup.promised_pending, 0)
+
+  def test_queryset_update(self):
+    Donor(membership_id=self.pre_id, firstname='Sally', amount=400, likelihood=50).save()
+    Donor(membership_id=self.pre_id, firstname='Ana').save()
+
+    Donor.objects.filter(membership_id=self.pre_id).update(asked=True, amount=100,
+                                                           likelihood=100)
+
+    rollup = self.get_rollup(self.pre_id)
+    self.assertEqual(rollup.asked, 2)
+    self.assertEqual(rollup.estimated, 200)
+
+    Donor.objects.filter(firstname='Ana').update(membership_id=self.post_id)
+
+    self.assertEqual(self.get_rollup(self.pre_id).contacts, 1)
+    self.assertEqual(self.get_rollup(self.post_id).contacts, 1)
+
+  def test_membership_deleted(self):
+    """ Donors deleted along with their membership don't update its rollup one by one """
+    for name in ('Sally', 'Ana', 'Diego'):
+      Donor(membership_id=self.pre_id, firstname=name, amount=100, likelihood=50).save()
+
+    with CaptureQueriesContext(connection) as queries:
+      Membership.objects.get(pk=self.pre_id).delete()
+
+    updates = [query['sql'] for query in queries.captured_queries
+               if query['sql'].startswith('UPDATE') and 'membershipprogress' in query['sql']]
+    self.assertEqual(updates, [])
+    self.assert_count(MembershipProgress.objects.filter(membership_id=self.pre_id), 0)
+
+  def test_rebuild_command(self):
+    Donor(membership_id=self.pre_id, firstname='Sally', amount=40,
+          likelihood=75).save()
+    MembershipProgress.objects.filter(membership_id=self.pre_id).update(estimated=0)
+
+    out = StringIO()
+    call_command('rebuild_progress', check=True, stdout=out)
+    self.assertIn('Membership {} - estimated: 0 should be 30'.format(self.pre_id),
+                  out.getvalue())
+    self.assertEqual(self.get_rollup(self.pre_id).estimated, 0)
+
+    call_command('rebuild_progress', stdout=StringIO())
+    self.assertEqual(self.get_rollup(self.pre_id).estimated, 30)
+
+
 class UpdateStory(BaseFundTestCase):
 
   def setUp(self):
@@ -132,6 +247,18 @@ class UpdateStory(BaseFundTestCase):
     story = stories[0]
     self.assertEqual(story.summary, u'{} talked to 1 person.'.format(self.name))
 
+  def test_same_donor_asked_twice(self):
+    """ Each donor counts once, as asked if any of their steps was an ask """
+    now = timezone.now()
+    for description, asked in [('Talk', False), ('Ask', True), ('Ask again', True)]:
+      Step(donor_id=self.donor_id, date=now, description=description,
+           completed=now, asked=asked).save()
+
+    self.membership.update_story(now)
+
+    story = self.membership.newsitem_set.get()
+    self.assertEqual(story.summary, u'{} asked 1 person.'.format(self.name))
+
   def test_combo(self):
     now = timezone.now()
     step = Step(donor_id=self.donor_id, date=now, description='Talk to this person')
@@ -166,3 +293,117 @@ class UpdateStory(BaseFundTestCase):
     story = stories[0]
     self.assertEqual(story.summary,
         u'{} talked to 2 people, asked 1 and got $650 in promises.'.format(self.name))
+
+  def test_updates_existing(self):
+    now = timezone.now()
+    step = Step(donor_id=self.donor_id, date=now, description='Talk to this person')
+    step.completed = now
+    step.save()
+    self.membership.update_story(now)
+
+    donor2 = Donor(membership_id=self.membership.pk, firstname='ADA')
+    donor2.save()
+    step = Step(donor_id=donor2.pk, date=now, description='Talk to this person')
+    step.completed = now
+    step.save()
+    self.membership.update_story(now)
+
+    stories = self.membership.newsitem_set.all()
+    self.assertEqual(len(stories), 1)
+    self.assertEqual(stories[0].summary, u'{} talked to 2 people.'.format(self.name))
+
+
+class PendingStories(BaseFundTestCase):
+
+  def setUp(self):
+    super(PendingStories, self).setUp()
+    self.login_as_member('current')
+    self.membership = Membership.objects.get(pk=self.ship_id)
+
+  def complete_step(self, completed):
+    step = Step(donor_id=self.donor_id, date=completed, description='Talk to this person',
+                completed=completed)
+    step.save()
+
+  def test_coalesced(self):
+    now = timezone.now()
+    self.complete_step(now)
+    self.complete_step(now)
+    # as marked by each step completion
+    for _ in range(2):
+      PendingStory.objects.update_or_create(membership=self.membership,
+                                            day=stories.get_day(now),
+                                            defaults={'marked': timezone.now()})
+
+    self.assertEqual(stories.build_pending_stories(), 1)
+
+    self.assert_count(PendingStory.objects.all(), 0)
+    self.assert_count(self.membership.newsitem_set.all(), 1)
+
+  def test_constant_queries(self):
+    now = timezone.now()
+    days = [stories.get_day(now - timedelta(days=i)) for i in range(4)]
+    for i in range(4):
+      self.complete_step(now - timedelta(days=i))
+
+    with CaptureQueriesContext(connection) as few:
+      stories.build_stories([(self.membership.pk, day) for day in days[:1]])
+    with CaptureQueriesContext(connection) as more:
+      stories.build_stories([(self.membership.pk, day) for day in days[1:]])
+
+    self.assertEqual(len(few), len(more))
+    self.assert_count(self.membership.newsitem_set.all(), 4)
+
+  def test_backfill(self):
+    now = timezone.now()
+    self.complete_step(now - timedelta(days=3))
+    self.complete_step(now - timedelta(days=1))
+    self.complete_step(now)
+    start = stories.get_day(now - timedelta(days=3))
+    end = stories.get_day(now - timedelta(days=1))
+
+    call_command('update_stories', start=start.isoformat(), end=end.isoformat(),
+                 stdout=StringIO())
+
+    self.assert_count(self.membership.newsitem_set.all(), 2)
+
+
+class ApprovalOnSave(BaseFundTestCase):
+  """ Approval email is sent based on loaded values, without re-reading the row """
+
+  def setUp(self):
+    super(ApprovalOnSave, self).setUp()
+    self.login_as_member('new')
+    Membership.objects.filter(pk=self.pre_id).update(approved=False)
+
+  def test_approval(self):
+    membership = Membership.objects.get(pk=self.pre_id)
+    membership.approved = True
+
+    with CaptureQueriesContext(connection) as queries:
+      membership.save()
+
+    self.assertEqual(len(mail.outbox), 1)
+    self.assertFalse([q for q in queries
+                      if q['sql'].startswith('SELECT "fund_membership".')])
+
+  def test_already_approved(self):
+    membership = Membership.objects.get(pk=self.pre_id)
+    membership.approved = True
+    membership.save()
+    membership.leader = True
+    membership.save()
+
+    self.assertEqual(len(mail.outbox), 1)
+
+  def test_update_fields(self):
+    membership = Membership.objects.get(pk=self.pre_id)
+    membership.last_activity = timezone.now().date()
+    membership.leader = True
+
+    membership.save(skip=True, update_fields=['last_activity'])
+
+    membership = Membership.objects.get(pk=self.pre_id)
+    self.assertIsNotNone(membership.last_activity)
+    self.assertFalse(membership.leader)
+    self.assertEqual(len(mail.outbox), 0)
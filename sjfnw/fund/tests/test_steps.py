@@ -3,6 +3,8 @@ import logging
 import unittest
 
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from sjfnw.fund.models import Donor, Step, Membership
@@ -588,3 +590,27 @@ class AddMultStep(BaseFundTestCase):
     self.assertTemplateUsed(res, 'fund/forms/add_mult_step.html')
     self.assertFormsetError(res, 'formset', 0, 'description', 'This field is required.')
     self.assertFormsetError(res, 'formset', 1, 'date', 'Please enter a date in mm/dd/yyyy format.')
+
+  def test_post_constant_queries(self):
+    date = '{:%m/%d/%y}'.format(timezone.now() + timedelta(days=5))
+
+    def post_steps(count):
+      donors = [Donor.objects.create(membership_id=self.ship_id, firstname='D{}'.format(i))
+                for i in range(count)]
+      form_data = {
+        'form-TOTAL_FORMS': unicode(count),
+        'form-INITIAL_FORMS': unicode(count),
+        'form-MAX_NUM_FORMS': u'10'
+      }
+      for i, donor in enumerate(donors):
+        form_data['form-{}-donor'.format(i)] = unicode(donor.pk)
+        form_data['form-{}-date'.format(i)] = date
+        form_data['form-{}-description'.format(i)] = 'Talk'
+      with CaptureQueriesContext(connection) as queries:
+        res = self.client.post(self.url, form_data)
+      self.assertEqual(res.content, 'success')
+      for donor in donors:
+        self.assertEqual(donor.step_set.count(), 1)
+      return len(queries)
+
+    self.assertEqual(post_steps(2), post_steps(8))
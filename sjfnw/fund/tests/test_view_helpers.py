@@ -1,9 +1,14 @@
 import logging
 
 from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.http import HttpResponse
+from django.test import RequestFactory
 
 from sjfnw.fund import models
-from sjfnw.fund.views import _create_membership
+from sjfnw.fund.decorators import require_member
+from sjfnw.fund.views import _create_membership, _get_block_content
+from sjfnw.grants.tests import factories as grants_factories
 from sjfnw.fund.tests.base import BaseFundTestCase
 
 logger = logging.getLogger('sjfnw')
@@ -75,3 +80,124 @@ class CreateMembership(BaseFundTestCase):
     self.assertIsNone(error)
     self.assertIsInstance(membership, models.Membership)
     self.assertTrue(membership.approved)
+
+
+class RequireMember(BaseFundTestCase):
+
+  def setUp(self):
+    super(RequireMember, self).setUp()
+    self.view = require_member(require_membership=True)(
+        lambda request: HttpResponse(u'{} - {}'.format(
+          request.user.member, request.membership.giving_project.title)))
+
+  def get_request(self):
+    request = RequestFactory().get('/fund/')
+    request.user = User.objects.get(username=self.email)
+    return request
+
+  def test_single_query(self):
+    self.login_as_member('current')
+    request = self.get_request()
+
+    with self.assertNumQueries(1):
+      res = self.view(request)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(res.content, 'current Member - Post training')
+    self.assertEqual(request.membership.pk, self.ship_id)
+
+  def test_cached(self):
+    self.login_as_member('current')
+    self.view(self.get_request())
+
+    with self.assertNumQueries(0):
+      res = self.view(self.get_request())
+
+    self.assertEqual(res.content, 'current Member - Post training')
+
+  def test_cache_cleared(self):
+    self.login_as_member('new')
+    self.view(self.get_request())
+
+    membership = models.Membership.objects.get(pk=self.pre_id)
+    membership.approved = False
+    membership.save()
+
+    res = self.view(self.get_request())
+    self.assertTrue(res.url.endswith(reverse('sjfnw.fund.views.not_approved')))
+
+    member = models.Member.objects.get(pk=self.member_id)
+    member.current = self.post_id
+    member.save()
+
+    request = self.get_request()
+    self.view(request)
+    self.assertEqual(request.membership.pk, self.post_id)
+
+  def test_no_current_membership(self):
+    self.login_as_member('blank')
+
+    res = self.view(self.get_request())
+
+    self.assertEqual(res.status_code, 302)
+    self.assertTrue(res.url.endswith(reverse('sjfnw.fund.views.manage_account')))
+
+
+class GetBlockContent(BaseFundTestCase):
+
+  def setUp(self):
+    super(GetBlockContent, self).setUp()
+    self.login_as_member('current')
+    self.membership = (models.Membership.objects.select_related('giving_project')
+                                                .get(pk=self.ship_id))
+
+  def test_news_cached(self):
+    models.NewsItem(membership=self.membership, summary='First').save()
+
+    _, news, _ = _get_block_content(self.membership, get_steps=False)
+    self.assertEqual([item.summary for item in news], ['First'])
+
+    with self.assertNumQueries(0):
+      _, news, _ = _get_block_content(self.membership, get_steps=False)
+    self.assertEqual(len(news), 1)
+
+    models.NewsItem(membership=self.membership, summary='Second').save()
+
+    _, news, _ = _get_block_content(self.membership, get_steps=False)
+    self.assertEqual(len(news), 2)
+
+  def test_grants_cleared(self):
+    papp = grants_factories.ProjectApp(giving_project=self.membership.giving_project,
+                                       application__pre_screening_status=50,
+                                       screening_status=60)
+
+    _, _, grants = _get_block_content(self.membership, get_steps=False)
+    self.assertEqual(grants, [{'application_id': papp.application_id,
+                               'organization': papp.application.organization.name}])
+
+    gp = self.membership.giving_project
+    gp.site_visits = True
+    gp.save()
+
+    _, _, grants = _get_block_content(self.membership, get_steps=False)
+    self.assertEqual(grants, [])
+
+    papp.screening_status = 70
+    papp.save()
+
+    _, _, grants = _get_block_content(self.membership, get_steps=False)
+    self.assertEqual(len(grants), 1)
+
+  def test_grants_cleared_org_rename(self):
+    papp = grants_factories.ProjectApp(giving_project=self.membership.giving_project,
+                                       application__pre_screening_status=50,
+                                       screening_status=60)
+    _get_block_content(self.membership, get_steps=False)
+
+    org = papp.application.organization
+    org.name = 'Renamed Collective'
+    org.save()
+
+    _, _, grants = _get_block_content(self.membership, get_steps=False)
+    self.assertEqual(grants, [{'application_id': papp.application_id,
+                               'organization': 'Renamed Collective'}])
@@ -1,4 +1,4 @@
-import datetime, logging, os, json
+import datetime, hashlib, logging, json
 
 from django.conf import settings
 from django.contrib import auth
@@ -10,12 +10,13 @@ from django.http import HttpResponse, Http404
 from django.shortcuts import render, redirect
 from django.utils import timezone
 from django.utils.http import is_safe_url
+from django.views.decorators.http import condition
 
-from google.appengine.ext import deferred, ereporter
+from google.appengine.ext import ereporter
 
 from sjfnw import constants as c, utils
 from sjfnw.fund.decorators import require_member
-from sjfnw.fund import forms, modelforms, models
+from sjfnw.fund import cache as fund_cache, forms, modelforms, models, stories
 from sjfnw.grants.models import Organization, ProjectApp
 
 if not settings.DEBUG:
@@ -27,7 +28,75 @@ logger = logging.getLogger('sjfnw')
 #  MAIN VIEWS
 # ----------------------------------------------------------------------------
 
+def _get_page_versions(request, include_project_members=False):
+  """ Versions of what a Project Central page is built from. Stored on the
+    request, since both the etag and last modified functions use them """
+  if not hasattr(request, '_page_versions'):
+    membership = request.membership
+    membership_ids = [membership.pk]
+    if include_project_members:
+      membership_ids = (models.Membership.objects
+          .filter(giving_project_id=membership.giving_project_id)
+          .values_list('pk', flat=True))
+    request._page_versions = fund_cache.get_versions(
+        membership_ids=membership_ids, giving_project_ids=[membership.giving_project_id])
+  return request._page_versions
+
+
+def _page_etag(request, include_project_members=False):
+  """ ETag from the user, their current membership, the day (pages show
+    what's due or overdue) and the versions the page is built from """
+  versions = _get_page_versions(request, include_project_members)
+  key = u'{}:{}:{}:{}'.format(request.user.pk, request.membership.pk,
+                              timezone.localtime(timezone.now()).date(),
+                              ','.join('{}={!r}'.format(*v) for v in versions))
+  return hashlib.md5(key).hexdigest()
+
+
+def _page_last_modified(request, include_project_members=False):
+  """ Latest change to what the page is built from, or the start of today """
+  versions = _get_page_versions(request, include_project_members)
+  last_change = datetime.datetime.fromtimestamp(max(v for _, v in versions), timezone.utc)
+  today = timezone.localtime(timezone.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+  return max(last_change, today)
+
+
+def _get_due_survey(request):
+  """ The first survey the member needs to fill out, or None. Stored on the
+    request, since it's used by the etag, last modified and view functions """
+  if not hasattr(request, '_due_survey'):
+    membership = request.membership
+    request._due_survey = (models.GPSurvey.objects
+        .filter(giving_project=membership.giving_project, date__lte=timezone.now())
+        .exclude(id__in=json.loads(membership.completed_surveys))
+        .order_by('date')
+        .first())
+  return request._due_survey
+
+
+def _home_etag(request):
+  """ Page etag plus the time-based redirect state, since a survey or
+    training date can pass without anything being saved """
+  survey = _get_due_survey(request)
+  key = '{}:{}:{}'.format(_page_etag(request), survey and survey.pk,
+                          request.membership.giving_project.require_estimates())
+  return hashlib.md5(key).hexdigest()
+
+
+def _home_last_modified(request):
+  """ Page last modified, or when a due survey or training date passed """
+  last_modified = _page_last_modified(request)
+  survey = _get_due_survey(request)
+  if survey:
+    last_modified = max(last_modified, survey.date)
+  giving_project = request.membership.giving_project
+  if giving_project.require_estimates():
+    last_modified = max(last_modified, giving_project.fundraising_training)
+  return last_modified
+
+
 @require_member(require_membership=True)
+@condition(etag_func=_home_etag, last_modified_func=_home_last_modified)
 def home(request):
   """ Handles display of the home/personal page
 
@@ -45,15 +114,11 @@ def home(request):
   membership = request.membership
 
   # check for survey
-  surveys = (models.GPSurvey.objects
-      .filter(giving_project=membership.giving_project, date__lte=timezone.now())
-      .exclude(id__in=json.loads(membership.completed_surveys))
-      .order_by('date'))
-
-  if surveys:
+  survey = _get_due_survey(request)
+  if survey:
     logger.info('Needs to fill out survey; redirecting')
     return redirect(reverse('sjfnw.fund.views.project_survey', kwargs={
-      'gp_survey_id': surveys[0].pk
+      'gp_survey_id': survey.pk
     }))
 
   # check if they have contacts
@@ -82,10 +147,11 @@ def home(request):
   if notif and not settings.DEBUG:
     logger.info('Displaying notification to %s: %s', unicode(membership), notif)
     membership.notifications = ''
-    membership.save(skip=True)
+    membership.save(skip=True, update_fields=['notifications'])
 
   # compile steps and progress metrics
-  progress, incomplete_steps = _compile_membership_progress(donors)
+  progress, incomplete_steps = _compile_membership_progress(
+      donors, membership.get_progress_rollup())
   donors = sorted(donors, key=_get_converted_date)
 
   # suggested steps for step forms
@@ -121,50 +187,44 @@ def _get_converted_date(donor):
   return datetime.date(2100, 01, 01)
 
 
-def _compile_membership_progress(donors):
-  """ Go through membership's donors and steps, compiling progress metrics
-    and organizing steps based on completion
+def _compile_membership_progress(donors, rollup):
+  """ Compile progress metrics from the membership's progress rollup and
+    organize donors' steps based on completion
 
     Adds summary attribute to donors (and others via donor.organize_steps)
 
+    Args:
+      donors: membership's donors, ideally with step_set prefetched
+      rollup: membership's MembershipProgress
+
     Returns:
       progress - dict, see progress dict definition below
       incomplete_steps - list of incomplete Steps for this membership
   """
   progress = {
-    'contacts': len(donors),
-    'contacts_remaining': len(donors),
-    'estimated': 0,
-    'talked': 0,
-    'asked': 0,
-    'promised': 0,
-    'received': 0
+    'contacts': rollup.contacts,
+    'contacts_remaining': rollup.contacts,
+    'estimated': rollup.estimated,
+    'talked': rollup.talked,
+    'asked': rollup.asked,
+    'promised': rollup.promised_outstanding,
+    'received': rollup.received()
   }
 
   if not donors:
     logger.error('Membership has no contacts but wasn\'t redirected to add_mult')
     return progress, []
 
-  # compile progress metrics and donor summaries
+  # donor summaries
   for donor in donors:
     donor.summary = ''
-
     if donor.asked:
-      progress['asked'] += 1
       donor.summary = 'Asked. '
-    elif donor.talked:
-      progress['talked'] += 1
-
-    progress['estimated'] += donor.estimated()
 
     if donor.received() > 0:
       donor.summary += ' $%s received by SJF.' % intcomma(donor.received())
-      progress['received'] += donor.received()
-      if donor.received() < donor.total_promised():
-        progress['promised'] += donor.total_promised() - donor.received()
     elif donor.promised:
       donor.summary += ' Total promised $%s.' % intcomma(donor.total_promised())
-      progress['promised'] += donor.total_promised()
     elif donor.asked:
       if donor.promised == 0:
         donor.summary += ' Declined to donate.'
@@ -174,7 +234,7 @@ def _compile_membership_progress(donors):
   # progress chart calculations
   if progress['contacts'] > 0:
     amount_raised = progress['promised'] + progress['received']
-    progress['contacts_remaining'] = progress['contacts'] - progress['talked'] - progress['asked']
+    progress['contacts_remaining'] = rollup.contacts_remaining()
     progress['togo'] = max(progress['estimated'] - amount_raised, 0)
     if progress['togo'] > 0:
       progress['header'] = '${} fundraising goal'.format(intcomma(progress['estimated']))
@@ -192,7 +252,16 @@ def _compile_membership_progress(donors):
   return progress, incomplete_steps
 
 
+def _project_page_etag(request):
+  return _page_etag(request, include_project_members=True)
+
+
+def _project_page_last_modified(request):
+  return _page_last_modified(request, include_project_members=True)
+
+
 @require_member(require_membership=True)
+@condition(etag_func=_project_page_etag, last_modified_func=_project_page_last_modified)
 def project_page(request):
 
   membership = request.membership
@@ -202,20 +271,14 @@ def project_page(request):
   header = project.title
 
   # project metrics/progress
-  progress = {'contacts': 0, 'talked': 0, 'asked': 0, 'promised': 0, 'received': 0}
-  donors = list(models.Donor.objects.filter(membership__giving_project=project))
-  progress['contacts'] = len(donors)
-  for donor in donors:
-    donor.summary = []
-    if donor.asked:
-      progress['asked'] += 1
-    elif donor.talked:
-      progress['talked'] += 1
-    if donor.received() > 0:
-      progress['received'] += donor.received()
-    elif donor.promised:
-      progress['promised'] += donor.total_promised()
-
+  totals = models.GivingProject.objects.with_progress().get(pk=project.pk)
+  progress = {
+    'contacts': totals.progress_contacts,
+    'talked': totals.progress_talked,
+    'asked': totals.progress_asked,
+    'promised': totals.progress_promised,
+    'received': totals.progress_received
+  }
   progress['contacts_remaining'] = progress['contacts'] - progress['talked'] - progress['asked']
   progress['togo'] = project.fund_goal - progress['promised'] - progress['received']
   if progress['togo'] < 0:
@@ -233,6 +296,7 @@ def project_page(request):
 
 
 @require_member(require_membership=True)
+@condition(etag_func=_page_etag, last_modified_func=_page_last_modified)
 def grant_list(request):
 
   membership = request.membership
@@ -471,6 +535,43 @@ def project_survey(request, gp_survey_id):
 #  CONTACTS
 # ----------------------------------------------------------------------------
 
+def _merge_contacts_without_lastname(contacts):
+  """ Turn merged_contacts rows into copy contacts form initial data
+
+    Contacts without a last name are keyed by email/phone, so they're also
+    merged into a contact with the same first name and matching email or phone
+  """
+  initial_data = []
+  by_firstname = {} # lowercase first name -> contacts with last names
+  without_lastname = []
+  for row in contacts:
+    contact = {
+      'firstname': row['contact_firstname'], 'lastname': row['contact_lastname'],
+      'phone': row['contact_phone'], 'email': row['contact_email'],
+      'notes': (row['contact_notes'] or '')[:253] # cap below field char limit
+    }
+    if contact['lastname']:
+      initial_data.append(contact)
+      by_firstname.setdefault(contact['firstname'].lower(), []).append(contact)
+    else:
+      without_lastname.append(contact)
+
+  for contact in without_lastname:
+    for match in by_firstname.get(contact['firstname'].lower(), []):
+      if (contact['phone'] and contact['phone'] == match['phone'] or
+          contact['email'] and contact['email'] == match['email']):
+        logger.info(u'Duplicate found! %s', contact['firstname'])
+        match['phone'] = match['phone'] or contact['phone']
+        match['email'] = match['email'] or contact['email']
+        match['notes'] = (match['notes'] + contact['notes'])[:253]
+        break
+    else:
+      initial_data.append(contact)
+
+  initial_data.sort(key=lambda c: (c['firstname'].lower(), c['lastname'].lower()))
+  return initial_data
+
+
 @require_member(require_membership=True)
 def copy_contacts(request):
 
@@ -490,13 +591,12 @@ def copy_contacts(request):
       formset = copy_formset(request.POST)
       logger.info('Copy contracts submitted')
       if formset.is_valid():
-        for form in formset.cleaned_data:
-          if form['select']:
-            contact = models.Donor(membership=request.membership,
-                firstname=form['firstname'], lastname=form['lastname'],
-                phone=form['phone'], email=form['email'], notes=form['notes'])
-            contact.save()
-            logger.debug('Contact created')
+        contacts = [models.Donor(membership=request.membership,
+                                 firstname=form['firstname'], lastname=form['lastname'],
+                                 phone=form['phone'], email=form['email'], notes=form['notes'])
+                    for form in formset.cleaned_data if form['select']]
+        models.Donor.objects.bulk_add(contacts)
+        logger.debug('%d contacts created', len(contacts))
         request.membership.copied_contacts = True
         request.membership.save()
         return HttpResponse('success')
@@ -505,28 +605,9 @@ def copy_contacts(request):
         logger.warning(formset.errors)
 
   else: # GET
-    all_donors = (models.Donor.objects.filter(membership__member=request.membership.member)
-                                      .order_by('firstname', 'lastname', '-added'))
-
-    # extract name, contact info, notes. handle duplicates
-    initial_data = []
-    for donor in all_donors:
-      if (initial_data and donor.firstname == initial_data[-1]['firstname'] and
-             (donor.lastname and donor.lastname == initial_data[-1]['lastname'] or
-                 donor.phone and donor.phone == initial_data[-1]['phone'] or
-                 donor.email and donor.email == initial_data[-1]['email'])):
-        logger.info('Duplicate found! ' + str(donor))
-        initial_data[-1]['lastname'] = initial_data[-1]['lastname'] or donor.lastname
-        initial_data[-1]['phone'] = initial_data[-1]['phone'] or donor.phone
-        initial_data[-1]['email'] = initial_data[-1]['email'] or donor.email
-        initial_data[-1]['notes'] += donor.notes
-        initial_data[-1]['notes'] = initial_data[-1]['notes'][:253] # cap below field char limit
-
-      else: # not duplicate; add a row
-        initial_data.append({
-          'firstname': donor.firstname, 'lastname': donor.lastname,
-          'phone': donor.phone, 'email': donor.email, 'notes': donor.notes
-        })
+    contacts = (models.Donor.objects.filter(membership__member=request.membership.member)
+                                    .merged_contacts())
+    initial_data = _merge_contacts_without_lastname(contacts)
 
     logger.debug('Loading copy contacts formset')
     logger.info('Initial data list of ' + str(len(initial_data)))
@@ -565,16 +646,19 @@ def add_mult(request):
       if formset.has_changed():
         logger.info('AddMult valid formset')
 
-        # get list of existing donors to check for duplicates
-        donors = models.Donor.objects.filter(membership=membership)
-        donors = [unicode(donor) for donor in donors]
+        # names of existing donors to check for duplicates
+        existing = set(models.Donor.name_key(first, last) for first, last in
+                       models.Donor.objects.filter(membership=membership)
+                                           .values_list('firstname', 'lastname'))
         duplicates = []
+        contacts = []
 
         for form in formset.cleaned_data:
           if form: # ignore blank rows
             confirm = form['confirm'] and form['confirm'] == '1'
+            name_key = models.Donor.name_key(form['firstname'], form['lastname'])
 
-            if not confirm and (form['firstname'] + ' ' + form['lastname'] in donors):
+            if not confirm and name_key in existing:
               # this entry is a duplicate that has not yet been confirmed
               initial = {'firstname': form['firstname'],
                          'lastname': form['lastname'],
@@ -592,8 +676,10 @@ def add_mult(request):
               else:
                 contact = models.Donor(membership=membership,
                     firstname=form['firstname'], lastname=form['lastname'])
-              contact.save()
-              logger.info('contact created')
+              contacts.append(contact)
+
+        models.Donor.objects.bulk_add(contacts)
+        logger.info('%d contacts created', len(contacts))
 
         if duplicates:
           logger.info('Showing confirmation page for duplicates: ' + str(duplicates))
@@ -639,7 +725,7 @@ def add_estimates(request):
 
   # get all donors without estimates
   for donor in membership.donor_set.filter(amount__isnull=True):
-    initial_form_data.append({'donor': donor})
+    initial_form_data.append({'donor': donor.pk})
     donor_names.append(unicode(donor))
 
   # create formset
@@ -647,18 +733,16 @@ def add_estimates(request):
 
   if request.method == 'POST':
     membership.last_activity = timezone.now()
-    membership.save(skip=True)
+    membership.save(skip=True, update_fields=['last_activity'])
     formset = est_formset(request.POST)
     logger.debug('Adding estimates - posted: ' + str(request.POST))
 
     if formset.is_valid():
-      logger.debug('Adding estimates - is_valid passed, cycling through forms')
-      for form in formset.cleaned_data:
-        if form:
-          donor = form['donor']
-          donor.amount = form['amount']
-          donor.likelihood = form['likelihood']
-          donor.save()
+      logger.debug('Adding estimates - is_valid passed')
+      membership.donor_set.set_estimates({
+        form['donor']: (form['amount'], form['likelihood'])
+        for form in formset.cleaned_data if form
+      })
       return HttpResponse("success")
 
     else: # invalid form
@@ -699,7 +783,7 @@ def edit_contact(request, donor_id):
   if request.method == 'POST':
     logger.debug(request.POST)
     request.membership.last_activity = timezone.now()
-    request.membership.save(skip=True)
+    request.membership.save(skip=True, update_fields=['last_activity'])
     if est:
       form = modelforms.DonorEditForm(request.POST, instance=donor,
                               auto_id=str(donor.pk) + '_id_%s')
@@ -736,7 +820,7 @@ def delete_contact(request, donor_id):
 
   if request.method == 'POST':
     request.membership.last_activity = timezone.now()
-    request.membership.save(skip=True)
+    request.membership.save(skip=True, update_fields=['last_activity'])
     donor.delete()
     return redirect(home)
 
@@ -771,7 +855,7 @@ def add_step(request, donor_id):
 
   if request.method == 'POST':
     membership.last_activity = timezone.now()
-    membership.save(skip=True)
+    membership.save(skip=True, update_fields=['last_activity'])
     form = modelforms.StepForm(request.POST, auto_id=str(donor.pk) + '_id_%s')
     logger.info('Single step - POST: ' + str(request.POST))
     if form.is_valid():
@@ -792,35 +876,28 @@ def add_step(request, donor_id):
 
 @require_member(require_membership=True)
 def add_mult_step(request):
-  initial_form_data = [] # list of dicts for form initial
-  donor_list = [] # list of donors for zipping to formset
-  size = 0
   membership = request.membership
   suggested = membership.giving_project.get_suggested_steps()
 
-  for donor in membership.donor_set.order_by('-added'):
-    if donor.received() == 0 and donor.promised is None and donor.get_next_step() is None:
-      initial_form_data.append({'donor': donor})
-      donor_list.append(donor)
-      size = size + 1
-    if size > 9:
-      break
+  # list of donors for zipping to formset
+  donor_list = list(membership.donor_set.needing_next_step().order_by('-added')[:10])
+  initial_form_data = [{'donor': donor.pk} for donor in donor_list]
+  size = len(donor_list)
 
   step_formset = formset_factory(forms.MassStep, extra=0)
 
   if request.method == 'POST':
     membership.last_activity = timezone.now()
-    membership.save(skip=True)
+    membership.save(skip=True, update_fields=['last_activity'])
     formset = step_formset(request.POST)
     logger.debug('Multiple steps - posted: ' + str(request.POST))
     if formset.is_valid():
-      logger.debug('Multiple steps - is_valid passed, cycling through forms')
-      for form in formset.cleaned_data:
-        if form:
-          step = models.Step(donor=form['donor'], date=form['date'],
-                             description=form['description'])
-          step.save()
-          logger.info('Multiple steps - step created')
+      logger.debug('Multiple steps - is_valid passed')
+      steps = membership.donor_set.bulk_add_steps([
+        (form['donor'], form['date'], form['description'])
+        for form in formset.cleaned_data if form
+      ])
+      logger.info('Multiple steps - %d step(s) created', len(steps))
       return HttpResponse("success")
     else:
       logger.info('Multiple steps invalid')
@@ -863,7 +940,7 @@ def edit_step(request, donor_id, step_id):
 
   if request.method == 'POST':
     request.membership.last_activity = timezone.now()
-    request.membership.save(skip=True)
+    request.membership.save(skip=True, update_fields=['last_activity'])
     form = modelforms.StepForm(request.POST, instance=step, auto_id=str(step.pk) +
                            '_id_%s')
     if form.is_valid():
@@ -907,7 +984,7 @@ def complete_step(request, donor_id, step_id):
   if request.method == 'POST':
     # update membership activity timestamp
     membership.last_activity = timezone.now()
-    membership.save(skip=True)
+    membership.save(skip=True, update_fields=['last_activity'])
 
     # get posted form
     form = forms.StepDoneForm(request.POST, auto_id=str(step.pk) + '_id_%s')
@@ -957,10 +1034,8 @@ def complete_step(request, donor_id, step_id):
       step.save()
       donor.save()
 
-      # call story creator/updater
-      if os.getenv('SERVER_SOFTWARE', '').startswith('Google App Engine'):
-        deferred.defer(membership.update_story, timezone.now())
-        logger.info('Calling update story')
+      # story is rebuilt in a batch with any other steps completed soon
+      stories.mark_pending(membership.pk, step.completed)
 
       # process next step input
       next_step = form.cleaned_data['next_step']
@@ -1005,6 +1080,9 @@ def complete_step(request, donor_id, step_id):
 def _get_block_content(membership, get_steps=True):
   """ Provide upper block content for the 3 main views
 
+  News and grants are the same for everyone in the project, so they are cached
+  per project. See fund.cache
+
   Args:
     membership: current Membership
     get_steps: whether to include list of upcoming steps
@@ -1012,10 +1090,12 @@ def _get_block_content(membership, get_steps=True):
   Returns: Tuple:
     steps: 2 closest upcoming steps (None if get_steps=False)
     news: news items, sorted by date descending
-    gp_apps: ProjectApps ordered by org name
+    gp_apps: list of dicts with application_id and organization (name),
+      ordered by org name
   """
 
-  steps, news, gp_apps = None, None, None
+  steps = None
+  gp_id = membership.giving_project_id
 
   # upcoming steps
   if get_steps:
@@ -1025,22 +1105,30 @@ def _get_block_content(membership, get_steps=True):
         .order_by('date')[:2])
 
   # project news
-  news = (models.NewsItem.objects
-      .filter(membership__giving_project=membership.giving_project)
-      .order_by('-date')[:25])
+  news = fund_cache.get_or_set(fund_cache.NEWS_KEY.format(gp_id), lambda: list(
+      models.NewsItem.objects
+          .filter(giving_project_id=gp_id)
+          .order_by('-date')[:25]))
 
   # grants
+  gp_apps = fund_cache.get_or_set(fund_cache.GRANTS_KEY.format(gp_id),
+      lambda: _get_project_grants(membership.giving_project))
+
+  return steps, news, gp_apps
+
+def _get_project_grants(giving_project):
   gp_apps = (ProjectApp.objects
-      .filter(giving_project=membership.giving_project)
+      .filter(giving_project=giving_project)
       .exclude(application__pre_screening_status=45) # subcommittee screened out
       .exclude(screening_status=130) # closed
-      .select_related('giving_project', 'application__organization')
       .order_by('application__organization__name'))
-  if membership.giving_project.site_visits == 1:
+  if giving_project.site_visits == 1:
     logger.info('Filtering grants for site visits')
     gp_apps = gp_apps.filter(screening_status__gte=70)
 
-  return steps, news, gp_apps
+  return [{'application_id': app_id, 'organization': org_name}
+          for app_id, org_name
+          in gp_apps.values_list('application_id', 'application__organization__name')]
 
 def _create_membership(member, giving_project, notif=''):
   error = None
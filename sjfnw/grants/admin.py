@@ -3,11 +3,13 @@ import logging
 from django.contrib import admin, messages
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.db.models import Q
 from django.shortcuts import redirect
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.safestring import mark_safe
 
-from sjfnw import utils
+from sjfnw import autocomplete, utils
 from sjfnw.admin import BaseModelAdmin, BaseShowInline, YearFilter
 from sjfnw.grants import models, modelforms
 
@@ -24,6 +26,47 @@ LOG_IN_AS_ORG = utils.create_link(
   'Log in as an organization',
   new_tab=True
 )
+
+TEXT_SEARCH = utils.create_link('/admin/grants/text-search', 'Search text of applications',
+                                new_tab=True)
+
+def text_matches(search_term):
+  """ Full-text matches for a changelist search, or None if there's no term.
+    Used in place of the default search so it can use the search index """
+  if not search_term.strip():
+    return None
+  return models.SearchEntry.objects.matching(search_term)
+
+
+# -----------------------------------------------------------------------------
+#  AUTOCOMPLETE SEARCHES
+# -----------------------------------------------------------------------------
+
+@autocomplete.register
+class ApplicationSearch(autocomplete.Search):
+  """ Optional GET param submitted_after (YYYY-MM-DD) limits to recent apps """
+  name = 'applications'
+  model = models.GrantApplication
+  search_fields = ('organization__name', 'grant_cycle__title')
+
+  def get_queryset(self, request):
+    apps = models.GrantApplication.objects.select_related('organization', 'grant_cycle')
+    submitted_after = request and parse_date(request.GET.get('submitted_after', ''))
+    if submitted_after:
+      apps = apps.filter(submission_time__gte=submitted_after)
+    return apps
+
+
+@autocomplete.register
+class RegisteredOrgSearch(autocomplete.Search):
+  name = 'registered-orgs'
+  model = models.Organization
+  search_fields = ('name', 'user__username')
+
+  def get_queryset(self, request):
+    return models.Organization.objects.exclude(user__isnull=True)
+
+
 # -----------------------------------------------------------------------------
 #  CUSTOM FILTERS
 # -----------------------------------------------------------------------------
@@ -510,6 +553,14 @@ class OrganizationA(BaseModelAdmin):
     ]
     return super(OrganizationA, self).change_view(request, object_id)
 
+  def get_search_results(self, request, queryset, search_term):
+    entries = text_matches(search_term)
+    if entries is None:
+      return queryset, False
+    # usernames aren't indexed; match anywhere so domains like gmail.com still work
+    return queryset.filter(Q(pk__in=entries.ids(models.SearchEntry.ORGANIZATION)) |
+                           Q(user__username__icontains=search_term.strip())), False
+
   def get_actions(self, request):
     return {
       'merge': (OrganizationA.merge, 'merge', 'Merge')
@@ -563,6 +614,14 @@ class GrantApplicationA(BaseModelAdmin):
                      'read', 'revert_grant', 'rollover', 'get_files_display')
   inlines = [ProjectAppI, LogReadonlyI, LogI]
 
+  def get_search_results(self, request, queryset, search_term):
+    entries = text_matches(search_term)
+    if entries is None:
+      return queryset, False
+    # application entries include the grant cycle title
+    return queryset.filter(Q(pk__in=entries.ids(models.SearchEntry.APPLICATION)) |
+                           Q(organization__in=entries.ids(models.SearchEntry.ORGANIZATION))), False
+
   def get_files_display(self, obj):
     files = ''
 
@@ -815,6 +874,8 @@ class LogA(BaseModelAdmin):
     return perms
 
 class NarrativeAnswerA(BaseModelAdmin):
+  keyset_pagination = True
+  list_action_link = TEXT_SEARCH
   fields = (
     ('organization', 'question', 'grant_cycle'),
     'answer'
@@ -840,6 +901,18 @@ class NarrativeAnswerA(BaseModelAdmin):
       'grant_application__grant_cycle'
     )
 
+  def get_search_results(self, request, queryset, search_term):
+    entries = text_matches(search_term)
+    if entries is None:
+      return queryset, False
+    return queryset.filter(
+      Q(pk__in=entries.ids(models.SearchEntry.ANSWER)) |
+      Q(grant_application__in=entries.ids(models.SearchEntry.APPLICATION)) |
+      Q(grant_application__organization__in=entries.ids(models.SearchEntry.ORGANIZATION)) |
+      Q(cycle_narrative__narrative_question__name__icontains=search_term.strip()) |
+      Q(cycle_narrative__narrative_question__version__icontains=search_term.strip())
+    ), False
+
   def answer(self, obj):
     return obj.get_display_value()
   answer.allow_tags = True
@@ -0,0 +1,81 @@
+""" Caching for grant cycle listings
+
+  Grant cycles change a few times a month but are listed on every org home
+  page and in the rollover and report forms. The recent cycles and the
+  titles of all cycles and giving projects are cached here, and cleared by
+  signals when a cycle or giving project is saved or deleted.
+
+  Cycles are cached as model instances. Their status (open, upcoming or
+  closed) is computed when read, so cached cycles never show a stale status.
+"""
+import datetime
+import logging
+
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger('sjfnw')
+
+# upper bound on staleness for changes that don't clear the cache
+TIMEOUT = 60 * 60 * 24
+
+# how long closed cycles are listed
+RECENT_DAYS = 180
+
+RECENT_CYCLES_KEY = 'grants-recent-cycles'
+CYCLE_TITLES_KEY = 'grants-cycle-titles'
+PROJECT_TITLES_KEY = 'grants-gp-titles'
+
+
+def get_or_set(key, load):
+  """ Get value from cache, or call load and cache its return value """
+  value = cache.get(key)
+  if value is None:
+    value = load()
+    cache.set(key, value, TIMEOUT)
+  return value
+
+
+def get_cutoff():
+  return timezone.now() - datetime.timedelta(days=RECENT_DAYS)
+
+
+def _load_recent_cycles():
+  from sjfnw.grants.models import GrantCycle
+  return list(GrantCycle.objects.filter(close__gt=get_cutoff()))
+
+
+def get_recent_cycles(include_private=True):
+  """ Cycles that are open, upcoming or closed within RECENT_DAYS, in
+    GrantCycle's default order (latest close first) """
+  cutoff = get_cutoff()
+  # filter again since cycles may have closed since they were cached
+  return [cycle for cycle in get_or_set(RECENT_CYCLES_KEY, _load_recent_cycles)
+          if cycle.close > cutoff and (include_private or not cycle.private)]
+
+
+def get_open_cycles():
+  return [cycle for cycle in get_recent_cycles() if cycle.is_open()]
+
+
+def get_cycle_titles():
+  """ Sorted distinct titles of all grant cycles """
+  from sjfnw.grants.models import GrantCycle
+  return get_or_set(CYCLE_TITLES_KEY, lambda: list(
+      GrantCycle.objects.values_list('title', flat=True).distinct().order_by('title')))
+
+
+def get_project_titles():
+  """ Sorted distinct titles of all giving projects """
+  from sjfnw.fund.models import GivingProject
+  return get_or_set(PROJECT_TITLES_KEY, lambda: list(
+      GivingProject.objects.values_list('title', flat=True).distinct().order_by('title')))
+
+
+def clear_cycles():
+  logger.debug('Clearing cached grant cycles')
+  cache.delete_many([RECENT_CYCLES_KEY, CYCLE_TITLES_KEY])
+
+
+def clear_project_titles():
+  cache.delete(PROJECT_TITLES_KEY)
@@ -6,6 +6,7 @@ from django.http import HttpResponse
 from django.utils import timezone
 
 from sjfnw import constants as c, utils
+from sjfnw.cron import ChunkedJob, run_summary, start_job
 from sjfnw.grants.models import DraftGrantApplication, GivingProjectGrant, GrantCycle
 
 logger = logging.getLogger('sjfnw')
@@ -68,16 +69,25 @@ def auto_create_cycles(request):
     return HttpResponse()
 
 
-def draft_app_warning(request):
+class DraftWarningJob(ChunkedJob):
   """ Warn orgs of impending draft freezes
       NOTE: must run exactly once a day
       Gives 7 day warning if created 7+ days before close, otherwise 3 day warning """
+  name = 'draft_app_warning'
+
+  def __init__(self):
+    self.now = timezone.now()
 
-  drafts = DraftGrantApplication.objects.all()
-  eight_days = timedelta(days=8)
+  def get_queryset(self):
+    # only cycles that could be in either warning window
+    return (DraftGrantApplication.objects
+        .filter(grant_cycle__close__gte=self.now + timedelta(days=2),
+                grant_cycle__close__lt=self.now + timedelta(days=8))
+        .select_related('grant_cycle', 'organization__user'))
 
-  for draft in drafts:
-    time_left = draft.grant_cycle.close - timezone.now()
+  def process_row(self, draft):
+    eight_days = timedelta(days=8)
+    time_left = draft.grant_cycle.close - self.now
     created_delta = draft.grant_cycle.close - draft.created
     if ((created_delta > eight_days and eight_days > time_left > timedelta(days=7)) or
         (created_delta < eight_days and timedelta(days=3) > time_left >= timedelta(days=2))):
@@ -85,7 +95,7 @@ def draft_app_warning(request):
 
       if not to_email:
         logger.warn('Unable to send draft reminder; org is not registered %d', draft.organization.pk)
-        continue
+        return 0
 
       utils.send_email(
         subject='Grant cycle closing soon',
@@ -95,49 +105,64 @@ def draft_app_warning(request):
         context={'org': draft.organization, 'cycle': draft.grant_cycle}
       )
       logger.info('Email sent to %s regarding draft application soon to expire', to_email)
-  return HttpResponse('')
+      return 1
+    return 0
 
 
-def report_reminder_email(request):
+def draft_app_warning(request):
+  run = start_job(DraftWarningJob)
+  return HttpResponse(run_summary(run))
+
+
+class ReportReminderJob(ChunkedJob):
   """ Remind orgs of upcoming grantee reports that are due
       NOTE: Must run exactly once a day. ONLY SUPPORTS UP TO 2-YEAR GRANTS
       Sends reminder emails at 1 month and 1 week """
+  name = 'report_reminder_email'
 
-  today = timezone.now().date()
-  seven_days = timedelta(days=7)
-  thirty_days = timedelta(days=30)
-  award_dates = [today + seven_days, today + thirty_days]
+  def get_queryset(self):
+    today = timezone.now().date()
+    award_dates = [today + timedelta(days=7), today + timedelta(days=30)]
 
-  awards = (GivingProjectGrant.objects
-    .filter(
-      Q(first_report_due__in=award_dates) | Q(second_report_due__in=award_dates)
+    return (GivingProjectGrant.objects
+      .filter(
+        Q(first_report_due__in=award_dates) | Q(second_report_due__in=award_dates)
+      )
+      .annotate(report_count=Count('granteereport'))
+      .select_related('projectapp__application__organization__user',
+                      'projectapp__giving_project')
     )
-    .annotate(report_count=Count('granteereport'))
-  )
 
-  for award in awards:
+  def process_row(self, award):
     due = False
     if award.report_count == 0:
       due = award.first_report_due
     elif award.report_count == 1 and award.second_report_due:
       due = award.second_report_due
 
-    if due:
-      app = award.projectapp.application
+    if not due:
+      return 0
 
-      to = app.organization.get_email() or app.email_address
-      utils.send_email(
-        subject='Grantee report',
-        sender=c.GRANT_EMAIL,
-        to=[to],
-        template='grants/email_report_due.html',
-        context={
-          'award': award,
-          'app': app,
-          'gp': award.projectapp.giving_project,
-          'base_url': c.APP_BASE_URL,
-          'due_date': due
-        }
-      )
-      logger.info('Grantee report reminder email sent to %s for award %d', to, award.pk)
-  return HttpResponse('success')
+    app = award.projectapp.application
+
+    to = app.organization.get_email() or app.email_address
+    utils.send_email(
+      subject='Grantee report',
+      sender=c.GRANT_EMAIL,
+      to=[to],
+      template='grants/email_report_due.html',
+      context={
+        'award': award,
+        'app': app,
+        'gp': award.projectapp.giving_project,
+        'base_url': c.APP_BASE_URL,
+        'due_date': due
+      }
+    )
+    logger.info('Grantee report reminder email sent to %s for award %d', to, award.pk)
+    return 1
+
+
+def report_reminder_email(request):
+  run = start_job(ReportReminderJob)
+  return HttpResponse(run_summary(run))
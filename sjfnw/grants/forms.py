@@ -1,4 +1,4 @@
-import datetime, logging
+import logging
 
 from django import forms
 from django.contrib.auth.models import User
@@ -6,11 +6,11 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.utils.safestring import mark_safe
 
-from sjfnw.fund.models import GivingProject
-from sjfnw.grants import constants as gc
+from sjfnw.autocomplete import AutocompleteWidget
+from sjfnw.grants import cache as grants_cache, constants as gc
 from sjfnw.grants.models import (
   DraftGrantApplication, Organization, GrantCycle, GrantApplication, CycleReportQuestion,
-  validate_file_extension, validate_photo_file_extension
+  SearchEntry, validate_file_extension, validate_photo_file_extension
 )
 
 logger = logging.getLogger('sjfnw')
@@ -78,10 +78,10 @@ class RolloverForm(forms.Form):
                                            .filter(organization=organization))
 
     # filter out cycles covered by apps/drafts, get remaining open ones
-    exclude_cycles = ([draft.grant_cycle.pk for draft in drafts] +
-                      [sub.grant_cycle.pk for sub in submitted])
-    cycles = (GrantCycle.objects.filter(open__lt=timezone.now(), close__gt=timezone.now())
-                                .exclude(id__in=exclude_cycles))
+    exclude_cycles = ([draft.grant_cycle_id for draft in drafts] +
+                      [sub.grant_cycle_id for sub in submitted])
+    cycles = [cycle for cycle in grants_cache.get_open_cycles()
+              if cycle.pk not in exclude_cycles]
 
     # create fields
     self.fields['application'] = forms.ChoiceField(
@@ -136,9 +136,9 @@ class AdminRolloverForm(forms.Form):
                                            .filter(organization=organization))
 
     # get last 6 mos of cycles
-    cutoff = timezone.now() - datetime.timedelta(days=180)
-    exclude_cycles = [d.grant_cycle.pk for d in drafts] + [a.grant_cycle.pk for a in submitted]
-    cycles = GrantCycle.objects.filter(close__gt=cutoff).exclude(id__in=exclude_cycles)
+    exclude_cycles = [d.grant_cycle_id for d in drafts] + [a.grant_cycle_id for a in submitted]
+    cycles = [cycle for cycle in grants_cache.get_recent_cycles()
+              if cycle.pk not in exclude_cycles]
 
     # create field
     self.fields['cycle'] = forms.ChoiceField(
@@ -150,7 +150,7 @@ class BaseReportForm(forms.Form):
 
   # filters
   organization_name = forms.CharField(max_length=255, required=False,
-      help_text='Organization name must contain the given text')
+      help_text='Organization name must have words starting with each word given')
   city = forms.CharField(max_length=255, required=False,
       help_text='City must match the given text')
   state = forms.MultipleChoiceField(choices=gc.STATE_CHOICES[:5],
@@ -181,7 +181,11 @@ class BaseReportForm(forms.Form):
       ])
   report_fiscal = forms.BooleanField(label='Fiscal sponsor', required=False)
 
-  format = forms.ChoiceField(choices=[('csv', 'CSV'), ('browse', 'Don\'t export, just browse')])
+  format = forms.ChoiceField(choices=[
+    ('csv', 'CSV'),
+    ('browse', 'Don\'t export, just browse'),
+    ('background', 'CSV, generated in the background (for large reports)')
+  ])
 
   class Meta:
     abstract = True
@@ -202,13 +206,8 @@ class BaseAppRelatedReportForm(BaseReportForm):
   def __init__(self, *args, **kwargs):
     super(BaseAppRelatedReportForm, self).__init__(*args, **kwargs)
 
-    choices = GivingProject.objects.values_list('title', flat=True).distinct().order_by('title')
-    choices = [(g, g) for g in choices]
-    self.fields['giving_projects'].choices = choices
-
-    choices = GrantCycle.objects.values_list('title', flat=True).distinct().order_by('title')
-    choices = [(g, g) for g in choices]
-    self.fields['grant_cycle'].choices = choices
+    self.fields['giving_projects'].choices = [(g, g) for g in grants_cache.get_project_titles()]
+    self.fields['grant_cycle'].choices = [(g, g) for g in grants_cache.get_cycle_titles()]
 
   def clean(self):
     cleaned_data = super(BaseAppRelatedReportForm, self).clean()
@@ -304,12 +303,15 @@ class OrgReportForm(BaseReportForm):
 
 
 class LoginAsOrgForm(forms.Form):
+  organization = forms.ModelChoiceField(
+      queryset=Organization.objects.exclude(user__isnull=True).select_related('user'),
+      widget=AutocompleteWidget('registered-orgs'))
 
-  def __init__(self, *args, **kwargs):
-    super(LoginAsOrgForm, self).__init__(*args, **kwargs)
-    orgs = Organization.objects.exclude(user__isnull=True).order_by('name')
-    self.fields['organization'] = forms.ChoiceField(
-        choices=[('', '--- Organizations ---')] + [(o.get_email(), unicode(o)) for o in orgs])
+
+class TextSearchForm(forms.Form):
+  q = forms.CharField(label='Search for', max_length=255)
+  kind = forms.ChoiceField(label='In', required=False,
+                           choices=[('', 'All')] + list(SearchEntry.KIND_CHOICES))
 
 
 class OrgMergeForm(forms.Form):
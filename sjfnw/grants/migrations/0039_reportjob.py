@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grants', '0038_data_convert_yer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('report_type', models.CharField(max_length=50)),
+                ('options', models.TextField(help_text='Report form cleaned data, as json')),
+                ('options_hash', models.CharField(max_length=40, db_index=True)),
+                ('requested_by', models.CharField(max_length=100, blank=True)),
+                ('status', models.CharField(default='queued', max_length=10, choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')])),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('started', models.DateTimeField(null=True, blank=True)),
+                ('finished', models.DateTimeField(null=True, blank=True)),
+                ('row_count', models.PositiveIntegerField(null=True, blank=True)),
+                ('content', models.TextField(blank=True)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ('-created',),
+            },
+        ),
+    ]
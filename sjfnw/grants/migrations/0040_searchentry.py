@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations, transaction
+from django.db.utils import DatabaseError
+
+SQLITE_FTS = [
+    "CREATE VIRTUAL TABLE grants_searchentry_fts USING fts5("
+    "text, content='grants_searchentry', content_rowid='id')",
+    "CREATE TRIGGER grants_searchentry_ai AFTER INSERT ON grants_searchentry BEGIN "
+    "INSERT INTO grants_searchentry_fts(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER grants_searchentry_ad AFTER DELETE ON grants_searchentry BEGIN "
+    "INSERT INTO grants_searchentry_fts(grants_searchentry_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER grants_searchentry_au AFTER UPDATE ON grants_searchentry BEGIN "
+    "INSERT INTO grants_searchentry_fts(grants_searchentry_fts, rowid, text) "
+    "VALUES ('delete', old.id, old.text); "
+    "INSERT INTO grants_searchentry_fts(rowid, text) VALUES (new.id, new.text); END",
+]
+
+
+def add_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE grants_searchentry ADD FULLTEXT INDEX grants_searchentry_text_ft (text)')
+    elif vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=schema_editor.connection.alias):
+                for sql in SQLITE_FTS:
+                    schema_editor.execute(sql)
+        except DatabaseError:
+            # sqlite built without fts5; search falls back to LIKE
+            pass
+
+
+def remove_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE grants_searchentry DROP INDEX grants_searchentry_text_ft')
+    elif vendor == 'sqlite':
+        for name in ('ai', 'ad', 'au'):
+            schema_editor.execute('DROP TRIGGER IF EXISTS grants_searchentry_{}'.format(name))
+        schema_editor.execute('DROP TABLE IF EXISTS grants_searchentry_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grants', '0039_reportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('kind', models.CharField(max_length=10, choices=[('org', 'Organization'), ('app', 'Grant application'), ('answer', 'Narrative answer')])),
+                ('object_id', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('grant_application', models.ForeignKey(blank=True, to='grants.GrantApplication', null=True)),
+                ('organization', models.ForeignKey(blank=True, to='grants.Organization', null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'search entries',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchentry',
+            unique_together=set([('kind', 'object_id')]),
+        ),
+        migrations.RunPython(add_fulltext_index, remove_fulltext_index),
+    ]
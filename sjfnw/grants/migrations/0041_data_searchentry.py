@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+BATCH_SIZE = 500
+
+# mirrors SearchEntry.APP_FIELDS
+APP_FIELDS = ('project_title', 'contact_person', 'grant_request', 'mission')
+
+
+def create_entries(SearchEntry, rows, make_entry):
+    batch = []
+    for row in rows.iterator():
+        batch.append(make_entry(row))
+        if len(batch) == BATCH_SIZE:
+            SearchEntry.objects.bulk_create(batch)
+            batch = []
+    SearchEntry.objects.bulk_create(batch)
+
+
+def index_existing(apps, schema_editor):
+    SearchEntry = apps.get_model('grants', 'SearchEntry')
+    Organization = apps.get_model('grants', 'Organization')
+    GrantApplication = apps.get_model('grants', 'GrantApplication')
+    NarrativeAnswer = apps.get_model('grants', 'NarrativeAnswer')
+
+    create_entries(SearchEntry, Organization.objects.values_list('pk', 'name'),
+        lambda row: SearchEntry(kind='org', object_id=row[0], organization_id=row[0],
+                                text=row[1]))
+    create_entries(SearchEntry,
+        GrantApplication.objects.values_list('pk', 'grant_cycle__title', *APP_FIELDS),
+        lambda row: SearchEntry(kind='app', object_id=row[0], grant_application_id=row[0],
+                                text='\n'.join(row[1:])))
+    create_entries(SearchEntry,
+        NarrativeAnswer.objects.values_list('pk', 'grant_application_id', 'text'),
+        lambda row: SearchEntry(kind='answer', object_id=row[0], grant_application_id=row[1],
+                                text=row[2]))
+
+
+def remove_entries(apps, schema_editor):
+    apps.get_model('grants', 'SearchEntry').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grants', '0040_searchentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(index_existing, remove_entries)
+    ]
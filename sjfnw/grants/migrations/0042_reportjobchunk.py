@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+def move_content(apps, schema_editor):
+    ReportJob = apps.get_model('grants', 'ReportJob')
+    ReportJobChunk = apps.get_model('grants', 'ReportJobChunk')
+    jobs = ReportJob.objects.filter(status='done').values_list('pk', 'content')
+    for job_id, content in jobs.iterator():
+        ReportJobChunk.objects.create(job_id=job_id, index=0, content=content)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('grants', '0041_data_searchentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportJobChunk',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('index', models.PositiveIntegerField()),
+                ('content', models.TextField()),
+                ('job', models.ForeignKey(related_name='chunks', to='grants.ReportJob')),
+            ],
+            options={
+                'ordering': ('index',),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='reportjobchunk',
+            unique_together=set([('job', 'index')]),
+        ),
+        migrations.RunPython(move_content, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='reportjob',
+            name='content',
+        ),
+    ]
@@ -1,18 +1,23 @@
 from datetime import timedelta
-import json, logging
+import json, logging, re
 
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.core.validators import BaseValidator, MinValueValidator
 from django.utils.safestring import mark_safe
-from django.db import models
+from django.db import connection, models
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
 from django.forms.models import model_to_dict
 from django.utils import timezone
 
 from sjfnw.utils import create_link
+from sjfnw.fund import cache as fund_cache
 from sjfnw.fund.models import GivingProject
-from sjfnw.grants import constants as gc, utils
+from sjfnw.models import DirtyFieldsMixin
+from sjfnw.grants import cache as grants_cache, constants as gc, utils
 
 logger = logging.getLogger('sjfnw')
 
@@ -87,7 +92,7 @@ class OrganizationManager(models.Manager):
     return org
 
 
-class Organization(models.Model):
+class Organization(DirtyFieldsMixin, models.Model):
   objects = OrganizationManager()
 
   name = models.CharField(max_length=255, unique=True, error_messages={
@@ -197,8 +202,8 @@ class Organization(models.Model):
     for field in self.get_profile_fields():
       if hasattr(app, field):
         setattr(self, field, getattr(app, field))
-    self.save()
-    logger.info('Org profile updated - %s', self.name)
+    if self.save_changed():
+      logger.info('Org profile updated - %s', self.name)
 
 # Organizations
 #---------------
@@ -223,7 +228,7 @@ class GrantCycleManager(models.Manager):
     logger.info('Created %s cycle as copy of %s', title, source.title)
     return new_cycle
 
-class GrantCycle(models.Model):
+class GrantCycle(DirtyFieldsMixin, models.Model):
 
   objects = GrantCycleManager()
 
@@ -285,6 +290,17 @@ class GrantCycle(models.Model):
     else:
       return 'Next review cutoff: {:%b %d}'.format(timezone.localtime(self.close))
 
+def clear_cached_cycles(sender, **kwargs):
+  grants_cache.clear_cycles()
+
+def clear_cached_project_titles(sender, **kwargs):
+  grants_cache.clear_project_titles()
+
+post_save.connect(clear_cached_cycles, sender=GrantCycle)
+post_delete.connect(clear_cached_cycles, sender=GrantCycle)
+post_save.connect(clear_cached_project_titles, sender=GivingProject)
+post_delete.connect(clear_cached_project_titles, sender=GivingProject)
+
 # Grant applications
 #--------------------
 
@@ -391,7 +407,7 @@ class DraftGrantApplication(models.Model):
     return timezone.now() < self.modified + timedelta(seconds=35)
 
 
-class GrantApplication(models.Model):
+class GrantApplication(DirtyFieldsMixin, models.Model):
   """ Submitted grant application """
 
   # automated fields
@@ -547,9 +563,18 @@ class GrantApplication(models.Model):
 
   def save(self, *args, **kwargs):
     """ Update org profile if it is the most recent app for the org """
+    adding = self._state.adding
+    changed = self.changed_fields
 
     super(GrantApplication, self).save(*args, **kwargs)
 
+    # pre-screening status affects which grants project members see
+    if not adding and 'pre_screening_status' in changed:
+      fund_cache.clear_grants(*self.projectapp_set.values_list('giving_project_id', flat=True))
+
+    if not adding and not changed.intersection(Organization.get_profile_fields()):
+      return
+
     # check if there are more recent apps
     apps = GrantApplication.objects.filter(organization_id=self.organization_id,
                                            submission_time__gt=self.submission_time)
@@ -680,6 +705,22 @@ class ProjectApp(models.Model):
     return '%s - %s' % (self.giving_project.title, self.application)
 
 
+def clear_cached_grants(sender, instance, **kwargs):
+  fund_cache.clear_grants(instance.giving_project_id)
+
+def clear_org_cached_grants(sender, instance, created=False, raw=False, **kwargs):
+  """ Cached grant lists show organization names, so clear them on rename """
+  if raw or created or 'name' not in instance.changed_fields:
+    return
+  fund_cache.clear_grants(*ProjectApp.objects.filter(application__organization=instance)
+                                             .values_list('giving_project_id', flat=True)
+                                             .distinct())
+
+post_save.connect(clear_cached_grants, sender=ProjectApp)
+post_delete.connect(clear_cached_grants, sender=ProjectApp)
+post_save.connect(clear_org_cached_grants, sender=Organization)
+
+
 class GrantApplicationLog(models.Model):
   date = models.DateTimeField(default=timezone.now)
   organization = models.ForeignKey(Organization)
@@ -760,8 +801,11 @@ class GivingProjectGrant(models.Model):
   def next_report_due(self):
     """ Get
       Returns datetime.date or None if all report have been submitted for this grant
+      Uses report_count if the queryset was annotated with it
     """
-    completed = self.granteereport_set.count()
+    completed = getattr(self, 'report_count', None)
+    if completed is None:
+      completed = self.granteereport_set.count()
     if completed == 0:
       return self.first_report_due
     elif completed == 1 and self.second_report_due:
@@ -812,6 +856,244 @@ class SponsoredProgramGrant(models.Model):
     return desc
 
 
+# Full-text search
+#------------------
+
+# sqlite fts5 table mirroring SearchEntry.text, created in migrations
+FTS_TABLE = 'grants_searchentry_fts'
+
+# words mysql's FULLTEXT index leaves out: innodb_ft_min_token_size and
+# the default innodb stopword list
+MYSQL_MIN_WORD_LENGTH = 3
+MYSQL_STOPWORDS = frozenset([
+  'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for',
+  'from', 'how', 'i', 'in', 'is', 'it', 'la', 'of', 'on', 'or', 'that', 'the',
+  'this', 'to', 'was', 'what', 'when', 'where', 'who', 'will', 'with', 'und', 'www'
+])
+
+
+def split_mysql_words(words):
+  """ Split words into those mysql's FULLTEXT index can match and those it
+    can't (too short or stopwords) """
+  indexed, unindexed = [], []
+  for word in words:
+    if len(word) < MYSQL_MIN_WORD_LENGTH or word.lower() in MYSQL_STOPWORDS:
+      unindexed.append(word)
+    else:
+      indexed.append(word)
+  return indexed, unindexed
+
+
+class SearchEntryQuerySet(models.QuerySet):
+
+  def matching(self, query):
+    """ Entries with words starting with each word in query. Uses the
+      database's full-text index: FULLTEXT on mysql, fts5 on sqlite
+
+      The match is a self-contained subquery on the entry id, so it still
+      works when django aliases this table, e.g. in ids() """
+    words = re.findall(r'\w+', query, re.UNICODE)
+    if not words:
+      return self.none()
+    queryset = self
+    if connection.vendor == 'mysql':
+      words, unindexed = split_mysql_words(words)
+      for word in unindexed:
+        queryset = queryset.filter(text__icontains=word)
+      if words:
+        queryset = queryset.filter(pk__in=RawSQL(
+            'SELECT id FROM grants_searchentry WHERE MATCH (text) AGAINST (%s IN BOOLEAN MODE)',
+            [u' '.join(u'+{}*'.format(word) for word in words)]))
+      return queryset
+    if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+      return queryset.filter(pk__in=RawSQL(
+          'SELECT rowid FROM {0} WHERE {0} MATCH %s'.format(FTS_TABLE),
+          [u' '.join(u'"{}"*'.format(word) for word in words)]))
+    logger.warning('No full-text index, searching with LIKE')
+    for word in words:
+      queryset = queryset.filter(text__icontains=word)
+    return queryset
+
+  def ids(self, kind):
+    """ Subquery of matched object ids of the given kind, for use with __in """
+    return self.filter(kind=kind).values('object_id')
+
+
+class SearchEntry(models.Model):
+  """ Text of an organization, application or narrative answer, indexed for
+    full-text search. Kept in sync by signals below """
+  ORGANIZATION = 'org'
+  APPLICATION = 'app'
+  ANSWER = 'answer'
+  KIND_CHOICES = (
+    (ORGANIZATION, 'Organization'),
+    (APPLICATION, 'Grant application'),
+    (ANSWER, 'Narrative answer')
+  )
+  # application fields that are indexed, along with the grant cycle's title
+  APP_FIELDS = ('project_title', 'contact_person', 'grant_request', 'mission')
+
+  kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+  object_id = models.PositiveIntegerField()
+  # for deletion along with the indexed object
+  organization = models.ForeignKey(Organization, null=True, blank=True)
+  grant_application = models.ForeignKey(GrantApplication, null=True, blank=True)
+  text = models.TextField()
+
+  objects = SearchEntryQuerySet.as_manager()
+
+  class Meta:
+    unique_together = ('kind', 'object_id')
+    verbose_name_plural = 'search entries'
+
+  def __unicode__(self):
+    return u'{} {}'.format(self.get_kind_display(), self.object_id)
+
+  def get_admin_url(self):
+    model_name = {self.ORGANIZATION: 'organization', self.APPLICATION: 'grantapplication',
+                  self.ANSWER: 'narrativeanswer'}[self.kind]
+    return reverse('admin:grants_{}_change'.format(model_name), args=(self.object_id,))
+
+  @classmethod
+  def get_app_text(cls, app):
+    return u'\n'.join([app.grant_cycle.title] + [getattr(app, f) for f in cls.APP_FIELDS])
+
+  @classmethod
+  def index(cls, kind, obj, text, **related):
+    cls.objects.update_or_create(kind=kind, object_id=obj.pk,
+                                 defaults=dict(related, text=text))
+
+
+def index_organization(sender, instance, created=False, raw=False, **kwargs):
+  if raw:
+    return
+  if created or 'name' in instance.changed_fields:
+    SearchEntry.index(SearchEntry.ORGANIZATION, instance, instance.name,
+                      organization=instance)
+
+def index_application(sender, instance, created=False, raw=False, **kwargs):
+  if raw:
+    return
+  # DirtyFieldsMixin hasn't reset changed_fields yet when post_save is sent
+  if created or instance.changed_fields.intersection(SearchEntry.APP_FIELDS + ('grant_cycle_id',)):
+    SearchEntry.index(SearchEntry.APPLICATION, instance, SearchEntry.get_app_text(instance),
+                      grant_application=instance)
+
+def reindex_cycle_applications(sender, instance, created=False, raw=False, **kwargs):
+  """ Application entries include the cycle title, so rebuild them on rename """
+  if raw or created or 'title' not in instance.changed_fields:
+    return
+  apps = GrantApplication.objects.filter(grant_cycle=instance).only(*SearchEntry.APP_FIELDS)
+  for app in apps.iterator():
+    app.grant_cycle = instance
+    SearchEntry.index(SearchEntry.APPLICATION, app, SearchEntry.get_app_text(app),
+                      grant_application=app)
+
+def index_answer(sender, instance, raw=False, **kwargs):
+  if raw:
+    return
+  SearchEntry.index(SearchEntry.ANSWER, instance, instance.text,
+                    grant_application_id=instance.grant_application_id)
+
+def unindex_answer(sender, instance, **kwargs):
+  SearchEntry.objects.filter(kind=SearchEntry.ANSWER, object_id=instance.pk).delete()
+
+post_save.connect(index_organization, sender=Organization)
+post_save.connect(index_application, sender=GrantApplication)
+post_save.connect(reindex_cycle_applications, sender=GrantCycle)
+post_save.connect(index_answer, sender=NarrativeAnswer)
+post_delete.connect(unindex_answer, sender=NarrativeAnswer)
+
+
+# Background reports
+#--------------------
+
+class ReportJobManager(models.Manager):
+
+  def reusable(self, report_type, options_hash):
+    """ Most recent job with the same options that is still within the reuse window
+      and hasn't failed or gone stale. Returns None if there isn't one """
+    since = timezone.now() - timedelta(minutes=settings.REPORT_JOB_REUSE_MINUTES)
+    deadline = get_report_job_deadline()
+    return (self.filter(report_type=report_type, options_hash=options_hash,
+                        created__gte=since)
+                .exclude(status=ReportJob.FAILED)
+                .exclude(status=ReportJob.QUEUED, created__lt=deadline)
+                .exclude(status=ReportJob.RUNNING, started__lt=deadline)
+                .order_by('-created')
+                .first())
+
+
+def get_report_job_deadline():
+  """ Jobs queued or started before this are stale: their task died without
+    recording a result (e.g. DeadlineExceededError, which isn't an Exception) """
+  return timezone.now() - timedelta(minutes=settings.REPORT_JOB_DEADLINE_MINUTES)
+
+
+class ReportJob(models.Model):
+  """ A grants report (see views.grants_report) generated in a task as csv """
+
+  QUEUED = 'queued'
+  RUNNING = 'running'
+  DONE = 'done'
+  FAILED = 'failed'
+  STATUSES = ((QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed'))
+
+  report_type = models.CharField(max_length=50)
+  options = models.TextField(help_text='Report form cleaned data, as json')
+  options_hash = models.CharField(max_length=40, db_index=True)
+  requested_by = models.CharField(max_length=100, blank=True)
+
+  status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+  created = models.DateTimeField(default=timezone.now)
+  started = models.DateTimeField(blank=True, null=True)
+  finished = models.DateTimeField(blank=True, null=True)
+  row_count = models.PositiveIntegerField(blank=True, null=True)
+  error = models.TextField(blank=True)
+
+  objects = ReportJobManager()
+
+  class Meta:
+    ordering = ('-created',)
+
+  def __unicode__(self):
+    return u'{} report {:%m/%d/%y %H:%M}'.format(
+        self.report_type, timezone.localtime(self.created))
+
+  def duration(self):
+    if self.started and self.finished:
+      return self.finished - self.started
+
+  def is_stale(self):
+    deadline = get_report_job_deadline()
+    if self.status == self.RUNNING:
+      return self.started < deadline
+    if self.status == self.QUEUED:
+      return self.created < deadline
+    return False
+
+  def filename(self):
+    return '{}-report-{}.csv'.format(self.report_type, self.pk)
+
+
+class ReportJobChunk(models.Model):
+  """ Part of a report job's csv. Stored in pieces so that large reports are
+    written and downloaded a chunk at a time rather than held in memory """
+
+  ROWS = 1000 # rows per chunk
+
+  job = models.ForeignKey(ReportJob, related_name='chunks')
+  index = models.PositiveIntegerField()
+  content = models.TextField()
+
+  class Meta:
+    ordering = ('index',)
+    unique_together = ('job', 'index')
+
+  def __unicode__(self):
+    return u'{} part {}'.format(self.job, self.index)
+
+
 # Grantee reports
 #-----------------
 
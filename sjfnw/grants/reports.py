@@ -0,0 +1,284 @@
+""" Column engine for grants reports (see views.grants_report)
+
+  Each Column declares the fields it reads, the related objects it needs and
+  how to get its value from a row. A Report compiles its columns once into a
+  queryset that loads only what those columns use, plus a list of accessors.
+"""
+from operator import attrgetter
+
+from django.db.models import Count, Prefetch
+
+from sjfnw import utils
+from sjfnw.grants import constants as gc, models
+from sjfnw.grants.utils import local_date_str
+
+
+def get_label(name):
+  return name.capitalize().replace('_', ' ')
+
+
+class Column(object):
+  """ A single report column
+
+    Args:
+      name: column name, also used as the label if one isn't given
+      get: callable returning the value for a row. Defaults to the attribute `name`
+      only: fields to load for this column (see QuerySet.only). Defaults to `name`
+      select: paths to select_related
+      prefetch: lookups (strings or Prefetch objects) to prefetch_related
+      annotate: dict of annotations to add to the queryset
+  """
+
+  def __init__(self, name, get=None, label=None, only=None, select=(),
+               prefetch=(), annotate=None):
+    self.name = name
+    self.label = label or get_label(name)
+    self.get = get or attrgetter(name)
+    self.only = (name,) if only is None else only
+    self.select = select
+    self.prefetch = prefetch
+    self.annotate = annotate or {}
+
+
+def related_column(path, name, label=None, label_prefix=''):
+  """ Column for field `name` on the object at `path`, e.g. 'projectapp__application' """
+  return Column(name, label=label or label_prefix + get_label(name),
+                get=attrgetter('{}.{}'.format(path.replace('__', '.'), name)),
+                only=('{}__{}'.format(path, name),), select=(path,))
+
+
+class Report(object):
+  """ Compiles columns into a queryset and yields rows of values """
+
+  def __init__(self, queryset, columns):
+    select, only, annotate = set(), set(), {}
+    prefetch = []
+    for column in columns:
+      select.update(column.select)
+      only.update(column.only)
+      annotate.update(column.annotate)
+      for lookup in column.prefetch:
+        if lookup not in prefetch:
+          prefetch.append(lookup)
+
+    if select:
+      queryset = queryset.select_related(*select)
+    if prefetch:
+      queryset = queryset.prefetch_related(*prefetch)
+    if annotate:
+      queryset = queryset.annotate(**annotate)
+    self.queryset = queryset.only(*only)
+    self.batched = bool(prefetch)
+
+    self.field_names = [column.label for column in columns]
+    self._accessors = [column.get for column in columns]
+
+  def rows(self, start=0, stop=None):
+    """ Generator of row value lists, optionally only rows start to stop.
+      Loads in batches when prefetching, since queryset.iterator() ignores
+      prefetch_related """
+    if self.batched:
+      objs = utils.iterate_in_batches(self.queryset, start=start, stop=stop)
+    else:
+      objs = self.queryset[start:stop].iterator()
+    accessors = self._accessors
+    for obj in objs:
+      yield [get(obj) for get in accessors]
+
+
+def _fiscal_fields():
+  fields = models.GrantApplication.fields_starting_with('fiscal')
+  fields.remove('fiscal_letter')
+  return fields
+
+
+# Applications
+# -------------
+
+PRE_SCREENING_DISPLAY = dict(gc.PRE_SCREENING)
+SCREENING_DISPLAY = dict(gc.SCREENING)
+
+# shared by the gp, screening and award columns so they prefetch once
+PROJECT_APPS = Prefetch('projectapp_set',
+    queryset=models.ProjectApp.objects.select_related('giving_project', 'givingprojectgrant'))
+
+def _app_pre_screening(app):
+  # convert screening status to human-readable version
+  val = app.pre_screening_status
+  return PRE_SCREENING_DISPLAY[val] if val else val
+
+def _app_gps(app):
+  return ', '.join(papp.giving_project.title for papp in app.projectapp_set.all())
+
+def _app_screening(app):
+  statuses = []
+  for papp in app.projectapp_set.all():
+    if papp.screening_status:
+      statuses.append('%s (%s) ' % (SCREENING_DISPLAY[papp.screening_status],
+                                    papp.giving_project.title))
+    else:
+      statuses.append('%s (none) ' % papp.giving_project.title)
+  return ', '.join(statuses)
+
+def _app_awards(app):
+  awards = []
+  for papp in app.projectapp_set.all():
+    try:
+      award = papp.givingprojectgrant
+    except models.GivingProjectGrant.DoesNotExist:
+      continue
+    awards.append('%s %s ' % (award.total_amount(), papp.giving_project.title))
+  return ', '.join(awards)
+
+def app_columns(options):
+  """ Columns for an application report, given AppReportForm cleaned_data """
+  columns = [
+    Column('submission_time', get=lambda app: local_date_str(app.submission_time)),
+    related_column('organization', 'name', label='Organization'),
+    related_column('grant_cycle', 'title', label='Grant cycle'),
+  ]
+
+  fields = (options['report_basics'] + options['report_contact'] +
+            options['report_org'] + options['report_proposal'] +
+            options['report_budget'])
+  if options['report_fiscal']:
+    fields += _fiscal_fields()
+  # TODO re-implement references reporting
+  if options['report_bonuses']:
+    fields += ['scoring_bonus_poc', 'scoring_bonus_geo']
+
+  for field in fields:
+    if field == 'pre_screening_status':
+      columns.append(Column(field, get=_app_pre_screening))
+    else:
+      columns.append(Column(field))
+
+  if options['report_gps']:
+    columns.append(Column('gps', label='Assigned GPs', get=_app_gps, only=(),
+                          prefetch=(PROJECT_APPS,)))
+  if options['report_gp_screening']:
+    columns.append(Column('gp_screening', label='GP screening status', get=_app_screening,
+                          only=(), prefetch=(PROJECT_APPS,)))
+  if options['report_award']:
+    columns.append(Column('awarded', label='Awarded', get=_app_awards, only=(),
+                          prefetch=(PROJECT_APPS,)))
+  return columns
+
+
+# Organizations
+# --------------
+
+# shared by the applications and awards columns so they prefetch once
+ORG_APPS = Prefetch('grantapplication_set',
+    queryset=models.GrantApplication.objects.select_related('grant_cycle')
+                                            .prefetch_related(PROJECT_APPS))
+
+def org_columns(options):
+  """ Columns for an organization report, given OrgReportForm cleaned_data """
+  linebreak = '\n' if options['format'] == 'csv' else '<br>'
+
+  def applications(org):
+    return ''.join(app.grant_cycle.title + ' ' + app.submission_time.strftime('%m/%d/%Y') +
+                   linebreak for app in org.grantapplication_set.all())
+
+  def awards(org):
+    awards_str = ''
+    for app in org.grantapplication_set.all():
+      for papp in app.projectapp_set.all():
+        try:
+          award = papp.givingprojectgrant
+        except models.GivingProjectGrant.DoesNotExist:
+          continue
+        timestamp = award.check_mailed or award.created
+        if timestamp:
+          timestamp = timestamp.strftime('%m/%d/%Y')
+        else:
+          timestamp = 'No timestamp'
+        awards_str += u'${} {} {}{}'.format(award.total_amount(),
+          papp.giving_project.title, timestamp, linebreak)
+
+    for award in org.sponsoredprogramgrant_set.all():
+      awards_str += '$%s %s %s' % (award.amount, ' sponsored program grant ',
+          (award.check_mailed or award.entered).strftime('%m/%d/%Y'))
+      awards_str += linebreak
+    return awards_str
+
+  columns = [Column('name')]
+  if options.get('report_account_email'):
+    columns.append(Column('email', get=lambda org: org.get_email(),
+                          only=('user__username',), select=('user',)))
+
+  fields = options['report_contact'] + options['report_org']
+  if options.get('report_fiscal'):
+    fields += _fiscal_fields()
+  columns += [Column(field) for field in fields]
+
+  if options.get('report_applications'):
+    columns.append(Column('applications', label='Grant applications', get=applications,
+                          only=(), prefetch=(ORG_APPS,)))
+  if options.get('report_awards'):
+    columns.append(Column('awards', label='Grants awarded', get=awards, only=(),
+                          prefetch=(ORG_APPS, 'sponsoredprogramgrant_set')))
+  return columns
+
+
+# Awards
+# -------
+
+def _org_columns(path, options):
+  """ Organization fields for award reports """
+  fields = options['report_contact'] + options['report_org']
+  if options.get('report_fiscal'):
+    fields += _fiscal_fields()
+  return [related_column(path, field, label_prefix='Org. ') for field in fields]
+
+def gpg_columns(options):
+  """ Columns for a giving project grant report, given GPGrantReportForm cleaned_data """
+  app_path = 'projectapp__application'
+  columns = [
+    Column('check_mailed'),
+    Column('first_year_amount', only=('amount',), get=attrgetter('amount')),
+    Column('second_year_amount', only=('second_amount',),
+           get=lambda award: award.second_amount or ''),
+    Column('total_amount', only=('amount', 'second_amount'),
+           get=lambda award: award.total_amount()),
+    related_column(app_path + '__organization', 'name', label='Organization'),
+    related_column('projectapp__giving_project', 'title', label='Giving project'),
+    related_column(app_path + '__grant_cycle', 'title', label='Grant cycle'),
+  ]
+
+  if options.get('report_id'):
+    columns.append(Column('id'))
+  if options.get('report_check_number'):
+    columns.append(Column('check_number'))
+  if options.get('report_date_approved'):
+    columns.append(Column('approved'))
+  if options.get('report_agreement_dates'):
+    columns.append(Column('agreement_mailed'))
+    columns.append(Column('agreement_returned'))
+  if options.get('report_grantee_report_due'):
+    columns.append(Column('grantee_report_due',
+        get=lambda award: award.next_report_due(),
+        only=('first_report_due', 'second_report_due'),
+        annotate={'report_count': Count('granteereport')}))
+  if options.get('report_support_type'):
+    columns.append(related_column(app_path, 'support_type'))
+
+  return columns + _org_columns(app_path + '__organization', options)
+
+def sponsored_columns(options):
+  """ Columns for a sponsored program grant report, given SponsoredAwardReportForm cleaned_data """
+  columns = [
+    Column('check_mailed'),
+    Column('amount'),
+    related_column('organization', 'name', label='Organization')
+  ]
+
+  if options.get('report_id'):
+    columns.append(Column('id'))
+  if options.get('report_check_number'):
+    columns.append(Column('check_number'))
+  if options.get('report_date_approved'):
+    columns.append(Column('approved'))
+
+  return columns + _org_columns('organization', options)
@@ -1,13 +1,19 @@
+from datetime import datetime
 from unittest import skip
 
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from sjfnw.admin import clear_cached_years
+from sjfnw.grants.admin import ReportYearFilter
 
 from sjfnw.grants import views
 from sjfnw.grants.tests import factories
 from sjfnw.grants.tests.base import BaseGrantTestCase
 from sjfnw.grants.models import (DraftGrantApplication, GrantApplication,
-    Organization, ProjectApp, GrantApplicationLog, GivingProjectGrant,
+    GranteeReport, Organization, ProjectApp, GrantApplicationLog, GivingProjectGrant,
     NarrativeAnswer, SponsoredProgramGrant)
 
 @skip("Needs additional fixtures") #TODO
@@ -318,3 +324,58 @@ class MergeOrgs(BaseGrantTestCase):
     self.assert_length(drafts, 2)
     self.assert_count(papps, 2)
     self.assert_count(sponsored, 1)
+
+
+class LoginAsOrg(BaseGrantTestCase):
+
+  url = reverse('sjfnw.grants.views.login_as_org')
+
+  def setUp(self):
+    super(LoginAsOrg, self).setUp()
+    self.login_as_admin()
+
+  def test_load(self):
+    res = self.client.get(self.url)
+
+    self.assertEqual(res.status_code, 200)
+    self.assertContains(res, 'data-url="/admin/autocomplete/registered-orgs"')
+
+  def test_submit(self):
+    org = factories.Organization()
+
+    res = self.client.post(self.url, {'organization': org.pk})
+
+    self.assertEqual(res.status_code, 302)
+    self.assertTrue(res['Location'].endswith('/apply/?user=' + org.get_email()))
+
+  def test_unregistered_org(self):
+    org = factories.Organization(user=None)
+
+    res = self.client.post(self.url, {'organization': org.pk})
+
+    self.assertEqual(res.status_code, 200)
+    self.assertTrue(res.context['form'].errors['organization'])
+
+
+class AdminYearFilter(BaseGrantTestCase):
+
+  def setUp(self):
+    super(AdminYearFilter, self).setUp()
+    self.login_as_admin()
+
+  def test_datetime_years(self):
+    for year in (2014, 2016, 2016):
+      report = factories.GranteeReport()
+      report.created = timezone.make_aware(datetime(year, 6, 1), timezone.get_current_timezone())
+      report.save()
+
+    res = self.client.get(reverse('admin:grants_granteereport_changelist'))
+
+    spec = [spec for spec in res.context['cl'].filter_specs
+            if isinstance(spec, ReportYearFilter)][0]
+    self.assertEqual([year for year, _ in spec.lookup_choices], [2016, 2014])
+
+  def test_uncached_filter_not_connected(self):
+    """ GrantApplicationYearFilter overrides lookups, so saves don't clear its years """
+    self.assertNotIn(clear_cached_years, post_save._live_receivers(GrantApplication))
+    self.assertIn(clear_cached_years, post_save._live_receivers(GranteeReport))
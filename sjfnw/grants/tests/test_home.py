@@ -2,6 +2,8 @@ from datetime import timedelta
 import json, logging
 
 from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.utils import timezone
 
 from sjfnw.grants import views
@@ -57,6 +59,46 @@ class OrgHomeAwards(BaseGrantTestCase):
     self.assertTemplateUsed(response, self.template)
     self.assertContains(response, 'Agreement mailed')
 
+class OrgHomeCycles(BaseGrantTestCase):
+
+  url = reverse(views.org_home)
+
+  def setUp(self):
+    super(OrgHomeCycles, self).setUp()
+    self.login_as_org()
+
+  def test_listed(self):
+    open_cycle = factories.GrantCycle(status='open')
+    upcoming = factories.GrantCycle(status='upcoming')
+    private = factories.GrantCycle(status='open', private=True)
+
+    res = self.client.get(self.url)
+
+    self.assertEqual(res.context['open'], [open_cycle])
+    self.assertEqual(res.context['upcoming'], [upcoming])
+    self.assertNotContains(res, '/apply/info/{}"'.format(private.pk))
+
+  def test_cached(self):
+    factories.GrantCycle(status='open')
+    for _ in range(3):
+      factories.GrantApplication(organization=self.org)
+    self.client.get(self.url)
+
+    with CaptureQueriesContext(connection) as queries:
+      self.client.get(self.url)
+    self.assertFalse([q for q in queries.captured_queries
+                      if 'FROM "grants_grantcycle"' in q['sql'].split('JOIN')[0]])
+
+  def test_cleared_on_save(self):
+    cycle = factories.GrantCycle(status='open')
+    self.client.get(self.url)
+
+    cycle.title = 'Renamed Grant Cycle'
+    cycle.save()
+    res = self.client.get(self.url)
+
+    self.assertContains(res, 'Renamed Grant Cycle')
+
 class OrgRollover(BaseGrantTestCase):
 
   def setUp(self):
@@ -3,10 +3,11 @@ import logging
 from datetime import timedelta
 from unittest import skip
 
+from django.db import connection
 from django.db.utils import IntegrityError
 from django.forms.models import model_to_dict
 from django.test import TestCase
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.utils import timezone
 
 from sjfnw.grants import constants as gc, models
@@ -77,13 +78,67 @@ class GrantApplication(BaseGrantTestCase):
     self.assertNotEqual(app.get_narrative_answer('describe_mission'),
         answers.get(cycle_narrative__narrative_question__name='describe_mission'))
 
-  @skip('TODO')
   def test_updates_profile(self):
-    pass
+    app = factories.GrantApplication()
+    app = models.GrantApplication.objects.get(pk=app.pk)
+    app.mission = 'Updated mission'
+
+    app.save()
+
+    org = models.Organization.objects.get(pk=app.organization_id)
+    self.assertEqual(org.mission, 'Updated mission')
 
-  @skip('TODO')
   def test_doesnt_update_profile(self):
-    pass
+    """ Saving changes to non-profile fields skips the profile update """
+    app = factories.GrantApplication()
+    models.Organization.objects.filter(pk=app.organization_id).update(mission='Org mission')
+    app = models.GrantApplication.objects.get(pk=app.pk)
+    app.budget_last = 12345
+
+    with CaptureQueriesContext(connection) as queries:
+      app.save()
+
+    self.assert_length(queries, 1)
+    org = models.Organization.objects.get(pk=app.organization_id)
+    self.assertEqual(org.mission, 'Org mission')
+
+  def test_newer_app(self):
+    app = factories.GrantApplication()
+    newer = factories.GrantApplication(organization=app.organization,
+                                       submission_time=app.submission_time + timedelta(days=1))
+    app = models.GrantApplication.objects.get(pk=app.pk)
+    app.mission = 'Old mission'
+
+    app.save()
+
+    org = models.Organization.objects.get(pk=app.organization_id)
+    self.assertEqual(org.mission, newer.mission)
+
+
+class OrganizationUpdateProfile(BaseGrantTestCase):
+
+  def test_saves_changed_fields(self):
+    app = factories.GrantApplication()
+    org = models.Organization.objects.get(pk=app.organization_id)
+    org.update_profile(app) # bring in sync
+    app.website = 'http://example.com/new'
+
+    with CaptureQueriesContext(connection) as queries:
+      org.update_profile(app)
+
+    self.assert_length(queries, 1)
+    self.assertIn('"website"', queries[0]['sql'])
+    self.assertNotIn('"name"', queries[0]['sql'])
+
+  def test_no_changes(self):
+    app = factories.GrantApplication()
+    org = models.Organization.objects.get(pk=app.organization_id)
+    org.update_profile(app)
+
+    with CaptureQueriesContext(connection) as queries:
+      org.update_profile(app)
+
+    self.assert_length(queries, 0)
 
 class OrganizationGetStaffEntered(TestCase):
 
@@ -0,0 +1,139 @@
+from django.core.urlresolvers import reverse
+
+from sjfnw.grants import models
+from sjfnw.grants.tests import factories
+from sjfnw.grants.tests.base import BaseGrantTestCase
+
+
+class SearchIndex(BaseGrantTestCase):
+
+  def setUp(self):
+    super(SearchIndex, self).setUp()
+    self.app = factories.GrantApplication(organization__name='Riverside Tenants Union')
+    self.answer = self.app.narrativeanswer_set.first()
+    self.answer.text = 'We organize around housing displacement'
+    self.answer.save()
+
+  def search(self, query, kind):
+    return [row['object_id'] for row in models.SearchEntry.objects.matching(query).ids(kind)]
+
+  def test_prefix(self):
+    self.assertEqual(self.search('river tenant', models.SearchEntry.ORGANIZATION),
+                     [self.app.organization_id])
+    self.assertEqual(self.search('displace', models.SearchEntry.ANSWER), [self.answer.pk])
+    self.assertEqual(self.search('riverside landlords', models.SearchEntry.ORGANIZATION), [])
+
+  def test_short_words(self):
+    org = factories.Organization(name='NW Youth of the Arc')
+
+    self.assertEqual(self.search('nw youth', models.SearchEntry.ORGANIZATION), [org.pk])
+    self.assertEqual(self.search('the arc', models.SearchEntry.ORGANIZATION), [org.pk])
+
+  def test_split_mysql_words(self):
+    """ Words mysql's FULLTEXT index skips are matched with LIKE instead """
+    self.assertEqual(models.split_mysql_words(['NW', 'Youth', 'The', 'Arc']),
+                     (['Youth', 'Arc'], ['NW', 'The']))
+
+  def test_subquery(self):
+    """ ids() can be used as a subquery, where django aliases the table """
+    ids = models.SearchEntry.objects.matching('riverside').ids(models.SearchEntry.ORGANIZATION)
+    self.assertEqual(list(models.Organization.objects.filter(pk__in=ids)),
+                     [self.app.organization])
+
+  def test_empty_query(self):
+    self.assert_count(models.SearchEntry.objects.matching(' ? '), 0)
+
+  def test_org_rename(self):
+    org = self.app.organization
+    org.name = 'Eastside Housing Coalition'
+    org.save()
+
+    self.assertEqual(self.search('riverside', models.SearchEntry.ORGANIZATION), [])
+    self.assertEqual(self.search('eastside', models.SearchEntry.ORGANIZATION), [org.pk])
+
+  def test_org_saved_without_rename(self):
+    """ Saves that don't change the name (e.g. profile updates on submit) skip indexing """
+    org = self.app.organization
+    models.SearchEntry.objects.filter(kind=models.SearchEntry.ORGANIZATION,
+                                      object_id=org.pk).delete()
+    org.city = 'Tacoma'
+    org.save()
+
+    self.assertEqual(self.search('riverside', models.SearchEntry.ORGANIZATION), [])
+
+  def test_app_cycle_title(self):
+    title = self.app.grant_cycle.title.split()[0]
+    self.assertIn(self.app.pk, self.search(title, models.SearchEntry.APPLICATION))
+
+  def test_cycle_rename(self):
+    cycle = self.app.grant_cycle
+    cycle.title = 'Tidewater Grant Cycle'
+    cycle.save()
+
+    self.assertEqual(self.search('tidewater', models.SearchEntry.APPLICATION),
+                     [self.app.pk])
+
+  def test_answer_deleted(self):
+    answer_id = self.answer.pk
+    self.answer.delete()
+
+    self.assertEqual(self.search('displacement', models.SearchEntry.ANSWER), [])
+    self.assert_count(models.SearchEntry.objects.filter(object_id=answer_id,
+                                                        kind=models.SearchEntry.ANSWER), 0)
+
+
+class AdminTextSearch(BaseGrantTestCase):
+
+  def setUp(self):
+    super(AdminTextSearch, self).setUp()
+    self.login_as_admin()
+    self.app = factories.GrantApplication(organization__name='Riverside Tenants Union')
+    self.answer = self.app.narrativeanswer_set.first()
+    self.answer.text = 'We organize around housing displacement'
+    self.answer.save()
+    self.other = factories.GrantApplication(organization__name='Northwest Farmworkers')
+
+  def test_narrative_changelist(self):
+    res = self.client.get(reverse('admin:grants_narrativeanswer_changelist'),
+                          {'q': 'displacement'})
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual([answer.pk for answer in res.context['cl'].result_list], [self.answer.pk])
+
+  def test_org_changelist(self):
+    res = self.client.get(reverse('admin:grants_organization_changelist'), {'q': 'farm'})
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual(list(res.context['cl'].result_list), [self.other.organization])
+
+  def test_org_changelist_username(self):
+    user = self.other.organization.user
+    user.username = 'info@nwfw.net'
+    user.save()
+
+    res = self.client.get(reverse('admin:grants_organization_changelist'), {'q': 'nwfw.net'})
+
+    self.assertEqual(list(res.context['cl'].result_list), [self.other.organization])
+
+  def test_narrative_changelist_question(self):
+    question = self.answer.cycle_narrative.narrative_question
+
+    res = self.client.get(reverse('admin:grants_narrativeanswer_changelist'),
+                          {'q': question.version})
+
+    self.assertIn(self.answer, res.context['cl'].result_list)
+
+  def test_text_search_page(self):
+    res = self.client.get('/admin/grants/text-search', {'q': 'housing', 'kind': 'answer'})
+
+    self.assertEqual(res.status_code, 200)
+    self.assertEqual([entry.object_id for entry in res.context['entries']], [self.answer.pk])
+    self.assertContains(res, self.app.organization.name)
+
+  def test_text_search_requires_staff(self):
+    self.client.logout()
+
+    res = self.client.get('/admin/grants/text-search', {'q': 'housing'})
+
+    self.assertEqual(res.status_code, 302)
+    self.assertIn('/admin/login', res['Location'])
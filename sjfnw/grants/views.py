@@ -1,13 +1,15 @@
-from datetime import datetime, timedelta
-import json, logging, re, urllib2
+from datetime import datetime
+from StringIO import StringIO
+import hashlib, json, logging, re, urllib2
 
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
 from django.forms.models import model_to_dict
-from django.http import JsonResponse, HttpResponse, Http404
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
 from django.shortcuts import render, render_to_response, get_object_or_404, redirect
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
@@ -19,10 +21,10 @@ import unicodecsv
 from sjfnw import constants as c, utils
 from sjfnw.decorators import login_required_ajax
 from sjfnw.fund.models import Member
-from sjfnw.grants import constants as gc
-from sjfnw.grants import models, forms, modelforms
+from sjfnw.grants import cache as grants_cache, constants as gc
+from sjfnw.grants import models, forms, modelforms, reports
 from sjfnw.grants.decorators import registered_org
-from sjfnw.grants.utils import (local_date_str, find_blobinfo,
+from sjfnw.grants.utils import (find_blobinfo,
     get_user_override, format_draft_contents)
 
 logger = logging.getLogger('sjfnw')
@@ -163,12 +165,12 @@ def not_registered(request):
 def org_home(request, org):
   """ Home page shows overview of grant cycles and org's apps and drafts """
 
-  submitted = org.grantapplication_set.order_by('-submission_time')
+  submitted = org.grantapplication_set.select_related('grant_cycle').order_by('-submission_time')
   submitted_by_id = {}
   submitted_cycles = []
   for app in submitted:
     app.awards = []
-    submitted_cycles.append(app.grant_cycle.pk)
+    submitted_cycles.append(app.grant_cycle_id)
     submitted_by_id[app.pk] = app
 
   awards = (models.GivingProjectGrant.objects
@@ -182,10 +184,7 @@ def org_home(request, org):
 
   drafts = org.draftgrantapplication_set.select_related('grant_cycle')
 
-  cycles = (models.GrantCycle.objects
-      .exclude(private=True)
-      .filter(close__gt=timezone.now() - timedelta(days=180))
-      .order_by('close'))
+  cycles = list(reversed(grants_cache.get_recent_cycles(include_private=False)))
 
   closed, current, upcoming = [], [], []
   for cycle in cycles:
@@ -864,8 +863,9 @@ def login_as_org(request):
     form = forms.LoginAsOrgForm(request.POST)
     if form.is_valid():
       org = form.cleaned_data['organization']
-      return redirect('/apply/?user=' + org)
-  form = forms.LoginAsOrgForm()
+      return redirect('/apply/?user=' + org.get_email())
+  else:
+    form = forms.LoginAsOrgForm()
   return render(request, 'admin/grants/impersonate.html', {'form': form})
 
 def _merge_conflict(a, b):
@@ -970,6 +970,9 @@ def grantee_report_statuses(request):
 #  Reporting
 # -----------------------------------------------------------------------------
 
+REPORT_PAGE_SIZE = 500
+TEXT_SEARCH_LIMIT = 100
+
 def grants_report(request):
   """ Handles grant reporting
 
@@ -996,28 +999,28 @@ def grants_report(request):
       form = forms.AppReportForm(request.POST)
       context['app_form'] = form
       context['active_form'] = '#application-form'
-      results_func = get_app_results
+      report_type = 'application'
 
     elif 'run-organization' in request.POST:
       logger.info('Org report')
       form = forms.OrgReportForm(request.POST)
       context['org_form'] = form
       context['active_form'] = '#organization-form'
-      results_func = get_org_results
+      report_type = 'organization'
 
     elif 'run-giving-project-grant' in request.POST:
       logger.info('Giving project grant report')
       form = forms.GPGrantReportForm(request.POST)
       context['award_form'] = form
       context['active_form'] = '#giving-project-grant-form'
-      results_func = get_gpg_results
+      report_type = 'giving-project-grant'
 
     elif 'run-sponsored-award' in request.POST:
       logger.info('Sponsored award report')
       form = forms.SponsoredAwardReportForm(request.POST)
       context['award_form'] = form
       context['active_form'] = '#sponsored-award-form'
-      results_func = get_sponsored_award_results
+      report_type = 'sponsored-award'
 
     else:
       logger.error('Unknown report type')
@@ -1027,21 +1030,30 @@ def grants_report(request):
       options = form.cleaned_data
       logger.info('A valid form: ' + str(options))
 
-      # get results
-      field_names, results = results_func(options)
+      if options['format'] == 'background':
+        queue_report(report_type, options, request.user.username)
+        return redirect(report_jobs)
 
-      # format results
+      # format results - each a generator of rows
       if options['format'] == 'browse':
-        return render_to_response('grants/report_results.html',
-                                  {'results': results, 'field_names': field_names})
+        try:
+          page = max(int(request.POST.get('page', 1)), 1)
+        except ValueError:
+          page = 1
+        start = (page - 1) * REPORT_PAGE_SIZE
+        # fetch one extra row to find out whether there's a next page
+        field_names, results = REPORT_RESULTS[report_type](
+            options, start=start, stop=start + REPORT_PAGE_SIZE + 1)
+        rows = list(results)
+        post_data = [(key, value) for key, values in request.POST.lists()
+                     for value in values if key != 'page']
+        return render_to_response('grants/report_results.html', {
+          'results': rows[:REPORT_PAGE_SIZE], 'field_names': field_names,
+          'page': page, 'has_next': len(rows) > REPORT_PAGE_SIZE, 'post_data': post_data
+        })
       elif options['format'] == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename=%s.csv' % 'grantapplications'
-        writer = unicodecsv.writer(response)
-        writer.writerow(field_names)
-        for row in results:
-          writer.writerow(row)
-        return response
+        field_names, results = REPORT_RESULTS[report_type](options)
+        return utils.csv_response('grantapplications', field_names, results)
     else:
       logger.warning('Invalid form!')
 
@@ -1061,17 +1073,18 @@ def get_min_max_year(options):
   max_year = timezone.make_aware(max_year, current_tz)
   return min_year, max_year
 
-def get_app_results(options):
+def get_app_results(options, start=0, stop=None):
   """ Fetches application report results
 
   Arguments:
     options - cleaned_data from a request.POST-filled instance of AppReportForm
+    start, stop - optional slice of the results, applied in the database
 
   Returns:
     A list of display-formatted field names. Example:
       ['Submitted', 'Organization', 'Grant cycle']
 
-    A list of applications & related info. Example:
+    A generator of applications & related info, one list per app. Example:
       [
         ['2011-04-20 06:18:36+0:00', 'Justice League', 'LGBTQ Grant Cycle'],
         ['2013-10-23 09:08:56+0:00', 'ACLU of Idaho', 'General Grant Cycle'],
@@ -1079,15 +1092,15 @@ def get_app_results(options):
   """
   logger.info('Get app results')
 
-  apps = models.GrantApplication.objects.order_by('-submission_time').select_related(
-      'organization', 'grant_cycle')
+  apps = models.GrantApplication.objects.order_by('-submission_time')
 
   # filters
   min_year, max_year = get_min_max_year(options)
   apps = apps.filter(submission_time__gte=min_year, submission_time__lte=max_year)
 
   if options.get('organization_name'):
-    apps = apps.filter(organization__name__contains=options['organization_name'])
+    apps = apps.filter(organization__in=models.SearchEntry.objects
+        .matching(options['organization_name']).ids(models.SearchEntry.ORGANIZATION))
   if options.get('city'):
     apps = apps.filter(city=options['city'])
   if options.get('state'):
@@ -1106,108 +1119,24 @@ def get_app_results(options):
   if options.get('grant_cycle'):
     apps = apps.filter(grant_cycle__title__in=options.get('grant_cycle'))
   if options.get('giving_projects'):
-    apps = apps.prefetch_related('giving_projects')
     apps = apps.filter(giving_projects__title__in=options.get('giving_projects'))
 
-  # fields
-  fields = (['submission_time', 'organization', 'grant_cycle'] +
-            options['report_basics'] + options['report_contact'] +
-            options['report_org'] + options['report_proposal'] +
-            options['report_budget'])
-  if options['report_fiscal']:
-    fields += models.GrantApplication.fields_starting_with('fiscal')
-    fields.remove('fiscal_letter')
-  # TODO re-implement references reporting
-  if options['report_bonuses']:
-    fields.append('scoring_bonus_poc')
-    fields.append('scoring_bonus_geo')
-
-  # format headers
-  field_names = [f.capitalize().replace('_', ' ') for f in fields]
-
-  # gp screening, grant awards
-  get_gps = False
-  get_gp_ss = False
-  get_awards = False
-  if options['report_gps']:
-    field_names.append('Assigned GPs')
-    get_gps = True
-  if options['report_gp_screening']:
-    field_names.append('GP screening status')
-    get_gp_ss = True
-  if options['report_award']:
-    field_names.append('Awarded')
-    get_awards = True
-
-  # execute queryset, populate results
-  results = []
-  for app in apps:
-    row = []
-
-    # application fields
-    for field in fields:
-      if field == 'pre_screening_status':
-        # convert screening status to human-readable version
-        val = getattr(app, field)
-        if val:
-          convert = dict(gc.PRE_SCREENING)
-          val = convert[val]
-        row.append(val)
-      elif field == 'submission_time':
-        row.append(local_date_str(getattr(app, field)))
-      else:
-        row.append(getattr(app, field))
-
-    # gp GPs, screening status, awards
-    if get_gps or get_awards or get_gp_ss:
-      award_col = ''
-      ss_col = ''
-      gp_col = ''
-      papps = app.projectapp_set.all()
-      if papps:
-        for papp in papps:
-          if get_gps:
-            if gp_col != '':
-              gp_col += ', '
-            gp_col += '%s' % papp.giving_project.title
-          if get_awards:
-            try:
-              award = papp.givingprojectgrant
-              if award_col != '':
-                award_col += ', '
-              award_col += '%s %s ' % (award.total_amount(), papp.giving_project.title)
-            except models.GivingProjectGrant.DoesNotExist:
-              pass
-          if get_gp_ss:
-            if ss_col != '':
-              ss_col += ', '
-            if papp.screening_status:
-              ss_col += '%s (%s) ' % (dict(gc.SCREENING)[papp.screening_status],
-                papp.giving_project.title)
-            else:
-              ss_col += '%s (none) ' % papp.giving_project.title
-      if get_gps:
-        row.append(gp_col)
-      if get_gp_ss:
-        row.append(ss_col)
-      if get_awards:
-        row.append(award_col)
-
-    results.append(row)
-
-  return field_names, results
-
-def get_org_results(options):
+  # columns determine what is selected & prefetched
+  report = reports.Report(apps, reports.app_columns(options))
+  return report.field_names, report.rows(start, stop)
+
+def get_org_results(options, start=0, stop=None):
   """ Fetch organization report results
 
   Args:
     options: cleaned_data from a request.POST-filled instance of OrgReportForm
+    start, stop: optional slice of the results, applied in the database
 
   Returns:
     A list of display-formatted field names. Example:
       ['Name', 'Login', 'State']
 
-    A list of organization & related info. Each item is a list of requested values
+    A generator of organization & related info. Each item is a list of requested values
     Example: [
         ['Fancy pants org', 'fancy@pants.org', 'ID'],
         ['Justice League', 'trouble@gender.org', 'WA']
@@ -1224,7 +1153,8 @@ def get_org_results(options):
   elif reg is False:
     org = orgs.filter(user__isnull=True)
   if options.get('organization_name'):
-    orgs = orgs.filter(name__contains=options['organization_name'])
+    orgs = orgs.filter(pk__in=models.SearchEntry.objects
+        .matching(options['organization_name']).ids(models.SearchEntry.ORGANIZATION))
   if options.get('city'):
     orgs = orgs.filter(city=options['city'])
   if options.get('state'):
@@ -1232,93 +1162,21 @@ def get_org_results(options):
   if options.get('has_fiscal_sponsor'):
     orgs = orgs.exclude(fiscal_org='')
 
-  # fields
-  fields = ['name']
-  if options.get('report_account_email'):
-    fields.append('email')
-  fields += options['report_contact'] + options['report_org']
-  if options.get('report_fiscal'):
-    fields += models.GrantApplication.fields_starting_with('fiscal')
-    fields.remove('fiscal_letter')
-
-  field_names = [f.capitalize().replace('_', ' ') for f in fields] # for display
-
-  # related objects
-  get_apps = False
-  get_awards = False
-  if options.get('report_applications'):
-    get_apps = True
-    orgs = orgs.prefetch_related('grantapplication_set')
-    field_names.append('Grant applications')
-  if options.get('report_awards'):
-    orgs = orgs.prefetch_related('grantapplication_set')
-    orgs = orgs.prefetch_related('sponsoredprogramgrant_set')
-    field_names.append('Grants awarded')
-    get_awards = True
-
-  # execute queryset, build results
-  results = []
-  linebreak = '\n' if options['format'] == 'csv' else '<br>'
-  for org in orgs:
-    row = []
-
-    # org fields
-    for field in fields:
-      if field == 'email':
-        row.append(org.get_email())
-      else:
-        row.append(getattr(org, field))
-
-    awards_str = ''
-    if get_apps or get_awards:
-      apps_str = ''
-
-      for app in org.grantapplication_set.all():
-        if get_apps:
-          apps_str += (app.grant_cycle.title + ' ' +
-            app.submission_time.strftime('%m/%d/%Y') + linebreak)
-
-        # giving project grants
-        if get_awards:
-          for papp in app.projectapp_set.all():
-            try:
-              award = papp.givingprojectgrant
-              timestamp = award.check_mailed or award.created
-              if timestamp:
-                timestamp = timestamp.strftime('%m/%d/%Y')
-              else:
-                timestamp = 'No timestamp'
-              awards_str += u'${} {} {}{}'.format(award.total_amount(),
-                award.projectapp.giving_project.title, timestamp, linebreak)
-            except models.GivingProjectGrant.DoesNotExist:
-              pass
-
-      if get_apps:
-        row.append(apps_str)
-
-    # sponsored program grants
-    if get_awards:
-      for award in org.sponsoredprogramgrant_set.all():
-        awards_str += '$%s %s %s' % (award.amount, ' sponsored program grant ',
-            (award.check_mailed or award.entered).strftime('%m/%d/%Y'))
-        awards_str += linebreak
-      row.append(awards_str)
-
-    results.append(row)
-
-  return field_names, results
-
-def get_gpg_results(options):
+  report = reports.Report(orgs, reports.org_columns(options))
+  return report.field_names, report.rows(start, stop)
+
+def get_gpg_results(options, start=0, stop=None):
   """ Fetch giving project grant report results
 
   Args:
     options: cleaned_data from a request.POST-filled instance of AwardReportForm
+    start, stop: optional slice of the results, applied in the database
 
   Returns:
     field_names: A list of display-formatted field names.
       Example: ['Amount', 'Check mailed', 'Organization']
 
-    results: A list of requested values for each award.
+    results: A generator of requested values for each award.
       Example (matching field_names example): [
           ['10000', '2013-10-23 09:08:56+0:00', 'Fancy pants org'],
           ['5987', '2011-08-04 09:08:56+0:00', 'Justice League']
@@ -1326,16 +1184,16 @@ def get_gpg_results(options):
   """
 
   # initial queryset
-  gp_awards = models.GivingProjectGrant.objects.select_related(
-      'projectapp__application__organization', 'projectapp__giving_project')
+  gp_awards = models.GivingProjectGrant.objects.all()
 
   # filters
   min_year, max_year = get_min_max_year(options)
   gp_awards = gp_awards.filter(created__gte=min_year, created__lte=max_year)
 
   if options.get('organization_name'):
-    gp_awards = gp_awards.filter(
-        projectapp__application__organization__name__contains=options['organization_name'])
+    org_ids = (models.SearchEntry.objects.matching(options['organization_name'])
+                                         .ids(models.SearchEntry.ORGANIZATION))
+    gp_awards = gp_awards.filter(projectapp__application__organization__in=org_ids)
 
   if options.get('city'):
     gp_awards = gp_awards.filter(projectapp__application__city=options['city'])
@@ -1355,69 +1213,18 @@ def get_gpg_results(options):
       projectapp__giving_project__title__in=options.get('giving_projects')
     )
 
-  # fields
-  fields = ['check_mailed', 'first_year_amount', 'second_year_amount', 'total_amount',
-            'organization', 'giving_project', 'grant_cycle']
-
-  if options.get('report_id'):
-    fields.append('id')
-  if options.get('report_check_number'):
-    fields.append('check_number')
-  if options.get('report_date_approved'):
-    fields.append('approved')
-  if options.get('report_agreement_dates'):
-    fields.append('agreement_mailed')
-    fields.append('agreement_returned')
-  if options.get('report_grantee_report_due'):
-    fields.append('grantee_report_due')
-  if options.get('report_support_type'):
-    fields.append('support_type')
-
-  org_fields = options['report_contact'] + options['report_org']
-  if options.get('report_fiscal'):
-    org_fields += models.GrantApplication.fields_starting_with('fiscal')
-    org_fields.remove('fiscal_letter')
-
-  # get values
-  results = []
-  for award in gp_awards:
-    row = []
-    for field in fields:
-      if field == 'organization':
-        row.append(award.projectapp.application.organization.name)
-      elif field == 'grant_cycle':
-        row.append(award.projectapp.application.grant_cycle.title)
-      elif field == 'support_type':
-        row.append(award.projectapp.application.support_type)
-      elif field == 'giving_project':
-        row.append(award.projectapp.giving_project.title)
-      elif field == 'grantee_report_due':
-        row.append(award.next_report_due())
-      elif field == 'first_year_amount':
-        row.append(award.amount)
-      elif field == 'second_year_amount':
-        row.append(award.second_amount or '')
-      elif field == 'total_amount':
-        row.append(award.total_amount())
-      else:
-        row.append(getattr(award, field, ''))
-    for field in org_fields:
-      row.append(getattr(award.projectapp.application.organization, field))
-    results.append(row)
-
-  field_names = [f.capitalize().replace('_', ' ') for f in fields]
-  field_names += ['Org. ' + f.capitalize().replace('_', ' ') for f in org_fields]
+  report = reports.Report(gp_awards, reports.gpg_columns(options))
+  return report.field_names, report.rows(start, stop)
 
-  return field_names, results
-
-def get_sponsored_award_results(options):
-  sponsored = models.SponsoredProgramGrant.objects.select_related('organization')
+def get_sponsored_award_results(options, start=0, stop=None):
+  sponsored = models.SponsoredProgramGrant.objects.all()
 
   min_year, max_year = get_min_max_year(options)
   sponsored = sponsored.filter(entered__gte=min_year, entered__lte=max_year)
 
   if options.get('organization_name'):
-    sponsored = sponsored.filter(organization__name__contains=options['organization_name'])
+    sponsored = sponsored.filter(organization__in=models.SearchEntry.objects
+        .matching(options['organization_name']).ids(models.SearchEntry.ORGANIZATION))
   if options.get('city'):
     sponsored = sponsored.filter(organization__city=options['city'])
   if options.get('state'):
@@ -1425,37 +1232,129 @@ def get_sponsored_award_results(options):
   if options.get('has_fiscal_sponsor'):
     sponsored = sponsored.exclude(organization__fiscal_org='')
 
-  # fields
-  fields = ['check_mailed', 'amount', 'organization']
-  if options.get('report_id'):
-    fields.append('id')
-  if options.get('report_check_number'):
-    fields.append('check_number')
-  if options.get('report_date_approved'):
-    fields.append('approved')
-
-  org_fields = options['report_contact'] + options['report_org']
-  if options.get('report_fiscal'):
-    org_fields += models.GrantApplication.fields_starting_with('fiscal')
-    org_fields.remove('fiscal_letter')
-
-  # get values
-  results = []
-  for award in sponsored:
-    row = []
-    for field in fields:
-      if hasattr(award, field):
-        row.append(getattr(award, field))
-      else:
-        row.append('')
-    for field in org_fields:
-      row.append(getattr(award.organization, field))
-    results.append(row)
+  report = reports.Report(sponsored, reports.sponsored_columns(options))
+  return report.field_names, report.rows(start, stop)
 
-  field_names = [f.capitalize().replace('_', ' ') for f in fields]
-  field_names += ['Org. ' + f.capitalize().replace('_', ' ') for f in org_fields]
+REPORT_RESULTS = {
+  'application': get_app_results,
+  'organization': get_org_results,
+  'giving-project-grant': get_gpg_results,
+  'sponsored-award': get_sponsored_award_results
+}
+
+def queue_report(report_type, options, requested_by=''):
+  """ Get a background report job for the given options, creating and running
+    one unless a recent job with the same options can be reused """
+  options = dict(options, format='csv')
+  options_json = json.dumps(options, sort_keys=True)
+  options_hash = hashlib.sha1(options_json).hexdigest()
+
+  job = models.ReportJob.objects.reusable(report_type, options_hash)
+  if job:
+    logger.info('Reusing report job %d', job.pk)
+    return job
+
+  job = models.ReportJob.objects.create(report_type=report_type, options=options_json,
+      options_hash=options_hash, requested_by=requested_by)
+  utils.defer(run_report_job, job.pk)
+  return job
+
+def run_report_job(job_id):
+  """ Generate a report job's csv. Failures are recorded on the job rather than
+    raised, so the task isn't retried """
+  job = models.ReportJob.objects.get(pk=job_id)
+  if job.status == models.ReportJob.RUNNING and job.is_stale():
+    logger.warning('Report job %d started %s and never finished; running again',
+                   job.pk, job.started)
+  elif job.status != models.ReportJob.QUEUED:
+    logger.info('Report job %d is already %s', job.pk, job.status)
+    return
+
+  job.status = models.ReportJob.RUNNING
+  job.started = timezone.now()
+  job.save()
+
+  # from a previous run that didn't finish
+  job.chunks.all().delete()
+  try:
+    field_names, results = REPORT_RESULTS[job.report_type](json.loads(job.options))
+    row_count = _write_report_chunks(job, field_names, results)
+  except Exception as err: # pylint: disable=broad-except
+    logger.exception('Report job %d failed', job.pk)
+    job.chunks.all().delete()
+    job.status = models.ReportJob.FAILED
+    job.error = unicode(err)
+  else:
+    job.status = models.ReportJob.DONE
+    job.row_count = row_count
+  job.finished = timezone.now()
+  job.save()
+
+def _write_report_chunks(job, field_names, results):
+  """ Write the csv to ReportJobChunks as it's generated. Returns the row count """
+  output = StringIO()
+  writer = unicodecsv.writer(output)
+  writer.writerow(field_names)
+  row_count = 0
+  index = 0
+  for row in results:
+    writer.writerow(row)
+    row_count += 1
+    if row_count % models.ReportJobChunk.ROWS == 0:
+      models.ReportJobChunk.objects.create(job=job, index=index,
+                                           content=output.getvalue().decode('utf-8'))
+      index += 1
+      output.seek(0)
+      output.truncate()
+  if output.tell() or index == 0:
+    models.ReportJobChunk.objects.create(job=job, index=index,
+                                         content=output.getvalue().decode('utf-8'))
+  return row_count
+
+@staff_member_required
+def report_jobs(request):
+  """ List recent background report jobs """
+  jobs = models.ReportJob.objects.defer('options')[:50]
+  return render(request, 'admin/grants/report_jobs.html', {
+    'jobs': jobs, 'reuse_minutes': settings.REPORT_JOB_REUSE_MINUTES
+  })
+
+@staff_member_required
+def text_search(request):
+  """ Full-text search of organization names, applications and narrative answers """
+  form = forms.TextSearchForm(request.GET or None)
+  entries = None
+  if form.is_valid():
+    entries = models.SearchEntry.objects.matching(form.cleaned_data['q'])
+    if form.cleaned_data['kind']:
+      entries = entries.filter(kind=form.cleaned_data['kind'])
+    entries = (entries.select_related('organization', 'grant_application__organization',
+                                      'grant_application__grant_cycle')
+                      .order_by('-pk')[:TEXT_SEARCH_LIMIT])
+  return render(request, 'admin/grants/text_search.html', {
+    'form': form, 'entries': entries, 'searched': entries is not None,
+    'limit': TEXT_SEARCH_LIMIT
+  })
 
-  return field_names, results
+@staff_member_required
+def report_job_download(request, job_id):
+  job = get_object_or_404(models.ReportJob.objects.defer('options'), pk=job_id,
+                          status=models.ReportJob.DONE)
+
+  def chunks():
+    """ Load one chunk at a time, so the whole csv is never in memory """
+    contents = models.ReportJobChunk.objects.filter(job=job).values_list('content', flat=True)
+    index = 0
+    while True:
+      content = contents.filter(index=index).first()
+      if content is None:
+        return
+      yield content.encode('utf-8')
+      index += 1
+
+  response = StreamingHttpResponse(chunks(), content_type='text/csv')
+  response['Content-Disposition'] = 'attachment; filename=%s' % job.filename()
+  return response
 
 # -----------------------------------------------------------------------------
 #  Helpers
@@ -13,25 +13,52 @@ from google.appengine.runtime import apiproxy_errors
 
 logger = logging.getLogger('sjfnw')
 
-def _send_deferred(message, fail_silently=False):
-  try:
-    message.send()
-  except (gaemail.Error, apiproxy_errors.Error):
-    if not fail_silently:
-      raise
+# times to retry messages that failed to send from a batch
+MAX_BATCH_ATTEMPTS = 5
+
+def _send_deferred(messages, fail_silently=False, attempt=1):
+  """ Send a batch of messages. Failed messages are retried in a new task, so
+    messages that did send aren't sent again """
+  # tasks queued before batching was added pass a single message
+  if not isinstance(messages, (list, tuple)):
+    messages = [messages]
+  failed = []
+  for message in messages:
+    try:
+      message.send()
+    except (gaemail.Error, apiproxy_errors.Error) as err:
+      logger.warning('Sending to %s failed: %s', message.to, err)
+      failed.append(message)
+
+  if failed and not fail_silently:
+    if attempt < MAX_BATCH_ATTEMPTS:
+      logger.info('Retrying %d of %d messages', len(failed), len(messages))
+      _defer_messages(failed, fail_silently, attempt=attempt + 1)
+    else:
+      logger.error('Giving up on %d messages after %d attempts', len(failed), attempt)
+
+
+def _defer_messages(messages, fail_silently, attempt=1):
+  queue_name = getattr(settings, 'EMAIL_QUEUE_NAME', 'default')
+  deferred.defer(_send_deferred, messages, fail_silently=fail_silently,
+                 attempt=attempt, _queue=queue_name, _countdown=60 * (attempt - 1))
 
 
 class EmailBackend(BaseEmailBackend):
   """ Asynchronous email backend """
 
   def send_messages(self, email_messages):
-    """ Call _send for each message & return count of messages """
+    """ Convert messages and add them to the send queue as a single task.
+      Returns count of messages queued """
 
-    num_sent = 0
+    messages = []
     for message in email_messages:
-      if self._send(message):
-        num_sent += 1
-    return num_sent
+      message = self._convert(message)
+      if message:
+        messages.append(message)
+    if messages:
+      _defer_messages(messages, self.fail_silently)
+    return len(messages)
 
   def _copy_message(self, message):
     """ Create and return App Engine EmailMessage class from message """
@@ -64,25 +91,15 @@ class EmailBackend(BaseEmailBackend):
           break
     return gmsg
 
-  def _send(self, message):
-    """
-    Use _copy_message to convert to gae email obj
-    Call _defer_message to add to send queue
-    """
+  def _convert(self, message):
+    """ Use _copy_message to convert to gae email obj. Returns None if invalid """
     try:
-      message = self._copy_message(message)
+      return self._copy_message(message)
     except (ValueError, gaemail.InvalidEmailError), err:
       logger.error(err)
       if not self.fail_silently:
         raise
-      return False
-    self._defer_message(message)
-    return True
-
-  def _defer_message(self, message):
-    queue_name = getattr(settings, 'EMAIL_QUEUE_NAME', 'default')
-    deferred.defer(_send_deferred, message, fail_silently=self.fail_silently,
-                   _queue=queue_name)
+      return None
 
 # Djangoappengine license:
 
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CronRun',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('job', models.CharField(max_length=100)),
+                ('started', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished', models.DateTimeField(null=True, blank=True)),
+                ('chunk_count', models.PositiveIntegerField(default=0)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('sent', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('-started',),
+            },
+        ),
+        migrations.CreateModel(
+            name='CronChunk',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('first_pk', models.PositiveIntegerField()),
+                ('last_pk', models.PositiveIntegerField()),
+                ('cursor', models.PositiveIntegerField(null=True, blank=True)),
+                ('rows', models.PositiveIntegerField(default=0)),
+                ('sent', models.PositiveIntegerField(default=0)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('completed', models.DateTimeField(null=True, blank=True)),
+                ('run', models.ForeignKey(related_name='chunks', to='sjfnw.CronRun')),
+            ],
+            options={
+                'ordering': ('run', 'first_pk'),
+            },
+        ),
+    ]
@@ -1,5 +1,13 @@
+import logging
+
 from django.contrib.auth.models import User
 from django.core.validators import MaxLengthValidator
+from django.db import models
+from django.db.models import F, Sum
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+logger = logging.getLogger('sjfnw')
 
 # pylint: disable=protected-access
 
@@ -38,3 +46,145 @@ def patch_user_model(model):
 
 if User._meta.get_field("username").max_length != 100:
   patch_user_model(User)
+
+
+# Change tracking
+
+def _comparable(value):
+  # file fields hold the same FieldFile object; compare by file name
+  return value.name if isinstance(value, FieldFile) else value
+
+
+class DirtyFieldsMixin(object):
+  """ Model mixin that remembers field values as of load or the last save, so
+    saves can tell what changed without reading the row again
+
+    Use before models.Model in the bases. Values are tracked by attname, e.g.
+    'organization_id'. Instances that weren't loaded from the database have no
+    snapshot, so every field counts as changed.
+  """
+  _loaded_values = None
+
+  @classmethod
+  def from_db(cls, db, field_names, values):
+    instance = super(DirtyFieldsMixin, cls).from_db(db, field_names, values)
+    instance._loaded_values = instance._get_values(field_names)
+    return instance
+
+  def _get_loaded_attnames(self):
+    deferred = self.get_deferred_fields()
+    return [field.attname for field in self._meta.concrete_fields
+            if field.attname not in deferred]
+
+  def _get_values(self, attnames):
+    return {attname: _comparable(getattr(self, attname)) for attname in attnames}
+
+  @property
+  def changed_fields(self):
+    """ Set of attnames whose values changed since load or the last save.
+      Fields that were deferred when loading aren't included """
+    if self._loaded_values is None:
+      return set(field.attname for field in self._meta.concrete_fields)
+    return set(attname for attname, value in self._loaded_values.iteritems()
+               if _comparable(getattr(self, attname)) != value)
+
+  def get_saved_value(self, attname):
+    """ Value of a field as of load or the last save. Only queries if the
+      value wasn't loaded """
+    if self._loaded_values is not None and attname in self._loaded_values:
+      return self._loaded_values[attname]
+    return (type(self)._default_manager.filter(pk=self.pk)
+                                       .values_list(attname, flat=True).first())
+
+  def save_changed(self):
+    """ Save only changed fields. Returns whether anything was saved """
+    changed = self.changed_fields
+    if self._state.adding or self._loaded_values is None:
+      self.save()
+    elif changed:
+      self.save(update_fields=changed)
+    else:
+      return False
+    return True
+
+  def save(self, *args, **kwargs):
+    super(DirtyFieldsMixin, self).save(*args, **kwargs)
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None:
+      self._loaded_values = self._get_values(self._get_loaded_attnames())
+    elif self._loaded_values is not None:
+      attnames = [self._meta.get_field(name).attname for name in update_fields]
+      self._loaded_values.update(self._get_values(attnames))
+
+  def refresh_from_db(self, using=None, fields=None, **kwargs):
+    super(DirtyFieldsMixin, self).refresh_from_db(using=using, fields=fields, **kwargs)
+    if self._loaded_values is not None:
+      attnames = fields or self._get_loaded_attnames()
+      self._loaded_values.update(self._get_values(
+          [self._meta.get_field(name).attname for name in attnames]))
+
+
+# Chunked cron runs - see sjfnw.cron
+
+class CronRun(models.Model):
+  """ One execution of a chunked cron job. Totals are filled in by finish_if_done """
+  job = models.CharField(max_length=100)
+  started = models.DateTimeField(default=timezone.now)
+  finished = models.DateTimeField(blank=True, null=True)
+  chunk_count = models.PositiveIntegerField(default=0)
+  rows = models.PositiveIntegerField(default=0)
+  sent = models.PositiveIntegerField(default=0)
+
+  class Meta:
+    ordering = ('-started',)
+
+  def __unicode__(self):
+    return u'{} {:%Y-%m-%d %H:%M}'.format(self.job, timezone.localtime(self.started))
+
+  def finish_if_done(self):
+    """ Record totals and mark finished once every chunk is complete
+
+      Safe to call from each chunk; only the first call after the last chunk
+      completes will mark the run finished.
+    """
+    if self.chunks.filter(completed__isnull=True).exists():
+      return False
+    totals = self.chunks.aggregate(rows=Sum('rows'), sent=Sum('sent'))
+    updated = (CronRun.objects.filter(pk=self.pk, finished__isnull=True)
+                              .update(finished=timezone.now(),
+                                      rows=totals['rows'] or 0,
+                                      sent=totals['sent'] or 0))
+    if updated:
+      logger.info('%s finished: %d chunks, %d rows, %d sent', self.job,
+                  self.chunk_count, totals['rows'] or 0, totals['sent'] or 0)
+    return bool(updated)
+
+
+class CronChunk(models.Model):
+  """ Range of primary keys processed by a single task
+
+    cursor is the pk of the last row fully processed, so a retried chunk
+    picks up after it instead of repeating work (e.g. re-sending emails)
+  """
+  run = models.ForeignKey(CronRun, related_name='chunks')
+  first_pk = models.PositiveIntegerField()
+  last_pk = models.PositiveIntegerField()
+  cursor = models.PositiveIntegerField(blank=True, null=True)
+  rows = models.PositiveIntegerField(default=0)
+  sent = models.PositiveIntegerField(default=0)
+  attempts = models.PositiveIntegerField(default=0)
+  completed = models.DateTimeField(blank=True, null=True)
+
+  class Meta:
+    ordering = ('run', 'first_pk')
+
+  def __unicode__(self):
+    return u'{} [{}-{}]'.format(self.run, self.first_pk, self.last_pk)
+
+  def checkpoint(self, cursor, rows=0, sent=0):
+    """ Record progress through the chunk. rows & sent are added to the totals """
+    CronChunk.objects.filter(pk=self.pk).update(
+        cursor=cursor, rows=F('rows') + rows, sent=F('sent') + sent)
+    self.cursor = cursor
+    self.rows += rows
+    self.sent += sent
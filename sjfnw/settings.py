@@ -34,6 +34,11 @@ if os.getenv('SERVER_SOFTWARE', '').startswith('Google App Engine'):
       'PASSWORD': os.getenv('CLOUDSQL_PASSWORD')
     }
   }
+  CACHES = {
+    'default': {
+      'BACKEND': 'sjfnw.cache.MemcacheBackend'
+    }
+  }
 
 # test
 elif 'test' in sys.argv:
@@ -106,6 +111,11 @@ FILE_UPLOAD_HANDLERS = ('sjfnw.grants.storage.BlobstoreFileUploadHandler',)
 
 TEST_RUNNER = 'sjfnw.tests.base.ColorTestSuiteRunner'
 
+# Background grants reports with the same options are reused for this long
+REPORT_JOB_REUSE_MINUTES = 60
+# Queued or running jobs older than this are assumed to have died with their task
+REPORT_JOB_DEADLINE_MINUTES = 15
+
 # Determines whether site is in maintenance mode. See urls.py
 MAINTENANCE = False
 # Date and/or time when site is expected to be out of maintenance mode.
@@ -0,0 +1,103 @@
+'use strict';
+
+/**----------------------------- autocomplete ------------------------------**/
+/**
+ * Search-as-you-type inputs rendered by sjfnw.autocomplete.AutocompleteWidget.
+ * Listens on the document so inputs added later (e.g. inline rows) work too.
+ */
+var autocomplete = {};
+
+autocomplete.delay = 250; // ms to wait after typing before searching
+autocomplete.minLength = 2;
+
+/**
+ * Fetch a page of results and show them in the widget's result list
+ *
+ * @param {Element} widget - span.autocomplete
+ * @param {string} term
+ * @param {number} [before] - pk to page from, to load more results
+ */
+autocomplete.search = function (widget, term, before) {
+  var url = widget.getAttribute('data-url');
+  url += (url.indexOf('?') === -1 ? '?' : '&') + 'q=' + encodeURIComponent(term);
+  if (before) {
+    url += '&before=' + before;
+  }
+
+  var request = new XMLHttpRequest();
+  request.open('GET', url);
+  request.onload = function () {
+    if (request.status !== 200) {
+      return;
+    }
+    var data = JSON.parse(request.responseText);
+    var list = widget.querySelector('.autocomplete-results');
+    if (!before) {
+      list.innerHTML = '';
+    }
+    var more = list.querySelector('.autocomplete-more');
+    if (more) {
+      list.removeChild(more);
+    }
+    data.results.forEach(function (result) {
+      var item = document.createElement('li');
+      item.setAttribute('data-id', result.id);
+      item.textContent = result.text;
+      list.appendChild(item);
+    });
+    if (data.more) {
+      more = document.createElement('li');
+      more.className = 'autocomplete-more';
+      more.setAttribute('data-before', data.results[data.results.length - 1].id);
+      more.textContent = 'More...';
+      list.appendChild(more);
+    } else if (!data.results.length && !before) {
+      list.innerHTML = '<li class="autocomplete-none">No matches</li>';
+    }
+  };
+  request.send();
+};
+
+autocomplete.select = function (widget, item) {
+  var hidden = widget.querySelector('input[type=hidden]');
+  hidden.value = item.getAttribute('data-id');
+  widget.querySelector('.autocomplete-text').value = item.textContent;
+  widget.querySelector('.autocomplete-results').innerHTML = '';
+
+  var event = document.createEvent('HTMLEvents');
+  event.initEvent('change', true, false);
+  hidden.dispatchEvent(event);
+};
+
+document.addEventListener('input', function (e) {
+  var input = e.target;
+  if (!input.classList || !input.classList.contains('autocomplete-text')) {
+    return;
+  }
+  var widget = input.parentNode;
+  clearTimeout(input._autocompleteTimer);
+  if (!input.value) {
+    widget.querySelector('input[type=hidden]').value = '';
+  }
+  if (input.value.length < autocomplete.minLength) {
+    widget.querySelector('.autocomplete-results').innerHTML = '';
+    return;
+  }
+  input._autocompleteTimer = setTimeout(function () {
+    autocomplete.search(widget, input.value);
+  }, autocomplete.delay);
+});
+
+document.addEventListener('click', function (e) {
+  var item = e.target;
+  if (item.tagName !== 'LI' || !item.parentNode.classList.contains('autocomplete-results')) {
+    return;
+  }
+  var widget = item.parentNode.parentNode;
+  if (item.hasAttribute('data-before')) {
+    autocomplete.search(widget, widget.querySelector('.autocomplete-text').value,
+                        item.getAttribute('data-before'));
+  } else if (item.hasAttribute('data-id')) {
+    autocomplete.select(widget, item);
+  }
+});
@@ -3,8 +3,11 @@ from unittest import TextTestRunner, TestResult
 from unittest.signals import registerResult
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
 from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
 
 from sjfnw.fund.models import Member
 
@@ -34,6 +37,11 @@ class BaseTestCase(TestCase):
     'blank': 'blankacct@gmail.com'
   }
 
+  def _pre_setup(self):
+    super(BaseTestCase, self)._pre_setup()
+    # cache is not rolled back with the db, and ids get reused between tests
+    cache.clear()
+
   def login_strict(self, username, password):
     """ Attempt to login using the test client; mark test failed if login fails """
     success = self.client.login(username=username, password=password)
@@ -87,6 +95,19 @@ class BaseTestCase(TestCase):
     error_msg = 'Expected queryset count to be {}, but got {}'.format(expected, actual)
     self.assertEqual(actual, expected, error_msg)
 
+  def assert_constant_queries(self, add, run, few, more):
+    """ Asserts that run makes the same number of queries after add(few, 0)
+        as after add(more, few) adds more objects for it to process """
+    add(few, 0)
+    with CaptureQueriesContext(connection) as first:
+      run()
+    add(more, few)
+    with CaptureQueriesContext(connection) as second:
+      run()
+    self.assertEqual(len(first), len(second),
+        'Expected {} queries after adding {} more, but got {}'.format(
+            len(first), more, len(second)))
+
 # Code below overrides the default test runner to provide colored console output
 
 # many of the built-in method names are not "valid" python names
@@ -0,0 +1,98 @@
+import json
+
+from django.forms.models import modelform_factory
+
+from sjfnw import autocomplete
+from sjfnw.fund.models import Member, Membership
+from sjfnw.fund.tests import factories as fund_factories
+from sjfnw.tests.base import BaseTestCase
+
+
+class AutocompleteView(BaseTestCase):
+
+  def setUp(self):
+    self.login_as_admin()
+    self.members = [
+      Member.objects.create_with_user(email='auto{}@example.com'.format(i), password='pass',
+                                      first_name='Alex', last_name='Auto{}'.format(i))
+      for i in range(5)
+    ]
+    Member.objects.create_with_user(email='other@example.com', password='pass',
+                                    first_name='Sam', last_name='Other')
+
+  def search(self, term, before=None):
+    params = {'q': term}
+    if before:
+      params['before'] = before
+    response = self.client.get('/admin/autocomplete/members', params)
+    self.assertEqual(response.status_code, 200)
+    return json.loads(response.content)
+
+  def test_prefix_match(self):
+    data = self.search('al aut')
+
+    self.assertEqual([r['id'] for r in data['results']],
+                     [m.pk for m in reversed(self.members)])
+    self.assertEqual(data['results'][0]['text'], 'Alex Auto4')
+    self.assertFalse(data['more'])
+
+  def test_no_infix_match(self):
+    data = self.search('uto')
+
+    self.assertEqual(data['results'], [])
+
+  def test_pages(self):
+    limit = autocomplete.LIMIT
+    autocomplete.LIMIT = 3
+    try:
+      first = self.search('alex')
+      second = self.search('alex', before=first['results'][-1]['id'])
+    finally:
+      autocomplete.LIMIT = limit
+
+    self.assertTrue(first['more'])
+    self.assertFalse(second['more'])
+    self.assertEqual([r['id'] for r in first['results'] + second['results']],
+                     [m.pk for m in reversed(self.members)])
+
+  def test_unknown_search(self):
+    response = self.client.get('/admin/autocomplete/unknown', {'q': 'a'})
+    self.assertEqual(response.status_code, 404)
+
+  def test_requires_staff(self):
+    self.client.logout()
+    response = self.client.get('/admin/autocomplete/members', {'q': 'alex'})
+    self.assertEqual(response.status_code, 302)
+
+
+class AutocompleteWidget(BaseTestCase):
+
+  def test_render(self):
+    member = Member.objects.create_with_user(email='w@example.com', password='pass',
+                                             first_name='Widget', last_name='Member')
+    widget = autocomplete.AutocompleteWidget('members', params={'gp': 2})
+
+    html = widget.render('member', member.pk, attrs={'id': 'id_member'})
+
+    self.assertIn('data-url="/admin/autocomplete/members?gp=2"', html)
+    self.assertIn('name="member"', html)
+    self.assertIn('value="{}"'.format(member.pk), html)
+    self.assertIn('value="Widget Member"', html)
+    self.assertNotIn('<option', html)
+
+
+class AutocompleteModelForm(BaseTestCase):
+
+  def test_label_from_instance(self):
+    member = Member.objects.create_with_user(email='w@example.com', password='pass',
+                                             first_name='Inline', last_name='Member')
+    ship = Membership.objects.create(member=member, giving_project=fund_factories.GivingProject())
+    form_class = modelform_factory(Membership, form=autocomplete.AutocompleteModelForm,
+        fields=['member'], widgets={'member': autocomplete.AutocompleteWidget('members')})
+    ship = Membership.objects.select_related('member').get(pk=ship.pk)
+
+    form = form_class(instance=ship)
+    with self.assertNumQueries(0):
+      html = unicode(form['member'])
+
+    self.assertIn('value="Inline Member"', html)
@@ -0,0 +1,75 @@
+from django.contrib.auth.models import User
+
+from sjfnw import cron
+from sjfnw.models import CronChunk
+from sjfnw.tests.base import BaseTestCase
+
+
+class UserJob(cron.ChunkedJob):
+  """ Records the users it processes. Fails on fail_on the first time it's seen """
+  name = 'test_users'
+  chunk_size = 2
+  processed = []
+  fail_on = None
+
+  def get_queryset(self):
+    return User.objects.filter(username__startswith='cron')
+
+  def process_row(self, row):
+    if row.pk == UserJob.fail_on:
+      UserJob.fail_on = None
+      raise Exception('Failing on purpose')
+    UserJob.processed.append(row.pk)
+    return 1
+
+
+class ChunkedJob(BaseTestCase):
+
+  def setUp(self):
+    UserJob.processed = []
+    UserJob.fail_on = None
+    self.user_ids = [User.objects.create_user('cron{}@gmail.com'.format(i)).pk
+                     for i in range(5)]
+
+  def test_empty(self):
+    User.objects.filter(pk__in=self.user_ids).delete()
+
+    run = cron.start_job(UserJob, cron.LocalExecutor())
+
+    self.assertEqual(run.chunk_count, 0)
+    self.assertIsNotNone(run.finished)
+    self.assertEqual(UserJob.processed, [])
+
+  def test_totals(self):
+    run = cron.start_job(UserJob, cron.LocalExecutor())
+
+    self.assertEqual(run.chunk_count, 3)
+    self.assertIsNotNone(run.finished)
+    self.assertEqual(run.rows, 5)
+    self.assertEqual(run.sent, 5)
+    self.assertEqual(UserJob.processed, self.user_ids)
+    self.assert_count(run.chunks.filter(completed__isnull=True), 0)
+
+  def test_retry_resumes(self):
+    """ Failed chunk is retried from its cursor; completed chunks are skipped """
+    UserJob.fail_on = self.user_ids[3]
+
+    with self.assertRaises(Exception):
+      cron.start_job(UserJob, cron.LocalExecutor())
+
+    chunk = CronChunk.objects.get(first_pk=self.user_ids[2])
+    self.assertEqual(chunk.cursor, self.user_ids[2])
+    self.assertIsNone(chunk.completed)
+    self.assertIsNone(chunk.run.finished)
+
+    # retry every chunk, as the task queue might
+    for each in chunk.run.chunks.all():
+      cron.run_chunk(UserJob, each.pk)
+
+    # each user processed exactly once
+    self.assertEqual(sorted(UserJob.processed), self.user_ids)
+    chunk = CronChunk.objects.get(pk=chunk.pk)
+    self.assertEqual(chunk.attempts, 2)
+    self.assertEqual(chunk.rows, 2)
+    self.assertEqual(chunk.run.rows, 5)
+    self.assertIsNotNone(chunk.run.finished)
@@ -0,0 +1,48 @@
+from mock import Mock, patch
+
+from django.test import TestCase
+
+from google.appengine.api import mail as gaemail
+
+from sjfnw import mail
+
+
+def get_message(fails=False):
+  message = Mock(to='test@example.com')
+  if fails:
+    message.send.side_effect = gaemail.Error('Failing on purpose')
+  return message
+
+
+@patch('sjfnw.mail._defer_messages')
+class SendDeferred(TestCase):
+
+  def test_single_message(self, defer):
+    """ Tasks queued before batching pass one message instead of a list """
+    message = get_message()
+
+    mail._send_deferred(message)
+
+    message.send.assert_called_once_with()
+    self.assertFalse(defer.called)
+
+  def test_retry_failed(self, defer):
+    sent, failed = get_message(), get_message(fails=True)
+
+    mail._send_deferred([sent, failed, get_message()])
+
+    sent.send.assert_called_once_with()
+    defer.assert_called_once_with([failed], False, attempt=2)
+
+  def test_give_up(self, defer):
+    failed = get_message(fails=True)
+
+    mail._send_deferred([failed], attempt=mail.MAX_BATCH_ATTEMPTS)
+
+    failed.send.assert_called_once_with()
+    self.assertFalse(defer.called)
+
+  def test_fail_silently(self, defer):
+    mail._send_deferred([get_message(fails=True)], fail_silently=True)
+
+    self.assertFalse(defer.called)
@@ -1,3 +1,4 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
 
 from sjfnw import utils
@@ -14,3 +15,35 @@ class CreateLink(TestCase):
   def test_new_window(self):
     link = utils.create_link(self.url, self.text, new_tab=True)
     self.assertEqual(link, '<a href="{}" target="_blank">{}</a>'.format(self.url, self.text))
+
+class Defer(TestCase):
+
+  def test_local_runs_immediately(self):
+    calls = []
+    def record(*args, **kwargs):
+      calls.append((args, kwargs))
+
+    scheduled = utils.defer(record, 1, key='value', _name='task-1', _countdown=60)
+
+    self.assertTrue(scheduled)
+    self.assertEqual(calls, [((1,), {'key': 'value'})])
+
+
+class IterateInBatches(TestCase):
+
+  def setUp(self):
+    for name in ('a', 'b', 'c', 'd'):
+      User.objects.create(username=name)
+    self.users = User.objects.order_by('username')
+
+  def test_deleted_while_iterating(self):
+    users = utils.iterate_in_batches(self.users, size=2)
+    first = next(users)
+    User.objects.filter(username='d').delete()
+
+    self.assertEqual([first.username] + [user.username for user in users], ['a', 'b', 'c'])
+
+  def test_slice(self):
+    users = utils.iterate_in_batches(self.users, size=2, start=1, stop=3)
+
+    self.assertEqual([user.username for user in users], ['b', 'c'])
@@ -36,6 +36,7 @@ else:
     (r'^get-upload-url/?', 'sjfnw.grants.views.get_upload_url'),
 
     # admin
+    (r'^admin/autocomplete/(?P<name>[\w-]+)$', 'sjfnw.views.autocomplete'),
     (r'^admin/', include(admin.site.urls)),
     (r'^admin$', RedirectView.as_view(url='/admin/')),
     (r'^admin/grants/grantapplication/(?P<app_id>\d+)/revert',
@@ -51,6 +52,10 @@ else:
 
     # reporting
     (r'^admin/grants/search/?', 'sjfnw.grants.views.grants_report'),
+    (r'^admin/grants/report-jobs/(?P<job_id>\d+)/download',
+      'sjfnw.grants.views.report_job_download'),
+    (r'^admin/grants/report-jobs/?$', 'sjfnw.grants.views.report_jobs'),
+    (r'^admin/grants/text-search/?$', 'sjfnw.grants.views.text_search'),
 
     # cron emails TODO use /cron instead of /mail?
     (r'^mail/overdue-step', 'sjfnw.fund.cron.email_overdue'),
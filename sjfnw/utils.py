@@ -1,10 +1,18 @@
-from django.core.mail import EmailMultiAlternatives
+import logging
+import os
+
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.core.urlresolvers import reverse
+from django.http import StreamingHttpResponse
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 
+import unicodecsv
+
 from sjfnw import constants as c
 
+logger = logging.getLogger('sjfnw')
+
 def create_link(url, text, new_tab=False):
   new_tab = ' target="_blank"' if new_tab else ''
   return '<a href="{}"{}>{}</a>'.format(url, new_tab, text)
@@ -13,9 +21,70 @@ def admin_change_link(namespace, obj, new_tab=False):
   url = reverse('admin:{}_change'.format(namespace), args=(obj.pk,))
   return create_link(url, unicode(obj), new_tab=new_tab)
 
-def send_email(subject, to, sender, template, context={}):
+def build_email(subject, to, sender, template, context={}):
+  """ Render template into an html + plain text email, bcc'ing support """
   html_content = render_to_string(template, context)
   text_content = strip_tags(html_content)
   msg = EmailMultiAlternatives(subject, text_content, sender, to, [c.SUPPORT_EMAIL])
   msg.attach_alternative(html_content, 'text/html')
-  msg.send()
+  return msg
+
+def send_email(subject, to, sender, template, context={}):
+  build_email(subject, to, sender, template, context).send()
+
+def send_emails(messages):
+  """ Send a batch of emails (see build_email) using a single connection """
+  if messages:
+    get_connection().send_messages(messages)
+
+class _Echo(object):
+  """ File-like object that returns what is written, for use with csv writers """
+  def write(self, value):
+    return value
+
+def csv_response(filename, header, rows):
+  """ Stream rows as a csv attachment, rather than building it in memory """
+  writer = unicodecsv.writer(_Echo())
+
+  def lines():
+    yield writer.writerow(header)
+    for row in rows:
+      yield writer.writerow(row)
+
+  response = StreamingHttpResponse(lines(), content_type='text/csv')
+  response['Content-Disposition'] = 'attachment; filename=%s.csv' % filename
+  return response
+
+def iterate_in_batches(queryset, size=500, start=0, stop=None):
+  """ Iterate over queryset, keeping its ordering, loading size objects at a time
+
+    Unlike queryset.iterator(), prefetch_related still applies within each batch.
+    start and stop slice the queryset in the database. Objects deleted after
+    the pks were loaded are skipped
+  """
+  pks = list(queryset.values_list('pk', flat=True)[start:stop])
+  for i in range(0, len(pks), size):
+    batch = pks[i:i + size]
+    objs = {obj.pk: obj for obj in queryset.filter(pk__in=batch).order_by()}
+    for pk in batch:
+      obj = objs.get(pk)
+      if obj is not None:
+        yield obj
+
+def defer(func, *args, **kwargs):
+  """ Run func in a task queue task when deployed. Locally, run it immediately
+
+    Task options (_name, _countdown, _queue, etc) are passed on to the task
+    queue and ignored locally. Returns False if a task with the given _name
+    has already been scheduled, True otherwise """
+  if os.getenv('SERVER_SOFTWARE', '').startswith('Google App Engine'):
+    from google.appengine.api import taskqueue
+    from google.appengine.ext import deferred
+    try:
+      deferred.defer(func, *args, **kwargs)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+      logger.debug('Task %s already scheduled', kwargs.get('_name'))
+      return False
+  else:
+    func(*args, **{k: v for k, v in kwargs.items() if not k.startswith('_')})
+  return True
@@ -2,9 +2,10 @@ import logging
 
 from django import http
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
 
-from sjfnw import constants as c
+from sjfnw import autocomplete as ac, constants as c
 
 logger = logging.getLogger('sjfnw')
 
@@ -57,3 +58,25 @@ def log_javascript(request):
       log = log + '\n' + key + ': ' + str(request.POST[key])
     logger.warning(log)
   return http.HttpResponse('success')
+
+@staff_member_required
+def autocomplete(request, name):
+  """ Matches for an autocomplete widget. See sjfnw.autocomplete
+
+    GET params:
+      q: search term
+      before: (optional) pk of the last result already shown, to get the next page
+  """
+  search = ac.get_search(name)
+  if not search:
+    raise http.Http404('Search not found')
+  try:
+    before = int(request.GET['before']) if request.GET.get('before') else None
+  except ValueError:
+    return http.HttpResponseBadRequest('Invalid before param')
+
+  results, more = search.search(request, request.GET.get('q', ''), before=before)
+  return http.JsonResponse({
+    'results': [{'id': pk, 'text': label} for pk, label in results],
+    'more': more
+  })